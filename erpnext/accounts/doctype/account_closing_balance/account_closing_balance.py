@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, cstr, getdate
+from collections import OrderedDict
+from six import iteritems
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions
+
+amount_fields = ("debit", "credit", "debit_in_account_currency", "credit_in_account_currency")
+
+class AccountClosingBalance(Document):
+	pass
+
+def get_key_fields():
+	'''Fields of the GL Entry a closing balance is kept for, other than the
+	Period Closing Voucher'''
+	return ["account", "cost_center", "project", "finance_book"] + get_accounting_dimensions()
+
+def get_closings(company, from_date=None):
+	'''Submitted Period Closing Vouchers of the company in the order of closing,
+	closed on or after `from_date` if set'''
+	return frappe.db.sql("""
+		select
+			pcv.name, pcv.company, pcv.posting_date, pcv.fiscal_year, fy.year_start_date
+		from `tabPeriod Closing Voucher` pcv, `tabFiscal Year` fy
+		where pcv.fiscal_year = fy.name and pcv.company = %(company)s and pcv.docstatus = 1
+			{0}
+		order by pcv.posting_date, pcv.creation""".format("and pcv.posting_date >= %(from_date)s" if from_date else ""),
+		{"company": company, "from_date": from_date}, as_dict=1)
+
+def get_last_closing_date(company):
+	'''Posting date of the last Period Closing Voucher of the company, kept
+	for the request'''
+	if frappe.flags.last_closing_dates is None:
+		frappe.flags.last_closing_dates = {}
+
+	if company not in frappe.flags.last_closing_dates:
+		frappe.flags.last_closing_dates[company] = frappe.db.sql("""select max(posting_date)
+			from `tabPeriod Closing Voucher` where company = %s and docstatus = 1""", company)[0][0]
+
+	return frappe.flags.last_closing_dates[company]
+
+def get_latest_closing(company, date=None):
+	'''The last Period Closing Voucher of the company closed on or before the date.
+	Its closing balances can be queried in place of all the GL Entries up to
+	its posting date'''
+	closings = [d for d in get_closings(company) if not date or getdate(d.posting_date) <= getdate(date)]
+	return closings[-1] if closings else None
+
+def make_closing_balances(period_closing_voucher):
+	'''Save the balances of all the accounts on the posting date of the Period
+	Closing Voucher, its own GL Entries included, per account and dimensions.
+
+	Balance Sheet balances are from the first GL Entry and Profit and Loss
+	balances from the start of the fiscal year, as in `get_balance_on`. They
+	are the balances of the previous closing of the company plus the GL Entries
+	posted after it'''
+	closings = get_closings(period_closing_voucher.company)
+	names = [d.name for d in closings]
+	closing = closings[names.index(period_closing_voucher.name)]
+	previous_closing = closings[names.index(closing.name) - 1] if names.index(closing.name) else None
+
+	delete_closing_balances(closing.name)
+
+	key_fields = get_key_fields()
+	entry_fields = ", ".join(["t.`{0}`".format(fieldname) for fieldname in key_fields + list(amount_fields)]
+		+ ["acc.account_currency"])
+
+	queries = ["""
+		select {entry_fields}
+		from `tabGL Entry` t, `tabAccount` acc
+		where t.account = acc.name and t.company = %(company)s
+			and t.posting_date <= %(posting_date)s {previous_closing_condition}
+			and (acc.report_type = 'Balance Sheet' or t.posting_date >= %(year_start_date)s)
+	""".format(entry_fields=entry_fields, previous_closing_condition="and t.posting_date > %(previous_closing_date)s"
+		if previous_closing else "")]
+
+	if previous_closing:
+		# profit and loss balances are carried over only within a fiscal year
+		queries.append("""
+			select {entry_fields}
+			from `tabAccount Closing Balance` t, `tabAccount` acc
+			where t.account = acc.name and t.period_closing_voucher = %(previous_closing)s {report_type_condition}
+		""".format(entry_fields=entry_fields, report_type_condition="and acc.report_type = 'Balance Sheet'"
+			if previous_closing.fiscal_year != closing.fiscal_year else ""))
+
+	balances = frappe.db.sql("""
+		select
+			{fields}, max(t.account_currency) as account_currency, {amounts}
+		from ({queries}) t
+		group by {group_by}
+	""".format(
+		fields=", ".join(["ifnull(t.`{0}`, '') as `{0}`".format(fieldname) for fieldname in key_fields]),
+		group_by=", ".join(["ifnull(t.`{0}`, '')".format(fieldname) for fieldname in key_fields]),
+		amounts=", ".join(["sum(t.`{0}`) as `{0}`".format(fieldname) for fieldname in amount_fields]),
+		queries=" union all ".join(queries)), {
+			"company": closing.company,
+			"posting_date": closing.posting_date,
+			"year_start_date": closing.year_start_date,
+			"previous_closing": previous_closing and previous_closing.name,
+			"previous_closing_date": previous_closing and previous_closing.posting_date
+		}, as_dict=1)
+
+	for balance in balances:
+		make_closing_balance(frappe._dict(balance, period_closing_voucher=closing.name,
+			company=closing.company, posting_date=closing.posting_date, fiscal_year=closing.fiscal_year))
+
+def make_closing_balance(balance):
+	frappe.get_doc(dict(balance, doctype="Account Closing Balance", is_opening="No")).db_insert()
+
+def delete_closing_balances(period_closing_voucher):
+	frappe.db.sql("""delete from `tabAccount Closing Balance` where period_closing_voucher = %s""",
+		period_closing_voucher)
+	frappe.flags.last_closing_dates = None
+
+def update_closing_balances(gl_entries, cancel=False):
+	'''Add the GL Entries posted on or before the posting date of a Period
+	Closing Voucher to its closing balances, or remove them if `cancel`, so
+	that back dated entries keep the closing balances in sync'''
+	gl_entries_by_company = OrderedDict()
+	for gle in gl_entries:
+		gl_entries_by_company.setdefault(gle.get("company"), []).append(gle)
+
+	key_fields = get_key_fields()
+	for company, entries in iteritems(gl_entries_by_company):
+		# most entries are posted after the last closing of the company
+		last_closing_date = get_last_closing_date(company)
+		entries = [gle for gle in entries
+			if last_closing_date and getdate(gle.get("posting_date")) <= getdate(last_closing_date)]
+		if not entries:
+			continue
+
+		closings = get_closings(company, min(getdate(gle.get("posting_date")) for gle in entries))
+		if not closings:
+			continue
+
+		report_types = dict(frappe.db.sql("""select name, report_type from `tabAccount`
+			where name in %s""", [tuple(set(gle.get("account") for gle in entries))]))
+
+		balances = OrderedDict()
+		for gle in entries:
+			posting_date = getdate(gle.get("posting_date"))
+			for closing in closings:
+				if posting_date > getdate(closing.posting_date) or (report_types.get(gle.get("account")) \
+					== "Profit and Loss" and posting_date < getdate(closing.year_start_date)):
+					continue
+
+				key = OrderedDict((fieldname, cstr(gle.get(fieldname))) for fieldname in key_fields)
+				balance = balances.setdefault((closing.name,) + tuple(key.values()), frappe._dict(key,
+					period_closing_voucher=closing.name, company=company, posting_date=closing.posting_date,
+					fiscal_year=closing.fiscal_year, account_currency=gle.get("account_currency")))
+
+				for fieldname in amount_fields:
+					amount = flt(gle.get(fieldname))
+					balance[fieldname] = balance.get(fieldname, 0.0) + (-amount if cancel else amount)
+
+		for balance in balances.values():
+			update_closing_balance(balance, key_fields)
+
+def update_closing_balance(balance, key_fields):
+	conditions = " and ".join(["ifnull(`{0}`, '') = %({0})s".format(fieldname) for fieldname in key_fields])
+
+	name = frappe.db.sql("""select name from `tabAccount Closing Balance`
+		where period_closing_voucher = %(period_closing_voucher)s and {0}
+		limit 1 for update""".format(conditions), balance)
+
+	if name:
+		frappe.db.sql("""
+			update `tabAccount Closing Balance`
+			set {0}
+			where name = %(name)s""".format(", ".join(["`{0}` = `{0}` + %({0})s".format(fieldname)
+				for fieldname in amount_fields])), dict(balance, name=name[0][0]))
+	else:
+		make_closing_balance(balance)
+
+def remove_vouchers_from_closing_balances(vouchers):
+	'''Remove the GL Entries of the vouchers from the closing balances, called
+	before the GL Entries are deleted. Only the entries posted on or before a
+	closing are read'''
+	# erpnext.accounts.utils imports this module
+	from erpnext.accounts.utils import get_vouchers_by_type
+
+	vouchers_by_type = get_vouchers_by_type(vouchers)
+
+	fields = ", ".join(["gle.`{0}`".format(fieldname)
+		for fieldname in get_key_fields() + ["company", "posting_date", "account_currency"] + list(amount_fields)])
+
+	for voucher_type, voucher_nos in iteritems(vouchers_by_type):
+		gl_entries = frappe.db.sql("""
+			select {0} from `tabGL Entry` gle
+			where gle.voucher_type = %s and gle.voucher_no in ({1})
+				and exists(select pcv.name from `tabPeriod Closing Voucher` pcv
+					where pcv.company = gle.company and pcv.docstatus = 1
+					and pcv.posting_date >= gle.posting_date)
+		""".format(fields, ", ".join(["%s"] * len(voucher_nos))), tuple([voucher_type] + voucher_nos), as_dict=1)
+
+		if gl_entries:
+			update_closing_balances(gl_entries, cancel=True)
+
+def rebuild_closing_balances(company=None):
+	'''Rebuild the closing balances of the Period Closing Vouchers in the order
+	of closing, of all the companies if `company` is not set'''
+	companies = [company] if company else frappe.db.sql_list("""select distinct company
+		from `tabPeriod Closing Voucher` where docstatus = 1""")
+
+	for company in companies:
+		for closing in get_closings(company):
+			make_closing_balances(closing)
+
+def on_doctype_update():
+	frappe.db.add_index("Account Closing Balance", ["period_closing_voucher", "account"])
+	frappe.db.add_index("Account Closing Balance", ["company", "posting_date"])
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import today, add_days
+from erpnext.accounts.utils import get_fiscal_year, get_balance_on
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+
+class TestAccountClosingBalance(unittest.TestCase):
+	def test_closing_balances_follow_back_dated_entries(self):
+		pcv = make_period_closing_voucher()
+		self.assertEqual(get_closing_balance("_Test Bank - _TC", pcv.name), get_gl_balance("_Test Bank - _TC"))
+
+		jv = make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100,
+			posting_date=add_days(today(), -1), submit=True)
+		self.assertEqual(get_closing_balance("_Test Bank - _TC", pcv.name), get_gl_balance("_Test Bank - _TC"))
+		self.assertEqual(get_balance_on("_Test Bank - _TC", today()), get_gl_balance("_Test Bank - _TC"))
+
+		jv.cancel()
+		self.assertEqual(get_closing_balance("_Test Bank - _TC", pcv.name), get_gl_balance("_Test Bank - _TC"))
+
+		pcv.cancel()
+		self.assertFalse(frappe.db.exists("Account Closing Balance", {"period_closing_voucher": pcv.name}))
+
+def make_period_closing_voucher():
+	pcv = frappe.get_doc({
+		"doctype": "Period Closing Voucher",
+		"closing_account_head": "_Test Account Reserves and Surplus - _TC",
+		"company": "_Test Company",
+		"fiscal_year": get_fiscal_year(today(), company="_Test Company")[0],
+		"posting_date": today(),
+		"remarks": "test"
+	})
+	pcv.insert()
+	pcv.submit()
+
+	return pcv
+
+def get_closing_balance(account, period_closing_voucher):
+	return frappe.db.sql("""select sum(debit) - sum(credit) from `tabAccount Closing Balance`
+		where account=%s and period_closing_voucher=%s""", (account, period_closing_voucher))[0][0] or 0
+
+def get_gl_balance(account):
+	return frappe.db.sql("""select sum(debit) - sum(credit) from `tabGL Entry`
+		where account=%s and posting_date <= %s""", (account, today()))[0][0] or 0
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, cstr, getdate, get_first_day, get_last_day, now
+from collections import OrderedDict
+from six import iteritems
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions
+from erpnext.accounts.utils import get_vouchers_by_type
+
+amount_fields = ("debit", "credit", "debit_in_account_currency", "credit_in_account_currency")
+
+class AccountPeriodBalance(Document):
+	pass
+
+def get_key_fields():
+	'''Fields of the GL Entry a balance is kept for, other than the month'''
+	return ["company", "account", "fiscal_year", "is_opening", "voucher_type",
+		"cost_center", "project", "finance_book"] + get_accounting_dimensions()
+
+def get_balance_key(gle, key_fields):
+	key = OrderedDict((fieldname, cstr(gle.get(fieldname))) for fieldname in key_fields)
+
+	# balances are kept per month, the columns are named as in GL Entry
+	# so that the reports can query either of them
+	key["posting_date"] = get_first_day(gle.posting_date)
+	key["is_opening"] = key["is_opening"] or "No"
+	if key["voucher_type"] != "Period Closing Voucher":
+		key["voucher_type"] = ""
+
+	return key
+
+def update_account_period_balances(gl_entries, cancel=False):
+	'''Add the debit and credit of the GL Entries to the balances of their
+	account and month, or remove them if `cancel`'''
+	key_fields = get_key_fields()
+
+	balances = OrderedDict()
+	for gle in gl_entries:
+		key = get_balance_key(gle, key_fields)
+		balance = balances.setdefault(tuple(key.values()), frappe._dict(key,
+			account_currency=gle.get("account_currency")))
+
+		for fieldname in amount_fields:
+			amount = flt(gle.get(fieldname))
+			balance[fieldname] = balance.get(fieldname, 0.0) + (-amount if cancel else amount)
+
+	for balance in balances.values():
+		update_account_period_balance(balance, key_fields)
+
+def update_account_period_balance(balance, key_fields):
+	conditions = " and ".join(["ifnull(`{0}`, '') = %({0})s".format(fieldname) for fieldname in key_fields])
+
+	name = frappe.db.sql("""select name from `tabAccount Period Balance`
+		where posting_date = %(posting_date)s and {0}
+		limit 1 for update""".format(conditions), balance)
+
+	if name:
+		# modified marks the last posting of the company, see
+		# `consolidated_financial_statement.get_last_modification`
+		frappe.db.sql("""
+			update `tabAccount Period Balance`
+			set {0}, modified = %(modified)s
+			where name = %(name)s""".format(", ".join(["`{0}` = `{0}` + %({0})s".format(fieldname)
+				for fieldname in amount_fields])), dict(balance, name=name[0][0], modified=now()))
+	else:
+		make_account_period_balance(balance)
+
+def make_account_period_balance(balance):
+	frappe.get_doc(dict(balance, doctype="Account Period Balance")).db_insert()
+
+def remove_vouchers_from_account_period_balances(vouchers):
+	'''Remove the GL Entries of the vouchers from the balances, called
+	before the GL Entries are deleted'''
+	vouchers_by_type = get_vouchers_by_type(vouchers)
+
+	fields = ", ".join(["`{0}`".format(fieldname)
+		for fieldname in get_key_fields() + ["posting_date", "account_currency"] + list(amount_fields)])
+
+	for voucher_type, voucher_nos in iteritems(vouchers_by_type):
+		gl_entries = frappe.db.sql("""
+			select {0} from `tabGL Entry`
+			where voucher_type = %s and voucher_no in ({1})""".format(fields, ", ".join(["%s"] * len(voucher_nos))),
+			tuple([voucher_type] + voucher_nos), as_dict=1)
+
+		update_account_period_balances(gl_entries, cancel=True)
+
+def rebuild_account_period_balances(company=None):
+	'''Rebuild the balances from the GL Entries, of all the companies if
+	`company` is not set'''
+	key_fields = get_key_fields()
+	company_condition = "where company = %(company)s" if company else ""
+
+	frappe.db.sql("delete from `tabAccount Period Balance` {0}".format(company_condition),
+		{"company": company})
+
+	fields = ["`{0}`".format(fieldname) for fieldname in key_fields]
+	fields[key_fields.index("voucher_type")] = """if(voucher_type = 'Period Closing Voucher',
+		voucher_type, '')"""
+
+	balances = frappe.db.sql("""
+		select
+			{fields},
+			year(posting_date) as year, month(posting_date) as month,
+			max(account_currency) as account_currency, {amounts}
+		from `tabGL Entry`
+		{company_condition}
+		group by {group_by}, year(posting_date), month(posting_date)
+	""".format(
+		fields=", ".join(["{0} as `{1}`".format(field, fieldname) for field, fieldname in zip(fields, key_fields)]),
+		group_by=", ".join(fields),
+		amounts=", ".join(["sum(`{0}`) as `{0}`".format(fieldname) for fieldname in amount_fields]),
+		company_condition=company_condition
+	), {"company": company}, as_dict=1)
+
+	merged_balances = OrderedDict()
+	for d in balances:
+		d.posting_date = getdate("{0}-{1:02d}-01".format(d.year, d.month))
+		key = get_balance_key(d, key_fields)
+
+		# keys differing only in null and empty values are merged
+		balance = merged_balances.setdefault(tuple(key.values()), frappe._dict(key,
+			account_currency=d.account_currency))
+		for fieldname in amount_fields:
+			balance[fieldname] = balance.get(fieldname, 0.0) + flt(d.get(fieldname))
+
+	for balance in merged_balances.values():
+		make_account_period_balance(balance)
+
+def get_gl_entry_table(from_dates, to_dates, filters=None):
+	'''Returns "Account Period Balance" if the balances can be queried in place
+	of the GL Entries between the given dates, else "GL Entry".
+
+	Balances are kept per month, so all the from dates must be the first
+	and all the to dates the last days of months. GL Entries converted to
+	a presentation currency need their own posting dates'''
+	if filters and filters.get("presentation_currency"):
+		return "GL Entry"
+
+	for date in from_dates:
+		if date and getdate(date) != get_first_day(date):
+			return "GL Entry"
+
+	for date in to_dates:
+		if date and getdate(date) != get_last_day(date):
+			return "GL Entry"
+
+	return "Account Period Balance"
+
+def on_doctype_update():
+	frappe.db.add_index("Account Period Balance", ["company", "account", "posting_date"])
+	frappe.db.add_index("Account Period Balance", ["company", "modified"])
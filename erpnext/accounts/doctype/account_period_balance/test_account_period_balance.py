@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate, add_months, get_first_day, get_last_day
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.report.financial_statements import set_gl_entries_by_account
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import (get_gl_entry_table,
+	rebuild_account_period_balances)
+
+class TestAccountPeriodBalance(unittest.TestCase):
+	def test_balance_is_updated_on_submit_and_cancel(self):
+		posting_date = add_months(nowdate(), -1)
+		balance_before = get_period_balance("_Test Bank - _TC", posting_date)
+
+		jv = make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100,
+			posting_date=posting_date, submit=True)
+		self.assertEqual(get_period_balance("_Test Bank - _TC", posting_date), balance_before + 100)
+
+		jv.cancel()
+		self.assertEqual(get_period_balance("_Test Bank - _TC", posting_date), balance_before)
+
+	def test_balances_match_gl_entries(self):
+		make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100,
+			posting_date=add_months(nowdate(), -2), submit=True)
+		rebuild_account_period_balances("_Test Company")
+
+		from_date, to_date = get_first_day(add_months(nowdate(), -3)), get_last_day(nowdate())
+		self.assertEqual(get_gl_entry_table([from_date], [to_date]), "Account Period Balance")
+
+		min_lft, max_rgt = frappe.db.sql("""select min(lft), max(rgt) from `tabAccount`
+			where company='_Test Company'""")[0]
+
+		gl_entries_by_account = {}
+		set_gl_entries_by_account("_Test Company", from_date, to_date, min_lft, max_rgt,
+			frappe._dict(), gl_entries_by_account)
+
+		for account, entries in gl_entries_by_account.items():
+			self.assertAlmostEqual(sum(d.debit - d.credit for d in entries), frappe.db.sql("""
+				select sum(debit) - sum(credit) from `tabGL Entry`
+				where account=%s and posting_date between %s and %s""", (account, from_date, to_date))[0][0], places=2)
+
+	def test_gl_entries_are_used_for_other_dates(self):
+		self.assertEqual(get_gl_entry_table([add_months(get_first_day(nowdate()), -1)], [get_last_day(nowdate())]),
+			"Account Period Balance")
+		self.assertEqual(get_gl_entry_table([None], [get_last_day(nowdate())]), "Account Period Balance")
+		self.assertEqual(get_gl_entry_table(["2020-01-02"], ["2020-01-31"]), "GL Entry")
+		self.assertEqual(get_gl_entry_table(["2020-01-01"], ["2020-01-30"]), "GL Entry")
+		self.assertEqual(get_gl_entry_table(["2020-01-01"], ["2020-01-31"], {"presentation_currency": "USD"}),
+			"GL Entry")
+
+def get_period_balance(account, posting_date):
+	return frappe.db.sql("""select sum(debit) - sum(credit) from `tabAccount Period Balance`
+		where account=%s and posting_date=%s""", (account, get_first_day(posting_date)))[0][0] or 0
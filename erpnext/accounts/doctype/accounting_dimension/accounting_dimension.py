@@ -89,6 +89,32 @@ def make_dimension_in_accounting_doctypes(doc):
 		frappe.publish_progress(count*100/len(doclist), title = _("Creating Dimensions..."))
 		frappe.clear_cache(doctype=doctype)
 
+def create_accounting_dimensions_for_doctype(doctype):
+	"""Add the existing accounting dimensions to a new doctype with dimensions,
+	called from the patch which installs it"""
+	accounting_dimensions = frappe.db.sql("""select fieldname, label, document_type from
+		`tabAccounting Dimension`""", as_dict=1)
+
+	count = 1
+	for d in accounting_dimensions:
+		if count%2 == 0:
+			insert_after_field = 'dimension_col_break'
+		else:
+			insert_after_field = 'accounting_dimensions_section'
+
+		if not frappe.db.get_value("Custom Field", {"dt": doctype, "fieldname": d.fieldname}):
+			create_custom_field(doctype, {
+				"fieldname": d.fieldname,
+				"label": d.label,
+				"fieldtype": "Link",
+				"options": d.document_type,
+				"insert_after": insert_after_field
+			})
+
+		count += 1
+
+	frappe.clear_cache(doctype=doctype)
+
 def add_dimension_to_budget_doctype(df, doc):
 	df.update({
 		"insert_after": "cost_center",
@@ -177,7 +203,7 @@ def get_doctypes_with_dimensions():
 		"Purchase Receipt Item", "Stock Entry Detail", "Payment Entry Deduction", "Sales Taxes and Charges", "Purchase Taxes and Charges", "Shipping Rule",
 		"Landed Cost Item", "Asset Value Adjustment", "Loyalty Program", "Fee Schedule", "Fee Structure", "Stock Reconciliation",
 		"Travel Request", "Fees", "POS Profile", "Opening Invoice Creation Tool", "Opening Invoice Creation Tool Item", "Subscription",
-		"Subscription Plan"]
+		"Subscription Plan", "Account Period Balance", "Payment Ledger Entry", "Account Closing Balance"]
 
 	return doclist
 
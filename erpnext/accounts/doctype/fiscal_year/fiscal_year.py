@@ -8,6 +8,7 @@ from frappe.utils import getdate, add_days, add_years, cstr
 from dateutil.relativedelta import relativedelta
 
 from frappe.model.document import Document
+from erpnext.accounts.utils import clear_fiscal_years_cache
 
 class FiscalYearIncorrectDate(frappe.ValidationError): pass
 
@@ -53,13 +54,13 @@ class FiscalYear(Document):
 
 	def on_update(self):
 		check_duplicate_fiscal_year(self)
-		frappe.cache().delete_value("fiscal_years")
+		clear_fiscal_years_cache()
 	
 	def on_trash(self):
 		global_defaults = frappe.get_doc("Global Defaults")
 		if global_defaults.current_fiscal_year == self.name:
 			frappe.throw(_("You cannot delete Fiscal Year {0}. Fiscal Year {0} is set as default in Global Settings").format(self.name))
-		frappe.cache().delete_value("fiscal_years")
+		clear_fiscal_years_cache()
 
 	def validate_overlap(self):
 		existing_fiscal_years = frappe.db.sql("""select name from `tabFiscal Year`
@@ -9,6 +9,7 @@ import frappe
 from frappe.utils import now_datetime
 
 from erpnext.accounts.doctype.fiscal_year.fiscal_year import FiscalYearIncorrectDate
+from erpnext.accounts.utils import get_fiscal_year, FiscalYearError
 
 test_ignore = ["Company"]
 
@@ -26,6 +27,22 @@ class TestFiscalYear(unittest.TestCase):
 
 		self.assertRaises(FiscalYearIncorrectDate, fy.insert)
 
+	def test_new_fiscal_year_is_found(self):
+		if frappe.db.exists("Fiscal Year", "_Test Fiscal Year 1990"):
+			frappe.delete_doc("Fiscal Year", "_Test Fiscal Year 1990")
+
+		self.assertRaises(FiscalYearError, get_fiscal_year, "1990-06-01", verbose=0)
+
+		frappe.get_doc({
+			"doctype": "Fiscal Year",
+			"year": "_Test Fiscal Year 1990",
+			"year_start_date": "1990-01-01",
+			"year_end_date": "1990-12-31"
+		}).insert()
+
+		self.assertEqual(get_fiscal_year("1990-06-01")[0], "_Test Fiscal Year 1990")
+		self.assertEqual(get_fiscal_year(fiscal_year="_Test Fiscal Year 1990")[0], "_Test Fiscal Year 1990")
+
 
 def test_record_generator():
 	test_records = [
@@ -36,19 +36,15 @@ class GLEntry(Document):
 			self.validate_currency()
 
 	def on_update_with_args(self, adv_adj, update_outstanding = 'Yes', from_repost=False):
-		if not from_repost:
-			self.validate_account_details(adv_adj)
-			self.validate_dimensions_for_pl_and_bs()
-			check_freezing_date(self.posting_date, adv_adj)
+		validate_inserted_entries([self], adv_adj, update_outstanding, from_repost)
 
-		validate_frozen_account(self.account, adv_adj)
-		validate_balance_type(self.account, adv_adj)
+	def get_account_details(self):
+		'''Account fields used in the validations, set in `flags.account_details`
+		when the entries of a voucher are validated together'''
+		if self.flags.account_details is None:
+			self.flags.account_details = get_account_details_map([self.account]).get(self.account)
 
-		# Update outstanding amt on against voucher
-		if self.against_voucher_type in ['Journal Entry', 'Sales Invoice', 'Purchase Invoice', 'Fees'] \
-			and self.against_voucher and update_outstanding == 'Yes' and not from_repost:
-				update_outstanding_amt(self.account, self.party_type, self.party, self.against_voucher_type,
-					self.against_voucher)
+		return self.flags.account_details or frappe._dict()
 
 	def check_mandatory(self):
 		mandatory = ['account','voucher_type','voucher_no','company']
@@ -56,7 +52,7 @@ class GLEntry(Document):
 			if not self.get(k):
 				frappe.throw(_("{0} is required").format(_(self.meta.get_label(k))))
 
-		account_type = frappe.db.get_value("Account", self.account, "account_type")
+		account_type = self.get_account_details().account_type
 		if not (self.party_type and self.party):
 			if account_type == "Receivable":
 				frappe.throw(_("{0} {1}: Customer is required against Receivable account {2}")
@@ -71,16 +67,19 @@ class GLEntry(Document):
 				.format(self.voucher_type, self.voucher_no, self.account))
 
 	def pl_must_have_cost_center(self):
-		if frappe.db.get_value("Account", self.account, "report_type") == "Profit and Loss":
+		if self.get_account_details().report_type == "Profit and Loss":
 			if not self.cost_center and self.voucher_type != 'Period Closing Voucher':
 				frappe.throw(_("{0} {1}: Cost Center is required for 'Profit and Loss' account {2}. Please set up a default Cost Center for the Company.")
 					.format(self.voucher_type, self.voucher_no, self.account))
 
-	def validate_dimensions_for_pl_and_bs(self):
+	def validate_dimensions_for_pl_and_bs(self, dimensions=None):
 
-		account_type = frappe.db.get_value("Account", self.account, "report_type")
+		account_type = self.get_account_details().report_type
 
-		for dimension in get_checks_for_pl_and_bs_accounts():
+		if dimensions is None:
+			dimensions = get_checks_for_pl_and_bs_accounts()
+
+		for dimension in dimensions:
 
 			if account_type == "Profit and Loss" \
 				and self.company == dimension.company and dimension.mandatory_for_pl and not dimension.disabled:
@@ -97,15 +96,14 @@ class GLEntry(Document):
 
 	def check_pl_account(self):
 		if self.is_opening=='Yes' and \
-				frappe.db.get_value("Account", self.account, "report_type")=="Profit and Loss":
+				self.get_account_details().report_type=="Profit and Loss":
 			frappe.throw(_("{0} {1}: 'Profit and Loss' type account {2} not allowed in Opening Entry")
 				.format(self.voucher_type, self.voucher_no, self.account))
 
 	def validate_account_details(self, adv_adj):
 		"""Account must be ledger, active and not freezed"""
 
-		ret = frappe.db.sql("""select is_group, docstatus, company
-			from tabAccount where name=%s""", self.account, as_dict=1)[0]
+		ret = self.get_account_details()
 
 		if ret.is_group==1:
 			frappe.throw(_('''{0} {1}: Account {2} is a Group Account and group accounts cannot be used in
@@ -166,6 +164,41 @@ class GLEntry(Document):
 			self.fiscal_year = get_fiscal_year(self.posting_date, company=self.company)[0]
 
 
+def get_account_details_map(accounts):
+	return frappe._dict((d.name, d) for d in frappe.db.sql("""
+		select name, account_type, report_type, is_group, docstatus, company
+		from tabAccount where name in %s""", [tuple(set(accounts))], as_dict=1))
+
+def validate_inserted_entries(gl_entries, adv_adj, update_outstanding='Yes', from_repost=False):
+	'''Validations and outstanding updates run after the GL Entries of a voucher are
+	inserted, once per account, per posting date and per against voucher'''
+	if not from_repost:
+		dimensions = get_checks_for_pl_and_bs_accounts()
+		for gle in gl_entries:
+			gle.validate_account_details(adv_adj)
+			gle.validate_dimensions_for_pl_and_bs(dimensions)
+
+		check_freezing_date(min(getdate(gle.posting_date) for gle in gl_entries), adv_adj)
+
+	for account in sorted(set(gle.account for gle in gl_entries)):
+		validate_frozen_account(account, adv_adj)
+		validate_balance_type(account, adv_adj)
+
+	# Update outstanding amt on against voucher, in the order of the last entry
+	# of each against voucher
+	if update_outstanding == 'Yes' and not from_repost:
+		against_vouchers, updated = [], set()
+		for gle in reversed(gl_entries):
+			if gle.against_voucher_type in ['Journal Entry', 'Sales Invoice', 'Purchase Invoice', 'Fees'] \
+				and gle.against_voucher:
+				key = (gle.account, gle.party_type, gle.party, gle.against_voucher_type, gle.against_voucher)
+				if key not in updated:
+					updated.add(key)
+					against_vouchers.append(key)
+
+		for account, party_type, party, against_voucher_type, against_voucher in reversed(against_vouchers):
+			update_outstanding_amt(account, party_type, party, against_voucher_type, against_voucher)
+
 def validate_balance_type(account, adv_adj=False):
 	if not adv_adj and account:
 		balance_must_be = frappe.db.get_value("Account", account, "balance_must_be")
@@ -6,6 +6,8 @@ import frappe, unittest
 from frappe.model.naming import parse_naming_series
 from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
 from erpnext.accounts.doctype.gl_entry.gl_entry import rename_gle_sle_docs
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+import erpnext.accounts.general_ledger as general_ledger
 
 class TestGLEntry(unittest.TestCase):
 	def test_round_off_entry(self):
@@ -26,6 +28,53 @@ class TestGLEntry(unittest.TestCase):
 
 		self.assertTrue(round_off_entry)
 
+	def test_entries_inserted_in_batches(self):
+		si = create_sales_invoice(rate=300)
+
+		jv = frappe.new_doc("Journal Entry")
+		jv.posting_date = si.posting_date
+		jv.company = "_Test Company"
+		jv.user_remark = "test"
+		for cost_center in ("_Test Cost Center - _TC", "_Test Cost Center 2 - _TC"):
+			jv.append("accounts", {
+				"account": "Debtors - _TC",
+				"party_type": "Customer",
+				"party": si.customer,
+				"cost_center": cost_center,
+				"credit_in_account_currency": 50,
+				"reference_type": "Sales Invoice",
+				"reference_name": si.name
+			})
+		jv.append("accounts", {
+			"account": "_Test Bank - _TC",
+			"cost_center": "_Test Cost Center - _TC",
+			"debit_in_account_currency": 100
+		})
+		jv.insert()
+
+		batch_size = general_ledger.GL_ENTRY_INSERT_BATCH_SIZE
+		general_ledger.GL_ENTRY_INSERT_BATCH_SIZE = 2
+		try:
+			jv.submit()
+		finally:
+			general_ledger.GL_ENTRY_INSERT_BATCH_SIZE = batch_size
+
+		gl_entries = frappe.get_all("GL Entry", fields=["docstatus", "to_rename"],
+			filters={"voucher_type": "Journal Entry", "voucher_no": jv.name})
+		self.assertEqual(len(gl_entries), 3)
+		self.assertTrue(all(d.docstatus == 1 and d.to_rename == 1 for d in gl_entries))
+
+		self.assertEqual(frappe.db.get_value("Sales Invoice", si.name, "outstanding_amount"), 200)
+
+	def test_link_validation_for_batched_entries(self):
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=False)
+
+		jv.get("accounts")[0].cost_center = "_Test Missing Cost Center - _TC"
+		jv.flags.ignore_links = True
+		self.assertRaises(frappe.LinkValidationError, jv.submit)
+		self.assertFalse(frappe.db.exists("GL Entry", {"voucher_type": "Journal Entry", "voucher_no": jv.name}))
+
 	def test_rename_entries(self):
 		je = make_journal_entry("_Test Account Cost for Goods Sold - _TC", "_Test Bank - _TC", 100, submit=True)
 		rename_gle_sle_docs()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+from six import iteritems
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions
+from erpnext.accounts.utils import get_vouchers_by_type
+
+class PaymentLedgerEntry(Document):
+	pass
+
+def get_ledger_fields():
+	'''Fields copied from the GL Entry, named as in GL Entry so that the
+	outstanding queries and their conditions work on either table'''
+	return ["company", "account", "account_currency", "party_type", "party", "posting_date",
+		"due_date", "remarks", "voucher_type", "voucher_no", "against_voucher_type", "against_voucher",
+		"cost_center", "project", "finance_book", "debit", "credit", "debit_in_account_currency",
+		"credit_in_account_currency"] + get_accounting_dimensions()
+
+def make_payment_ledger_entries(gl_entries):
+	'''Add the GL Entries booked against a party to the ledger, one entry per
+	GL Entry. The GL Entries of a voucher are already merged per account, party
+	and against voucher, so an entry is the change of the outstanding of the
+	against voucher (or of the voucher itself) made by the voucher'''
+	ledger_fields = get_ledger_fields()
+
+	for gle in gl_entries:
+		if not (gle.get("party_type") and gle.get("party")):
+			continue
+
+		ple = frappe.new_doc("Payment Ledger Entry")
+		for fieldname in ledger_fields:
+			ple.set(fieldname, gle.get(fieldname))
+
+		# same name and creation as the GL Entry, future payments are
+		# filtered on the creation date
+		ple.name = gle.name
+		ple.creation = ple.modified = gle.creation
+		ple.db_insert()
+
+def delete_payment_ledger_entries(vouchers):
+	'''Delete the ledger entries of the vouchers, called along with the
+	deletion of their GL Entries'''
+	vouchers_by_type = get_vouchers_by_type(vouchers)
+
+	for voucher_type, voucher_nos in iteritems(vouchers_by_type):
+		frappe.db.sql("""delete from `tabPayment Ledger Entry`
+			where voucher_type=%s and voucher_no in ({0})""".format(", ".join(["%s"] * len(voucher_nos))),
+			tuple([voucher_type] + voucher_nos))
+
+def rebuild_payment_ledger(company=None):
+	'''Rebuild the ledger from the GL Entries, of all the companies if
+	`company` is not set'''
+	company_condition = "and company = %(company)s" if company else ""
+
+	frappe.db.sql("""delete from `tabPayment Ledger Entry`
+		where 1=1 {0}""".format(company_condition), {"company": company})
+
+	fields = ", ".join(["`{0}`".format(fieldname) for fieldname in get_ledger_fields()])
+
+	frappe.db.sql("""
+		insert into `tabPayment Ledger Entry`
+			(name, creation, modified, modified_by, owner, {fields})
+		select
+			name, creation, creation, modified_by, owner, {fields}
+		from `tabGL Entry`
+		where ifnull(party_type, '') != '' and ifnull(party, '') != ''
+			{company_condition}
+	""".format(fields=fields, company_condition=company_condition), {"company": company})
+
+def on_doctype_update():
+	frappe.db.add_index("Payment Ledger Entry", ["party_type", "party", "account"])
+	frappe.db.add_index("Payment Ledger Entry", ["voucher_type", "voucher_no"])
+	frappe.db.add_index("Payment Ledger Entry", ["against_voucher_type", "against_voucher"])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate
+from erpnext.accounts.utils import get_outstanding_invoices
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from erpnext.accounts.doctype.payment_entry.payment_entry import get_payment_entry
+from erpnext.accounts.doctype.payment_ledger_entry.payment_ledger_entry import rebuild_payment_ledger
+
+class TestPaymentLedgerEntry(unittest.TestCase):
+	def test_entries_follow_party_gl_entries(self):
+		si = create_sales_invoice(rate=200)
+		self.assertEqual(get_ledger_entries(si.name), get_party_gl_entries(si.name))
+
+		pe = get_payment_entry("Sales Invoice", si.name, party_amount=50, bank_account="_Test Bank - _TC")
+		pe.reference_no = "1"
+		pe.reference_date = nowdate()
+		pe.insert()
+		pe.submit()
+		self.assertEqual(get_ledger_entries(pe.name), get_party_gl_entries(pe.name))
+
+		outstanding = [d.outstanding_amount for d in get_outstanding_invoices("Customer",
+			"_Test Customer", "Debtors - _TC") if d.voucher_no == si.name]
+		self.assertEqual(outstanding, [150])
+
+		pe.cancel()
+		self.assertEqual(get_ledger_entries(pe.name), [])
+
+		outstanding = [d.outstanding_amount for d in get_outstanding_invoices("Customer",
+			"_Test Customer", "Debtors - _TC") if d.voucher_no == si.name]
+		self.assertEqual(outstanding, [200])
+
+	def test_rebuild(self):
+		si = create_sales_invoice(rate=300)
+		entries = get_ledger_entries(si.name)
+
+		rebuild_payment_ledger("_Test Company")
+		self.assertEqual(get_ledger_entries(si.name), entries)
+
+def get_ledger_entries(voucher_no):
+	return frappe.db.sql("""select name, party, account, against_voucher, debit, credit
+		from `tabPayment Ledger Entry` where voucher_no=%s order by name""", voucher_no, as_dict=1)
+
+def get_party_gl_entries(voucher_no):
+	return frappe.db.sql("""select name, party, account, against_voucher, debit, credit
+		from `tabGL Entry` where voucher_no=%s and ifnull(party, '') != '' order by name""", voucher_no, as_dict=1)
@@ -91,7 +91,7 @@ class PaymentReconciliation(Document):
 		return frappe.db.sql(""" SELECT doc.name as reference_name, %(voucher_type)s as reference_type,
 				(sum(gl.{dr_or_cr}) - sum(gl.{reconciled_dr_or_cr})) as amount,
 				account_currency as currency
-			FROM `tab{doc}` doc, `tabGL Entry` gl
+			FROM `tab{doc}` doc, `tabPayment Ledger Entry` gl
 			WHERE
 				(doc.name = gl.against_voucher or doc.name = gl.voucher_no)
 				and doc.{party_type_field} = %(party)s
@@ -5,10 +5,14 @@ from __future__ import unicode_literals
 import frappe
 from frappe.utils import flt
 from frappe import _
-from erpnext.accounts.utils import get_account_currency
+from erpnext.accounts.utils import get_account_currency, clear_balance_on_cache
 from erpnext.controllers.accounts_controller import AccountsController
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (get_accounting_dimensions,
 	get_dimension_filters)
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import \
+	remove_vouchers_from_account_period_balances
+from erpnext.accounts.doctype.account_closing_balance.account_closing_balance import (get_closings,
+	make_closing_balances, remove_vouchers_from_closing_balances, delete_closing_balances)
 
 class PeriodClosingVoucher(AccountsController):
 	def validate(self):
@@ -17,10 +21,15 @@ class PeriodClosingVoucher(AccountsController):
 
 	def on_submit(self):
 		self.make_gl_entries()
+		make_closing_balances(self)
 
 	def on_cancel(self):
+		remove_vouchers_from_account_period_balances([(self.doctype, self.name)])
+		remove_vouchers_from_closing_balances([(self.doctype, self.name)])
 		frappe.db.sql("""delete from `tabGL Entry`
 			where voucher_type = 'Period Closing Voucher' and voucher_no=%s""", self.name)
+		delete_closing_balances(self.name)
+		clear_balance_on_cache()
 
 	def validate_account_head(self):
 		closing_account_type = frappe.db.get_value("Account", self.closing_account_head, "root_type")
@@ -127,7 +136,8 @@ class PeriodClosingVoucher(AccountsController):
 			})
 
 	def get_pl_balances(self):
-		"""Get balance for dimension-wise pl accounts"""
+		"""Get balance for dimension-wise pl accounts, from the closing balances of
+		the previous Period Closing Voucher of the fiscal year if any"""
 
 		dimension_fields = ['t1.cost_center']
 
@@ -135,14 +145,47 @@ class PeriodClosingVoucher(AccountsController):
 		for dimension in self.accounting_dimensions:
 			dimension_fields.append('t1.{0}'.format(dimension))
 
+		previous_closing = self.get_previous_closing()
+		if previous_closing:
+			entry_fields = ", ".join(["account", "debit", "credit", "debit_in_account_currency",
+				"credit_in_account_currency"] + [d.replace("t1.", "") for d in dimension_fields])
+
+			entries = """(
+				select {0} from `tabAccount Closing Balance`
+				where period_closing_voucher = %(previous_closing)s
+				union all
+				select {0} from `tabGL Entry`
+				where company = %(company)s
+					and posting_date > %(previous_closing_date)s and posting_date <= %(posting_date)s
+			)""".format(entry_fields)
+			date_condition = ""
+		else:
+			entries = "`tabGL Entry`"
+			date_condition = "and t1.posting_date between %(year_start_date)s and %(posting_date)s"
+
 		return frappe.db.sql("""
 			select
 				t1.account, t2.account_currency, {dimension_fields},
 				sum(t1.debit_in_account_currency) - sum(t1.credit_in_account_currency) as bal_in_account_currency,
 				sum(t1.debit) - sum(t1.credit) as bal_in_company_currency
-			from `tabGL Entry` t1, `tabAccount` t2
+			from {entries} t1, `tabAccount` t2
 			where t1.account = t2.name and t2.report_type = 'Profit and Loss'
-			and t2.docstatus < 2 and t2.company = %s
-			and t1.posting_date between %s and %s
+			and t2.docstatus < 2 and t2.company = %(company)s
+			{date_condition}
 			group by t1.account, {dimension_fields}
-		""".format(dimension_fields = ', '.join(dimension_fields)), (self.company, self.get("year_start_date"), self.posting_date), as_dict=1)
+		""".format(dimension_fields = ', '.join(dimension_fields), entries=entries, date_condition=date_condition), {
+			"company": self.company,
+			"year_start_date": self.get("year_start_date"),
+			"posting_date": self.posting_date,
+			"previous_closing": previous_closing and previous_closing.name,
+			"previous_closing_date": previous_closing and previous_closing.posting_date
+		}, as_dict=1)
+
+	def get_previous_closing(self):
+		"""The Period Closing Voucher of the fiscal year closed before this one"""
+		closings = [d for d in get_closings(self.company, self.get("year_start_date"))
+			if d.fiscal_year == self.fiscal_year]
+		names = [d.name for d in closings]
+
+		if self.name in names and names.index(self.name):
+			return closings[names.index(self.name) - 1]
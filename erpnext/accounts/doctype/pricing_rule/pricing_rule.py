@@ -189,16 +189,44 @@ def apply_pricing_rule(args, doc=None):
 	set_serial_nos_based_on_fifo = frappe.db.get_single_value("Stock Settings",
 		"automatically_set_serial_nos_based_on_fifo")
 
+	if isinstance(doc, string_types):
+		doc = json.loads(doc)
+
+	if doc:
+		doc = frappe.get_doc(doc)
+
+	args_list = []
 	for item in item_list:
 		args_copy = copy.deepcopy(args)
 		args_copy.update(item)
-		data = get_pricing_rule_for_item(args_copy, item.get('price_list_rate'), doc=doc)
+		args_list.append(args_copy)
+
+	pricing_rules = get_pricing_rules_for_item_list(args_list, doc)
+
+	for item, args_copy, item_pricing_rules in zip(item_list, args_list, pricing_rules):
+		data = get_pricing_rule_for_item(args_copy, item.get('price_list_rate'), doc=doc,
+			pricing_rules=item_pricing_rules)
 		out.append(data)
 		if not item.get("serial_no") and set_serial_nos_based_on_fifo and not args.get('is_return'):
 			out[0].update(get_serial_no_for_item(args_copy))
 
 	return out
 
+def get_pricing_rules_for_item_list(args_list, doc=None):
+	"""Returns the pricing rules of each item row, fetched together for all the rows.
+	None for the rows on which pricing rules are not applied"""
+	from erpnext.accounts.doctype.pricing_rule.utils import get_pricing_rules_for_items
+
+	rows = [args for args in args_list if not (args.get('is_free_item')
+		or args.get("parenttype") == "Material Request" or args.ignore_pricing_rule or not args.item_code)]
+
+	for args in rows:
+		update_args_for_pricing_rule(args)
+
+	pricing_rules = dict(zip([id(args) for args in rows], get_pricing_rules_for_items(rows, doc)))
+
+	return [pricing_rules.get(id(args)) for args in args_list]
+
 def get_serial_no_for_item(args):
 	from erpnext.stock.get_item_details import get_serial_no
 
@@ -211,7 +239,7 @@ def get_serial_no_for_item(args):
 		item_details.serial_no = get_serial_no(args)
 	return item_details
 
-def get_pricing_rule_for_item(args, price_list_rate=0, doc=None, for_validate=False):
+def get_pricing_rule_for_item(args, price_list_rate=0, doc=None, for_validate=False, pricing_rules=None):
 	from erpnext.accounts.doctype.pricing_rule.utils import (get_pricing_rules,
 		get_applied_pricing_rules, get_pricing_rule_items, get_product_discount_rule)
 
@@ -242,8 +270,10 @@ def get_pricing_rule_for_item(args, price_list_rate=0, doc=None, for_validate=Fa
 
 	update_args_for_pricing_rule(args)
 
-	pricing_rules = (get_applied_pricing_rules(args.get('pricing_rules'))
-		if for_validate and args.get("pricing_rules") else get_pricing_rules(args, doc))
+	if for_validate and args.get("pricing_rules"):
+		pricing_rules = get_applied_pricing_rules(args.get('pricing_rules'))
+	elif pricing_rules is None:
+		pricing_rules = get_pricing_rules(args, doc)
 
 	if pricing_rules:
 		rules = []
@@ -11,6 +11,7 @@ from erpnext.stock.get_item_details import get_item_details
 from frappe import MandatoryError
 from erpnext.stock.doctype.item.test_item import make_item
 from erpnext.healthcare.doctype.lab_test_template.lab_test_template import make_item_price
+from erpnext.accounts.doctype.pricing_rule.utils import clear_pricing_rule_index
 
 class TestPricingRule(unittest.TestCase):
 	def setUp(self):
@@ -93,6 +94,7 @@ class TestPricingRule(unittest.TestCase):
 		self.assertEqual(details.get("discount_percentage"), 5)
 
 		frappe.db.sql("update `tabPricing Rule` set priority=NULL where campaign='_Test Campaign'")
+		clear_pricing_rule_index()
 		from erpnext.accounts.doctype.pricing_rule.utils import MultiplePricingRuleConflict
 		self.assertRaises(MultiplePricingRuleConflict, get_item_details, args)
 
@@ -483,6 +485,43 @@ class TestPricingRule(unittest.TestCase):
 		for doc in [si, si1]:
 			doc.delete()
 
+	def test_pricing_rules_for_multiple_items(self):
+		from erpnext.accounts.doctype.pricing_rule.pricing_rule import update_args_for_pricing_rule
+		from erpnext.accounts.doctype.pricing_rule.utils import get_pricing_rules, get_pricing_rules_for_items
+
+		make_pricing_rule(title="_Test Pricing Rule For Item", selling=1, discount_percentage=10)
+		make_pricing_rule(title="_Test Pricing Rule For Item Group", selling=1, apply_on="Item Group",
+			item_group="_Test Item Group", discount_percentage=5)
+
+		args_list = []
+		for item_code in ["_Test Item", "_Test Item 2", "_Test Item Home Desktop 100"]:
+			args = frappe._dict({
+				"item_code": item_code,
+				"company": "_Test Company",
+				"transaction_type": "selling",
+				"price_list": "_Test Price List",
+				"customer": "_Test Customer",
+				"qty": 1,
+				"stock_qty": 1
+			})
+			update_args_for_pricing_rule(args)
+			args_list.append(args)
+
+		expected = [[d.name for d in get_pricing_rules(frappe._dict(args))] for args in args_list]
+		pricing_rules = [[d.name for d in rules] for rules in get_pricing_rules_for_items(args_list)]
+
+		self.assertEqual(pricing_rules, expected)
+		self.assertEqual(pricing_rules[0], ["_Test Pricing Rule For Item"])
+
+	def test_pricing_rule_index_is_cleared_on_change(self):
+		from erpnext.accounts.doctype.pricing_rule.utils import get_pricing_rule_index
+
+		make_pricing_rule(title="_Test Pricing Rule For Index", selling=1, discount_percentage=10)
+		self.assertIn("_Test Item", get_pricing_rule_index("_Test Company").rules["item_code"])
+
+		frappe.delete_doc("Pricing Rule", "_Test Pricing Rule For Index")
+		self.assertNotIn("_Test Item", get_pricing_rule_index("_Test Company").rules["item_code"])
+
 def make_pricing_rule(**args):
 	args = frappe._dict(args)
 
@@ -531,4 +570,6 @@ def delete_existing_pricing_rules():
 	for doctype in ["Pricing Rule", "Pricing Rule Item Code",
 		"Pricing Rule Item Group", "Pricing Rule Brand"]:
 
-		frappe.db.sql("delete from `tab{0}`".format(doctype))
\ No newline at end of file
+		frappe.db.sql("delete from `tab{0}`".format(doctype))
+
+	clear_pricing_rule_index()
\ No newline at end of file
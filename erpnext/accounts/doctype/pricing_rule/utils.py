@@ -8,7 +8,7 @@ from __future__ import unicode_literals
 import copy
 import json
 
-from six import string_types
+from six import string_types, iteritems
 
 import frappe
 from erpnext.accounts.doctype.pricing_rule.pricing_rule import set_transaction_type
@@ -19,7 +19,7 @@ from erpnext.stock.doctype.item.item import get_item_defaults
 from erpnext.setup.doctype.item_group.item_group import get_item_group_defaults
 from erpnext.setup.doctype.brand.brand import get_brand_defaults
 from frappe import _, throw
-from frappe.utils import cint, flt, get_datetime, get_link_to_form, getdate, today
+from frappe.utils import cint, cstr, flt, get_datetime, get_link_to_form, getdate, today
 
 
 class MultiplePricingRuleConflict(frappe.ValidationError): pass
@@ -30,13 +30,23 @@ apply_on_table = {
     'Brand': 'brands'
 }
 
+# compiled pricing rule indexes of the current process, by site and company
+pricing_rule_indexes = {}
+
+# doctypes whose lft and rgt are kept in the index, to match tree conditions
+pricing_rule_tree_doctypes = ["Item Group", "Customer Group", "Territory", "Supplier Group", "Warehouse"]
+
 def get_pricing_rules(args, doc=None):
-	pricing_rules_all = []
-	values = {}
+	pricing_rules_all = get_pricing_rules_from_index(args)
 
-	for apply_on in ['Item Code', 'Item Group', 'Brand']:
-		pricing_rules_all.extend(_get_pricing_rules(apply_on, args, values))
+	return get_applicable_pricing_rules(args, pricing_rules_all, doc)
 
+def get_pricing_rules_for_items(args_list, doc=None):
+	"""Returns the pricing rules of each item row in `args_list`, as returned
+	by `get_pricing_rules` for the row"""
+	return [get_pricing_rules(args, doc) for args in args_list]
+
+def get_applicable_pricing_rules(args, pricing_rules_all, doc=None):
 	# removing duplicate pricing rule
 	pricing_rules_name = []
 	pricing_rules = []
@@ -61,60 +71,140 @@ def get_pricing_rules(args, doc=None):
 
 	return rules
 
-def _get_pricing_rules(apply_on, args, values):
-	apply_on_field = frappe.scrub(apply_on)
-
-	if not args.get(apply_on_field): return []
+def get_pricing_rules_from_index(args):
+	"""Returns the active pricing rules which apply to the item row, ordered by
+	apply on, then by priority and name descending.
 
-	child_doc = '`tabPricing Rule {0}`'.format(apply_on)
+	The rules are looked up in the compiled index of the company, so no
+	query is made for the pricing rules"""
+	index = get_pricing_rule_index(args.company)
 
-	conditions = item_variant_condition = item_conditions = ""
-	values[apply_on_field] = args.get(apply_on_field)
-	if apply_on_field in ['item_code', 'brand']:
-		item_conditions = "{child_doc}.{apply_on_field}= %({apply_on_field})s".format(child_doc=child_doc,
-			apply_on_field = apply_on_field)
+	if "variant_of" not in args:
+		args.variant_of = frappe.get_cached_value("Item", args.item_code, "variant_of")
 
-		if apply_on_field == 'item_code':
-			if "variant_of" not in args:
-				args.variant_of = frappe.get_cached_value("Item", args.item_code, "variant_of")
+	if not args.price_list: args.price_list = None
 
-			if args.variant_of:
-				item_variant_condition = ' or {child_doc}.item_code=%(variant_of)s '.format(child_doc=child_doc)
-				values['variant_of'] = args.variant_of
-	elif apply_on_field == 'item_group':
-		item_conditions = _get_tree_conditions(args, "Item Group", child_doc, False)
+	pricing_rules = []
+	for apply_on in ['Item Code', 'Item Group', 'Brand']:
+		apply_on_field = frappe.scrub(apply_on)
+		value = args.get(apply_on_field)
+		if not value: continue
+
+		candidates = []
+		if apply_on_field == 'item_group':
+			for item_group, rules in iteritems(index.rules[apply_on_field]):
+				if is_ancestor(index, "Item Group", item_group, value):
+					candidates.extend(rules)
+		else:
+			candidates.extend(index.rules[apply_on_field].get(value, []))
+			if apply_on_field == 'item_code' and args.variant_of:
+				candidates.extend(index.rules[apply_on_field].get(args.variant_of, []))
 
-	conditions += get_other_conditions(conditions, values, args)
-	warehouse_conditions = _get_tree_conditions(args, "Warehouse", '`tabPricing Rule`')
-	if warehouse_conditions:
-		warehouse_conditions = " and {0}".format(warehouse_conditions)
+		candidates.extend(index.other_rules[apply_on_field].get(value, []))
 
-	if not args.price_list: args.price_list = None
+		candidates = [d for d in candidates if pricing_rule_matches(index, d, args)]
+		candidates.sort(key=lambda d: (cstr(d.priority), d.name), reverse=True)
 
-	conditions += " and ifnull(`tabPricing Rule`.for_price_list, '') in (%(price_list)s, '')"
-	values["price_list"] = args.get("price_list")
-
-	pricing_rules = frappe.db.sql("""select `tabPricing Rule`.*,
-			{child_doc}.{apply_on_field}, {child_doc}.uom
-		from `tabPricing Rule`, {child_doc}
-		where ({item_conditions} or (`tabPricing Rule`.apply_rule_on_other is not null
-			and `tabPricing Rule`.{apply_on_other_field}=%({apply_on_field})s) {item_variant_condition})
-			and {child_doc}.parent = `tabPricing Rule`.name
-			and `tabPricing Rule`.disable = 0 and
-			`tabPricing Rule`.{transaction_type} = 1 {warehouse_cond} {conditions}
-		order by `tabPricing Rule`.priority desc,
-			`tabPricing Rule`.name desc""".format(
-			child_doc = child_doc,
-			apply_on_field = apply_on_field,
-			item_conditions = item_conditions,
-			item_variant_condition = item_variant_condition,
-			transaction_type = args.transaction_type,
-			warehouse_cond = warehouse_conditions,
-			apply_on_other_field = "other_{0}".format(apply_on_field),
-			conditions = conditions), values, as_dict=1) or []
+		# copy, rules are updated for the row while filtering
+		pricing_rules.extend(frappe._dict(d) for d in candidates)
 
 	return pricing_rules
 
+def pricing_rule_matches(index, pricing_rule, args):
+	"""Returns True if the party, warehouse, date and price list conditions
+	of the rule match the item row"""
+	if not cint(pricing_rule.get(args.transaction_type)):
+		return False
+
+	for field in ["company", "customer", "supplier", "campaign", "sales_partner"]:
+		if (pricing_rule.get(field) or '') not in ('', args.get(field) or ''):
+			return False
+
+	for parenttype in ["Customer Group", "Territory", "Supplier Group", "Warehouse"]:
+		field = frappe.scrub(parenttype)
+		if (args.get(field) and pricing_rule.get(field)
+			and not is_ancestor(index, parenttype, pricing_rule.get(field), args.get(field))):
+			return False
+
+	if args.get("transaction_date"):
+		transaction_date = getdate(args.get("transaction_date"))
+		if not (getdate(pricing_rule.valid_from or '2000-01-01') <= transaction_date
+			<= getdate(pricing_rule.valid_upto or '2500-12-31')):
+			return False
+
+	return (pricing_rule.for_price_list or '') in ('', args.price_list or '')
+
+def is_ancestor(index, parenttype, ancestor, name):
+	"""Returns True if `ancestor` is `name` or one of its parents"""
+	tree = index.trees[parenttype]
+	if name not in tree:
+		frappe.throw(_("Invalid {0}").format(name))
+
+	if ancestor not in tree:
+		return False
+
+	return tree[ancestor][0] <= tree[name][0] and tree[ancestor][1] >= tree[name][1]
+
+def get_pricing_rule_index(company):
+	"""Returns the compiled pricing rule index of the company, cached in the
+	process and in redis. A new version is set when the index is cleared, so
+	that the copies in the other processes are rebuilt"""
+	company = company or ''
+
+	version = frappe.cache().get_value("pricing_rule_index_version")
+	if not version:
+		version = frappe.generate_hash(length=10)
+		frappe.cache().set_value("pricing_rule_index_version", version)
+
+	key = (frappe.local.site, company)
+	if key not in pricing_rule_indexes or pricing_rule_indexes[key].version != version:
+		index = frappe.cache().hget("pricing_rule_index", company)
+		if not index or index.version != version:
+			index = build_pricing_rule_index(company)
+			index.version = version
+			frappe.cache().hset("pricing_rule_index", company, index)
+
+		pricing_rule_indexes[key] = index
+
+	return pricing_rule_indexes[key]
+
+def build_pricing_rule_index(company):
+	"""Compile the active pricing rules of the company by the item code, item group
+	or brand they apply on, and by the other item they apply on, with the lft
+	and rgt of the tree doctypes"""
+	index = frappe._dict({"rules": {}, "other_rules": {}, "trees": {}})
+
+	for apply_on in ['Item Code', 'Item Group', 'Brand']:
+		apply_on_field = frappe.scrub(apply_on)
+		other_field = "other_{0}".format(apply_on_field)
+		rules = index.rules.setdefault(apply_on_field, {})
+		other_rules = index.other_rules.setdefault(apply_on_field, {})
+
+		for d in frappe.db.sql("""select `tabPricing Rule`.*, child.{apply_on_field}, child.uom
+			from `tabPricing Rule`, `tabPricing Rule {apply_on}` child
+			where child.parent = `tabPricing Rule`.name
+				and `tabPricing Rule`.disable = 0
+				and ifnull(`tabPricing Rule`.company, '') in (%s, '')
+			order by `tabPricing Rule`.name, child.idx""".format(apply_on=apply_on, apply_on_field=apply_on_field),
+			company, as_dict=1):
+			rules.setdefault(d.get(apply_on_field), []).append(d)
+
+			if d.apply_rule_on_other is not None and d.get(other_field):
+				rules_on_other = other_rules.setdefault(d.get(other_field), [])
+				if not rules_on_other or rules_on_other[-1].name != d.name:
+					rules_on_other.append(d)
+
+	for parenttype in pricing_rule_tree_doctypes:
+		index.trees[parenttype] = dict((d.name, (d.lft, d.rgt)) for d in frappe.db.sql("""
+			select name, lft, rgt from `tab{0}`""".format(parenttype), as_dict=1))
+
+	return index
+
+def clear_pricing_rule_index(doc=None, method=None):
+	"""Called when a Pricing Rule, Promotional Scheme or a node of the tree doctypes changes"""
+	frappe.cache().delete_value("pricing_rule_index")
+	frappe.cache().set_value("pricing_rule_index_version", frappe.generate_hash(length=10))
+
 def apply_multiple_pricing_rules(pricing_rules):
 	apply_multiple_rule = [d.apply_multiple_pricing_rules
 		for d in pricing_rules if d.apply_multiple_pricing_rules]
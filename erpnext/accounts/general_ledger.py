@@ -3,18 +3,29 @@
 
 from __future__ import unicode_literals
 import frappe, erpnext
-from frappe.utils import flt, cstr, cint, comma_and
+from frappe.utils import flt, cstr, cint, comma_and, now
 from frappe import _
-from erpnext.accounts.utils import get_stock_and_account_balance
+from erpnext.accounts.utils import get_stock_and_account_balance, clear_balance_on_cache
 from frappe.model.meta import get_field_precision
 from erpnext.accounts.doctype.budget.budget import validate_expense_against_budget
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import (update_account_period_balances,
+	remove_vouchers_from_account_period_balances)
+from erpnext.accounts.doctype.payment_ledger_entry.payment_ledger_entry import (make_payment_ledger_entries,
+	delete_payment_ledger_entries)
+from erpnext.accounts.doctype.account_closing_balance.account_closing_balance import (update_closing_balances,
+	remove_vouchers_from_closing_balances)
+from erpnext.accounts.doctype.gl_entry.gl_entry import get_account_details_map, validate_inserted_entries
+from collections import OrderedDict
+from six import iteritems
 
 
 class ClosedAccountingPeriod(frappe.ValidationError): pass
 class StockAccountInvalidTransaction(frappe.ValidationError): pass
 class StockValueAndAccountBalanceOutOfSync(frappe.ValidationError): pass
 
+GL_ENTRY_INSERT_BATCH_SIZE = 500
+
 def make_gl_entries(gl_map, cancel=False, adv_adj=False, merge_entries=True, update_outstanding='Yes', from_repost=False):
 	if gl_map:
 		if not cancel:
@@ -74,12 +85,13 @@ def process_gl_map(gl_map, merge_entries=True):
 	return gl_map
 
 def merge_similar_entries(gl_map):
-	merged_gl_map = []
-	accounting_dimensions = get_accounting_dimensions()
+	merged_gl_map, merged_entries = [], {}
+	account_head_fieldnames = get_account_head_fieldnames(get_accounting_dimensions())
 	for entry in gl_map:
 		# if there is already an entry in this account then just add it
 		# to that entry
-		same_head = check_if_in_list(entry, merged_gl_map, accounting_dimensions)
+		key = get_merge_key(entry, account_head_fieldnames)
+		same_head = merged_entries.get(key)
 		if same_head:
 			same_head.debit	= flt(same_head.debit) + flt(entry.debit)
 			same_head.debit_in_account_currency	= \
@@ -88,6 +100,7 @@ def merge_similar_entries(gl_map):
 			same_head.credit_in_account_currency = \
 				flt(same_head.credit_in_account_currency) + flt(entry.credit_in_account_currency)
 		else:
+			merged_entries[key] = entry
 			merged_gl_map.append(entry)
 
 	company = gl_map[0].company if gl_map else erpnext.get_default_company()
@@ -100,13 +113,22 @@ def merge_similar_entries(gl_map):
 
 	return merged_gl_map
 
-def check_if_in_list(gle, gl_map, dimensions=None):
+def get_merge_key(gle, account_head_fieldnames):
+	"""Entries with the same key are merged into one"""
+	return tuple([cstr(gle.account)] + [cstr(gle.get(fieldname)) for fieldname in account_head_fieldnames])
+
+def get_account_head_fieldnames(dimensions=None):
 	account_head_fieldnames = ['party_type', 'party', 'against_voucher', 'against_voucher_type',
 		'cost_center', 'project']
 
 	if dimensions:
 		account_head_fieldnames = account_head_fieldnames + dimensions
 
+	return account_head_fieldnames
+
+def check_if_in_list(gle, gl_map, dimensions=None):
+	account_head_fieldnames = get_account_head_fieldnames(dimensions)
+
 	for e in gl_map:
 		same_head = True
 		if e.account != gle.account:
@@ -124,27 +146,132 @@ def save_entries(gl_map, adv_adj, update_outstanding, from_repost=False):
 		validate_cwip_accounts(gl_map)
 
 	round_off_debit_credit(gl_map)
-	for entry in gl_map:
-		make_entry(entry, adv_adj, update_outstanding, from_repost)
+	make_entries(gl_map, adv_adj, update_outstanding, from_repost)
 
-		# check against budget
-		if not from_repost:
+	# check against budget, the check does not depend on the amount of the entry
+	if not from_repost:
+		for entry in get_budget_entries(gl_map):
 			validate_expense_against_budget(entry)
 
 	if not from_repost:
 		validate_account_for_perpetual_inventory(gl_map)
 
+def make_entries(gl_map, adv_adj, update_outstanding, from_repost=False):
+	"""Validate the GL Entries of the voucher together and insert them in
+	multi-row statements.
+
+	The entries go through the checks and the controller and `doc_events`
+	methods of `Document.submit`, except that the links of all the entries
+	are checked together in `validate_links`"""
+	account_details = get_account_details_map([entry.account for entry in gl_map])
+
+	gl_entries = []
+	for entry in gl_map:
+		gle = frappe.new_doc("GL Entry")
+		gle.update(entry)
+		gle.flags.ignore_permissions = 1
+		gle.flags.from_repost = from_repost
+		gle.flags.account_details = account_details.get(gle.account) or frappe._dict()
+		gle.docstatus = 1
+		gle.run_method("before_insert")
+		gle.run_method("validate")
+		gle.run_method("before_submit")
+		gle._validate_mandatory()
+		gle._validate_length()
+		gle._validate_selects()
+		gl_entries.append(gle)
+
+	validate_links(gl_entries)
+	insert_gl_entries(gl_entries)
+
+	for gle in gl_entries:
+		gle.run_method("after_insert")
+		gle.run_method("on_update")
+		gle.run_method("on_submit")
+
+	validate_inserted_entries(gl_entries, adv_adj, update_outstanding, from_repost)
+
+	update_account_period_balances(gl_entries)
+	update_closing_balances(gl_entries)
+	make_payment_ledger_entries(gl_entries)
+	clear_balance_on_cache()
+
+	return gl_entries
 
 def make_entry(args, adv_adj, update_outstanding, from_repost=False):
-	gle = frappe.new_doc("GL Entry")
-	gle.update(args)
-	gle.flags.ignore_permissions = 1
-	gle.flags.from_repost = from_repost
-	gle.validate()
-	gle.db_insert()
-	gle.run_method("on_update_with_args", adv_adj, update_outstanding, from_repost)
-	gle.flags.ignore_validate = True
-	gle.submit()
+	return make_entries([args], adv_adj, update_outstanding, from_repost)[0]
+
+def validate_links(gl_entries):
+	"""Check that the Link and Dynamic Link values of the GL Entries exist and
+	are not cancelled, with one query per linked doctype"""
+	meta = frappe.get_meta("GL Entry")
+	link_fields = meta.get_link_fields() + meta.get_dynamic_link_fields()
+
+	links = OrderedDict()
+	for gle in gl_entries:
+		for df in link_fields:
+			value = gle.get(df.fieldname)
+			doctype = df.options if df.fieldtype == "Link" else gle.get(df.options)
+			if value and doctype:
+				links.setdefault(doctype, OrderedDict()).setdefault(cstr(value).lower(), (df, value))
+
+	for doctype, values in iteritems(links):
+		linked_meta = frappe.get_meta(doctype)
+		if linked_meta.issingle:
+			continue
+
+		names = list(values)
+		docstatus = {}
+		for start in range(0, len(names), GL_ENTRY_INSERT_BATCH_SIZE):
+			batch = [values[name][1] for name in names[start:start + GL_ENTRY_INSERT_BATCH_SIZE]]
+			for name, status in frappe.db.sql("""select name, docstatus from `tab{0}`
+				where name in ({1})""".format(doctype, ", ".join(["%s"] * len(batch))), tuple(batch)):
+				docstatus[cstr(name).lower()] = status
+
+		for name, (df, value) in iteritems(values):
+			if name not in docstatus:
+				frappe.throw(_("Could not find {0}: {1}").format(_(df.label), value), frappe.LinkValidationError)
+
+			if linked_meta.is_submittable and cint(docstatus[name]) == 2:
+				frappe.throw(_("Cannot link cancelled document: {0}: {1}").format(_(df.label), value),
+					frappe.CancelledLinkError)
+
+def insert_gl_entries(gl_entries):
+	"""Insert submitted GL Entries, `GL_ENTRY_INSERT_BATCH_SIZE` rows per statement"""
+	timestamp, user = now(), frappe.session.user
+
+	rows = []
+	for gle in gl_entries:
+		gle.autoname()
+		gle.owner = gle.modified_by = user
+		gle.creation = gle.modified = timestamp
+		gle.docstatus = 1
+		rows.append(gle.get_valid_dict(convert_dates_to_str=True))
+
+	columns = list(rows[0])
+	placeholders = "({0})".format(", ".join(["%s"] * len(columns)))
+
+	for start in range(0, len(rows), GL_ENTRY_INSERT_BATCH_SIZE):
+		batch = rows[start:start + GL_ENTRY_INSERT_BATCH_SIZE]
+		frappe.db.sql("""insert into `tabGL Entry` ({columns}) values {values}""".format(
+			columns=", ".join(["`{0}`".format(column) for column in columns]),
+			values=", ".join([placeholders] * len(batch))),
+			tuple(row.get(column) for row in batch for column in columns))
+
+def get_budget_entries(gl_map):
+	"""Entries of the gl_map with a distinct account, cost center, project and
+	accounting dimensions"""
+	fieldnames = ["company", "posting_date", "fiscal_year", "account", "cost_center", "project"] \
+		+ get_accounting_dimensions()
+
+	entries, keys = [], set()
+	for entry in gl_map:
+		key = tuple(cstr(entry.get(fieldname)) for fieldname in fieldnames)
+		if key not in keys:
+			keys.add(key)
+			entries.append(entry)
+
+	return entries
 
 def validate_account_for_perpetual_inventory(gl_map):
 	if cint(erpnext.is_perpetual_inventory_enabled(gl_map[0].company)) and gl_map[0].voucher_type=="Journal Entry":
@@ -300,8 +427,15 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 		validate_accounting_period(gl_entries)
 		check_freezing_date(gl_entries[0]["posting_date"], adv_adj)
 
+	voucher_type = voucher_type or gl_entries[0]["voucher_type"]
+	voucher_no = voucher_no or gl_entries[0]["voucher_no"]
+
+	remove_vouchers_from_account_period_balances([(voucher_type, voucher_no)])
+	remove_vouchers_from_closing_balances([(voucher_type, voucher_no)])
+	delete_payment_ledger_entries([(voucher_type, voucher_no)])
 	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
-		(voucher_type or gl_entries[0]["voucher_type"], voucher_no or gl_entries[0]["voucher_no"]))
+		(voucher_type, voucher_no))
+	clear_balance_on_cache()
 
 	for entry in gl_entries:
 		validate_frozen_account(entry["account"], adv_adj)
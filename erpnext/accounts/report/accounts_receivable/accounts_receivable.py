@@ -22,7 +22,8 @@ from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import g
 #  7. For overpayment against an invoice with payment terms, there will be an additional row
 #  8. Invoice details like Sales Persons, Delivery Notes are also fetched comma separated
 #  9. Report amounts are in "Party Currency" if party is selected, or company currency for multi-party
-# 10. This reports is based on all GL Entries that are made against account_type "Receivable" or "Payable"
+# 10. This reports is based on all GL Entries that are made against account_type "Receivable" or "Payable",
+#     read from the Payment Ledger Entries kept for them
 
 def execute(filters=None):
 	args = {
@@ -572,22 +573,30 @@ class ReceivablePayableReport(object):
 			date_condition = "AND posting_date <=%s"
 
 		if self.filters.get(scrub(self.party_type)):
-			select_fields = "debit_in_account_currency as debit, credit_in_account_currency as credit"
+			debit, credit = "debit_in_account_currency", "credit_in_account_currency"
 		else:
-			select_fields = "debit, credit"
+			debit, credit = "debit", "credit"
 
+		# entries of a voucher against the same voucher are summed in the query,
+		# debits and credits apart since they update different balances
 		self.gl_entries = frappe.db.sql("""
 			select
-				name, posting_date, account, party_type, party, voucher_type, voucher_no, cost_center,
-				against_voucher_type, against_voucher, account_currency, remarks, {0}
+				posting_date, account, party_type, party, voucher_type, voucher_no,
+				max(cost_center) as cost_center, against_voucher_type, against_voucher,
+				account_currency, max(remarks) as remarks,
+				sum({debit}) as debit, sum({credit}) as credit
 			from
-				`tabGL Entry`
+				`tabPayment Ledger Entry`
 			where
-				docstatus < 2
-				and party_type=%s
+				party_type=%s
 				and (party is not null and party != '')
-				{1} {2} {3}"""
-			.format(select_fields, date_condition, conditions, order_by), values, as_dict=True)
+				{date_condition} {conditions}
+			group by
+				voucher_type, voucher_no, against_voucher_type, against_voucher, party,
+				account, account_currency, posting_date, {debit} > {credit}
+			{order_by}"""
+			.format(debit=debit, credit=credit, date_condition=date_condition, conditions=conditions,
+				order_by=order_by), values, as_dict=True)
 
 	def get_sales_invoices_or_customers_based_on_sales_person(self):
 		if self.filters.get("sales_person"):
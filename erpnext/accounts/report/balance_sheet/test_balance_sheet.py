@@ -0,0 +1,20 @@
+from __future__ import unicode_literals
+
+import unittest
+from frappe.utils import nowdate, add_months
+from erpnext.accounts.utils import get_fiscal_year
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.tests.benchmarks.financial_statements import run
+
+class TestBalanceSheet(unittest.TestCase):
+	def test_entries_grouped_by_period(self):
+		for months in (0, -1, -2):
+			make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100,
+				posting_date=add_months(nowdate(), months), submit=True)
+
+		fiscal_year = get_fiscal_year(nowdate(), company="_Test Company")[0]
+
+		# the data with entries summed in the query is the same as with all the entries
+		for accumulated_values in (0, 1):
+			self.assertEqual(run(fiscal_year, fiscal_year, company="_Test Company",
+				accumulated_values=accumulated_values), 0)
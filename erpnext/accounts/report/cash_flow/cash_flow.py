@@ -8,6 +8,7 @@ from frappe.utils import cint, cstr
 from erpnext.accounts.report.financial_statements import (get_period_list, get_columns, get_data)
 from erpnext.accounts.report.profit_and_loss_statement.profit_and_loss_statement import get_net_profit_loss
 from erpnext.accounts.utils import get_fiscal_year
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import get_gl_entry_table
 
 
 def execute(filters=None):
@@ -139,11 +140,12 @@ def get_account_type_based_gl_data(company, start_date, end_date, account_type,
 
 	gl_sum = frappe.db.sql_list("""
 		select sum(credit) - sum(debit)
-		from `tabGL Entry`
+		from `tab{table}`
 		where company=%s and posting_date >= %s and posting_date <= %s
 			and voucher_type != 'Period Closing Voucher'
 			and account in ( SELECT name FROM tabAccount WHERE account_type = %s) {cond}
-	""".format(cond=cond), (company, start_date, end_date, account_type))
+	""".format(table=get_gl_entry_table([start_date], [end_date], filters), cond=cond),
+		(company, start_date, end_date, account_type))
 
 	return gl_sum[0] if gl_sum and gl_sum[0] else 0
 
@@ -2,11 +2,15 @@
 # For license information, please see license.txt
 
 from __future__ import unicode_literals
+import hashlib
 import frappe, erpnext
 from frappe import _
-from frappe.utils import flt, cint
+from frappe.utils import flt, cint, cstr, getdate
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from erpnext.accounts.report.utils import get_currency, convert_to_presentation_currency
 from erpnext.accounts.report.financial_statements import get_fiscal_year_data, sort_accounts
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import get_gl_entry_table
 from erpnext.accounts.report.balance_sheet.balance_sheet import (get_provisional_profit_loss,
 	check_opening_balance, get_chart_data)
 from erpnext.accounts.report.profit_and_loss_statement.profit_and_loss_statement import (get_net_profit_loss,
@@ -14,6 +18,11 @@ from erpnext.accounts.report.profit_and_loss_statement.profit_and_loss_statement
 from erpnext.accounts.report.cash_flow.cash_flow import (get_cash_flow_accounts, get_account_type_based_gl_data,
 	add_total_row_account)
 
+CONSOLIDATION_WORKERS = 4
+
+# balances are cached per company until its GL Entries change
+BALANCES_CACHE_EXPIRY = 24 * 60 * 60
+
 def execute(filters=None):
 	columns, data, message, chart = [], [], [], []
 
@@ -151,10 +160,10 @@ def get_cash_flow_data(fiscal_year, companies, filters):
 def get_account_type_based_data(account_type, companies, fiscal_year, filters):
 	data = {}
 	total = 0
-	for company in companies:
-		amount = get_account_type_based_gl_data(company,
-			fiscal_year.year_start_date, fiscal_year.year_end_date, account_type, filters)
+	amounts = run_for_companies(get_account_type_based_gl_data, [(company, fiscal_year.year_start_date,
+		fiscal_year.year_end_date, account_type, filters) for company in companies])
 
+	for company, amount in zip(companies, amounts):
 		if amount and account_type == "Depreciation":
 			amount *= -1
 
@@ -201,12 +210,8 @@ def get_data(companies, root_type, balance_must_be, fiscal_year, filters=None, i
 	company_currency = get_company_currency(filters)
 
 	gl_entries_by_account = {}
-	for root in frappe.db.sql("""select lft, rgt from tabAccount
-			where root_type=%s and ifnull(parent_account, '') = ''""", root_type, as_dict=1):
-
-		set_gl_entries_by_account(fiscal_year.year_start_date,
-			fiscal_year.year_end_date, root.lft, root.rgt, filters,
-			gl_entries_by_account, accounts_by_name, accounts, ignore_closing_entries=False)
+	set_gl_entries_by_account(fiscal_year.year_start_date, fiscal_year.year_end_date, root_type,
+		filters, gl_entries_by_account, accounts_by_name, accounts, ignore_closing_entries=False)
 
 	calculate_values(accounts_by_name, gl_entries_by_account, companies, fiscal_year, filters)
 	accumulate_values_into_parents(accounts, accounts_by_name, companies)
@@ -342,48 +347,31 @@ def prepare_data(accounts, fiscal_year, balance_must_be, companies, company_curr
 
 	return data
 
-def set_gl_entries_by_account(from_date, to_date, root_lft, root_rgt, filters, gl_entries_by_account,
+def set_gl_entries_by_account(from_date, to_date, root_type, filters, gl_entries_by_account,
 	accounts_by_name, accounts, ignore_closing_entries=False):
-	"""Returns a dict like { "account": [gl entries], ... }"""
+	"""Returns a dict like { "account": [gl entries], ... }, with the GL Entries
+	of each company summed per account"""
 
 	company_lft, company_rgt = frappe.get_cached_value('Company',
 		filters.get('company'),  ["lft", "rgt"])
 
-	additional_conditions = get_additional_conditions(from_date, ignore_closing_entries, filters)
 	companies = frappe.db.sql(""" select name, default_currency from `tabCompany`
 		where lft >= %(company_lft)s and rgt <= %(company_rgt)s""", {
 			"company_lft": company_lft,
 			"company_rgt": company_rgt,
 		}, as_dict=1)
 
-	currency_info = frappe._dict({
-		'report_date': to_date,
-		'presentation_currency': filters.get('presentation_currency')
+	args = frappe._dict({
+		"from_date": from_date,
+		"to_date": to_date,
+		"root_type": root_type,
+		"ignore_closing_entries": ignore_closing_entries,
+		"finance_book": filters.get("finance_book"),
+		"include_default_book_entries": filters.get("include_default_book_entries"),
+		"presentation_currency": filters.get("presentation_currency")
 	})
 
-	for d in companies:
-		gl_entries = frappe.db.sql("""select gl.posting_date, gl.account, gl.debit, gl.credit, gl.is_opening, gl.company,
-			gl.fiscal_year, gl.debit_in_account_currency, gl.credit_in_account_currency, gl.account_currency,
-			acc.account_name, acc.account_number
-			from `tabGL Entry` gl, `tabAccount` acc where acc.name = gl.account and gl.company = %(company)s
-			{additional_conditions} and gl.posting_date <= %(to_date)s and acc.lft >= %(lft)s and acc.rgt <= %(rgt)s
-			order by gl.account, gl.posting_date""".format(additional_conditions=additional_conditions),
-			{
-				"from_date": from_date,
-				"to_date": to_date,
-				"lft": root_lft,
-				"rgt": root_rgt,
-				"company": d.name,
-				"finance_book": filters.get("finance_book"),
-				"company_fb": frappe.db.get_value("Company", d.name, 'default_finance_book')
-			},
-			as_dict=True)
-
-		if filters and filters.get('presentation_currency') != d.default_currency:
-			currency_info['company'] = d.name
-			currency_info['company_currency'] = d.default_currency
-			convert_to_presentation_currency(gl_entries, currency_info)
-
+	for gl_entries in get_balances_of_companies(companies, args):
 		for entry in gl_entries:
 			account_name =  entry.account_name
 			validate_entries(account_name, entry, accounts_by_name, accounts)
@@ -391,6 +379,144 @@ def set_gl_entries_by_account(from_date, to_date, root_lft, root_rgt, filters, g
 
 	return gl_entries_by_account
 
+def get_balances_of_companies(companies, args):
+	"""Returns the balances of each company, from the cache if no GL Entry of
+	the company changed since they were cached, else computed in parallel"""
+	last_modification = get_last_modification([d.name for d in companies], args)
+
+	balances, pending = [None] * len(companies), []
+	for i, d in enumerate(companies):
+		key = get_balances_cache_key(d.name, args, last_modification.get(d.name))
+		balances[i] = frappe.cache().get_value(key)
+
+		if balances[i] is None:
+			pending.append((i, key))
+
+	computed_balances = run_for_companies(get_company_balances,
+		[(companies[i], args) for i, key in pending])
+
+	for (i, key), company_balances in zip(pending, computed_balances):
+		balances[i] = company_balances
+		frappe.cache().set_value(key, company_balances, expires_in_sec=BALANCES_CACHE_EXPIRY)
+
+	return balances
+
+def get_last_modification(companies, args):
+	"""Returns the last modification of the Account Period Balances of each
+	company, which changes whenever GL Entries are posted or deleted, along with
+	the last modification of its accounts and of the exchange rates used"""
+	if not companies:
+		return {}
+
+	condition = "company in ({0})".format(", ".join(["%s"] * len(companies)))
+
+	accounts_modified = dict(frappe.db.sql("""select company, max(modified) from `tabAccount`
+		where {0} group by company""".format(condition), tuple(companies)))
+
+	exchange_rates_modified = None
+	if args.presentation_currency:
+		exchange_rates_modified = frappe.db.sql("select max(modified) from `tabCurrency Exchange`")[0][0]
+
+	return {d[0]: (cstr(d[1]), cstr(accounts_modified.get(d[0])), cstr(exchange_rates_modified))
+		for d in frappe.db.sql("""
+			select company, max(modified)
+			from `tabAccount Period Balance`
+			where {0}
+			group by company""".format(condition), tuple(companies))}
+
+def get_balances_cache_key(company, args, last_modification):
+	return "consolidated_financial_statement_balances:" + hashlib.sha1(frappe.as_json([company,
+		args, last_modification]).encode("utf-8")).hexdigest()
+
+def run_for_companies(method, args_list):
+	"""Returns the results of `method` for each of the arguments, run in a pool
+	of threads with a site connection each"""
+	workers = min(cint(frappe.conf.consolidation_workers) or CONSOLIDATION_WORKERS, len(args_list))
+
+	# worker connections do not see the uncommitted data of tests
+	if workers < 2 or frappe.flags.in_test:
+		return [method(*args) for args in args_list]
+
+	site, sites_path, user = frappe.local.site, frappe.local.sites_path, frappe.session.user
+
+	pool = ThreadPool(workers)
+	try:
+		return pool.map(lambda args: run_in_thread(site, sites_path, user, method, args), args_list)
+	finally:
+		pool.close()
+		pool.join()
+
+def run_in_thread(site, sites_path, user, method, args):
+	frappe.init(site=site, sites_path=sites_path)
+	try:
+		frappe.connect()
+		frappe.set_user(user)
+		return method(*args)
+	finally:
+		frappe.destroy()
+
+def get_company_balances(company, args):
+	"""Returns the GL Entries of the company under the roots of `root_type`,
+	converted to the presentation currency and summed per account. Entries
+	before the from date are summed apart, for the opening balance"""
+	roots = frappe.db.sql("""select lft, rgt from tabAccount
+		where root_type=%s and company=%s and ifnull(parent_account, '') = ''""",
+		(args.root_type, company.name), as_dict=1)
+
+	if not roots:
+		return []
+
+	root_conditions = " or ".join(["(acc.lft >= {0} and acc.rgt <= {1})".format(cint(d.lft), cint(d.rgt))
+		for d in roots])
+	additional_conditions = get_additional_conditions(args.from_date, args.ignore_closing_entries, args)
+
+	# entries converted to the presentation currency need their own posting dates
+	table = "GL Entry"
+	if args.presentation_currency == company.default_currency:
+		table = get_gl_entry_table([args.from_date], [args.to_date])
+
+	gl_entries = frappe.db.sql("""select gl.posting_date, gl.account, gl.debit, gl.credit, gl.is_opening, gl.company,
+		gl.fiscal_year, gl.debit_in_account_currency, gl.credit_in_account_currency, gl.account_currency,
+		acc.account_name, acc.account_number
+		from `tab{table}` gl, `tabAccount` acc where acc.name = gl.account and gl.company = %(company)s
+		{additional_conditions} and gl.posting_date <= %(to_date)s and ({root_conditions})
+		order by gl.account, gl.posting_date""".format(table=table, additional_conditions=additional_conditions,
+			root_conditions=root_conditions),
+		{
+			"from_date": args.from_date,
+			"to_date": args.to_date,
+			"company": company.name,
+			"finance_book": args.finance_book,
+			"company_fb": frappe.db.get_value("Company", company.name, 'default_finance_book')
+		},
+		as_dict=True)
+
+	if args.presentation_currency != company.default_currency:
+		convert_to_presentation_currency(gl_entries, frappe._dict({
+			'report_date': args.to_date,
+			'presentation_currency': args.presentation_currency,
+			'company': company.name,
+			'company_currency': company.default_currency
+		}))
+
+	balances = OrderedDict()
+	for entry in gl_entries:
+		is_before_from_date = bool(args.from_date and entry.posting_date < getdate(args.from_date))
+		balance = balances.setdefault((entry.account, is_before_from_date), frappe._dict({
+			"account": entry.account,
+			"account_name": entry.account_name,
+			"account_number": entry.account_number,
+			"company": entry.company,
+			"posting_date": entry.posting_date,
+			"debit": 0.0,
+			"credit": 0.0
+		}))
+
+		balance.debit += flt(entry.debit)
+		balance.credit += flt(entry.credit)
+
+	return list(balances.values())
+
 def get_account_details(account):
 	return frappe.get_cached_value('Account', account, ['name', 'report_type', 'root_type', 'company',
 		'is_group', 'account_name', 'account_number', 'parent_account', 'lft', 'rgt'], as_dict=1)
@@ -0,0 +1,31 @@
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate, add_months
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.report.consolidated_financial_statement.consolidated_financial_statement import \
+	get_balances_of_companies
+
+class TestConsolidatedFinancialStatement(unittest.TestCase):
+	def test_cached_balances_are_recomputed_after_posting(self):
+		companies = frappe.db.sql("""select name, default_currency from `tabCompany`
+			where name='_Test Company'""", as_dict=1)
+		args = frappe._dict({
+			"from_date": add_months(nowdate(), -12),
+			"to_date": nowdate(),
+			"root_type": "Asset",
+			"ignore_closing_entries": False,
+			"presentation_currency": "INR"
+		})
+
+		balances = get_balances_of_companies(companies, args)[0]
+		self.assertEqual(get_balances_of_companies(companies, args)[0], balances)
+
+		make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100, submit=True)
+
+		self.assertEqual(get_balance(get_balances_of_companies(companies, args)[0], "_Test Bank - _TC"),
+			get_balance(balances, "_Test Bank - _TC") + 100)
+
+def get_balance(balances, account):
+	return sum(d.debit - d.credit for d in balances if d.account == account)
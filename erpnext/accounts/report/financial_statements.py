@@ -18,6 +18,8 @@ from frappe.utils import (flt, getdate, get_first_day, add_months, add_days, for
 
 from six import itervalues
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions, get_dimension_with_children
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import get_gl_entry_table
+from erpnext.accounts.doctype.account_closing_balance.account_closing_balance import get_latest_closing
 
 def get_period_list(from_fiscal_year, to_fiscal_year, periodicity, accumulated_values=False,
 	company=None, reset_period_on_fy_change=True):
@@ -127,7 +129,7 @@ def get_label(periodicity, from_date, to_date):
 def get_data(
 		company, root_type, balance_must_be, period_list, filters=None,
 		accumulated_values=1, only_current_fiscal_year=True, ignore_closing_entries=False,
-		ignore_accumulated_values_for_fy=False , total = True):
+		ignore_accumulated_values_for_fy=False , total = True, group_by_period=True):
 
 	accounts = get_accounts(company, root_type)
 	if not accounts:
@@ -146,7 +148,8 @@ def get_data(
 			period_list[0]["year_start_date"] if only_current_fiscal_year else None,
 			period_list[-1]["to_date"],
 			root.lft, root.rgt, filters,
-			gl_entries_by_account, ignore_closing_entries=ignore_closing_entries
+			gl_entries_by_account, ignore_closing_entries=ignore_closing_entries,
+			period_list=period_list, group_by_period=group_by_period
 		)
 
 	calculate_values(
@@ -342,17 +345,27 @@ def sort_accounts(accounts, is_root=False, key="name"):
 	accounts.sort(key = functools.cmp_to_key(compare_accounts))
 
 def set_gl_entries_by_account(
-		company, from_date, to_date, root_lft, root_rgt, filters, gl_entries_by_account, ignore_closing_entries=False):
-	"""Returns a dict like { "account": [gl entries], ... }"""
+		company, from_date, to_date, root_lft, root_rgt, filters, gl_entries_by_account, ignore_closing_entries=False,
+		period_list=None, group_by_period=True):
+	"""Returns a dict like { "account": [gl entries], ... }
+
+	The entries are read from the monthly Account Period Balances if the dates
+	and the periods in `period_list` are whole months. Balance Sheet entries
+	before the fiscal year are read from the closing balances of the last
+	Period Closing Voucher before it, if any.
+
+	If `group_by_period`, the entries are summed in the query, one entry per
+	account and period of `period_list` (and fiscal year and opening flag),
+	dated on the first posting date in the period"""
 
 	additional_conditions = get_additional_conditions(from_date, ignore_closing_entries, filters)
 
-	accounts = frappe.db.sql_list("""select name from `tabAccount`
-		where lft >= %s and rgt <= %s and company = %s""", (root_lft, root_rgt, company))
+	accounts = frappe.db.sql("""select name, report_type from `tabAccount`
+		where lft >= %s and rgt <= %s and company = %s""", (root_lft, root_rgt, company), as_dict=1)
 
 	if accounts:
 		additional_conditions += " and account in ({})"\
-			.format(", ".join([frappe.db.escape(d) for d in accounts]))
+			.format(", ".join([frappe.db.escape(d.name) for d in accounts]))
 
 		gl_filters = {
 			"company": company,
@@ -371,11 +384,38 @@ def set_gl_entries_by_account(
 					key: value
 				})
 
-		gl_entries = frappe.db.sql("""select posting_date, account, debit, credit, is_opening, fiscal_year, debit_in_account_currency, credit_in_account_currency, account_currency from `tabGL Entry`
-			where company=%(company)s
-			{additional_conditions}
-			and posting_date <= %(to_date)s
-			order by account, posting_date""".format(additional_conditions=additional_conditions), gl_filters, as_dict=True) #nosec
+		from_dates, to_dates = [from_date], [to_date]
+		if period_list:
+			from_dates += [period_list[0].get("year_start_date")] + [period.from_date for period in period_list]
+			to_dates += [period.to_date for period in period_list]
+
+		closing = get_closing_before_periods(company, from_date, period_list, accounts, ignore_closing_entries, filters)
+
+		tables = [(None, additional_conditions)]
+		if closing:
+			gl_filters.update({"closing_date": closing.posting_date, "period_closing_voucher": closing.name})
+			from_dates.append(add_days(closing.posting_date, 1))
+			tables = [("Account Closing Balance", additional_conditions + " and period_closing_voucher = %(period_closing_voucher)s"),
+				(None, additional_conditions + " and posting_date > %(closing_date)s")]
+
+		fields = """posting_date, account, debit, credit, is_opening, fiscal_year,
+			debit_in_account_currency, credit_in_account_currency, account_currency"""
+		group_by = ""
+
+		# entries converted to the presentation currency need their own posting dates
+		if period_list and group_by_period and not filters.get('presentation_currency'):
+			fields, group_by = get_period_wise_fields_and_group_by(period_list, gl_filters)
+
+		gl_entries = []
+		for table, conditions in tables:
+			gl_entries += frappe.db.sql("""select {fields} from `tab{table}`
+				where company=%(company)s
+				{additional_conditions}
+				and posting_date <= %(to_date)s
+				{group_by}
+				order by account, posting_date""".format(fields=fields,
+					table=table or get_gl_entry_table(from_dates, to_dates, filters),
+					additional_conditions=conditions, group_by=group_by), gl_filters, as_dict=True) #nosec
 
 		if filters and filters.get('presentation_currency'):
 			convert_to_presentation_currency(gl_entries, get_currency(filters))
@@ -386,6 +426,47 @@ def set_gl_entries_by_account(
 		return gl_entries_by_account
 
 
+def get_closing_before_periods(company, from_date, period_list, accounts, ignore_closing_entries, filters):
+	"""Returns the last Period Closing Voucher before the fiscal year of the periods
+	if the closing balances can replace the GL Entries up to it, that is for the
+	cumulative balances of Balance Sheet accounts including the closing entries"""
+	if from_date or not period_list or ignore_closing_entries or filters.get("presentation_currency"):
+		return
+
+	if any(d.report_type == "Profit and Loss" for d in accounts):
+		return
+
+	first_date = min(getdate(period_list[0].get("year_start_date") or period_list[0].from_date),
+		getdate(period_list[0].from_date))
+
+	return get_latest_closing(company, add_days(first_date, -1))
+
+def get_period_wise_fields_and_group_by(period_list, gl_filters):
+	"""Returns the fields and the group by clause to sum the GL Entries of
+	each account per period.
+
+	The periods are bounded by the start of the year and the end of each period.
+	Entries before the start of the year are summed together, the comparisons
+	in `calculate_values` give the same result for all the dates in a period"""
+	boundaries = [period_list[0].get("year_start_date") or period_list[0].from_date] \
+		+ [period.to_date for period in period_list]
+
+	period_conditions = []
+	for i, boundary in enumerate(boundaries):
+		gl_filters["period_boundary_{0}".format(i)] = boundary
+		period_conditions.append("when posting_date {0} %(period_boundary_{1})s then {1}"
+			.format("<" if i==0 else "<=", i))
+
+	period = "case {0} else {1} end".format(" ".join(period_conditions), len(boundaries))
+
+	fields = """min(posting_date) as posting_date, account, sum(debit) as debit, sum(credit) as credit,
+		is_opening, fiscal_year, sum(debit_in_account_currency) as debit_in_account_currency,
+		sum(credit_in_account_currency) as credit_in_account_currency, account_currency"""
+
+	group_by = "group by account, fiscal_year, is_opening, account_currency, {0}".format(period)
+
+	return fields, group_by
+
 def get_additional_conditions(from_date, ignore_closing_entries, filters):
 	additional_conditions = []
 
@@ -156,8 +156,34 @@ frappe.query_reports["General Ledger"] = {
 			"label": __("Include Default Book Entries"),
 			"fieldtype": "Check",
 			"default": 1
+		},
+		{
+			"fieldname": "page_length",
+			"label": __("Page Length"),
+			"fieldtype": "Int",
+			"default": 1000,
+			"hidden": 1
 		}
-	]
+	],
+	"onload": function(report) {
+		report.page.add_inner_button(__("Load More"), function() {
+			frappe.call({
+				method: "erpnext.accounts.report.general_ledger.general_ledger.get_next_general_ledger_page",
+				args: {
+					filters: report.get_filter_values()
+				},
+				freeze: true,
+				callback: function(r) {
+					if (r.message && r.message.result.length) {
+						report.data = report.data.concat(r.message.result);
+						report.datatable.appendRows(r.message.result);
+					} else {
+						frappe.show_alert(__("All the entries are loaded"));
+					}
+				}
+			});
+		});
+	}
 }
 
 erpnext.utils.add_dimensions('General Ledger', 15)
@@ -5,18 +5,41 @@ from __future__ import unicode_literals
 import frappe, erpnext
 from erpnext import get_company_currency, get_default_company
 from erpnext.accounts.report.utils import get_currency, convert_to_presentation_currency
-from frappe.utils import getdate, cstr, flt, fmt_money
+from frappe.utils import getdate, cstr, flt, cint, fmt_money
 from frappe import _, _dict
 from erpnext.accounts.utils import get_account_currency
 from erpnext.accounts.report.financial_statements import get_cost_centers_with_children
 from six import iteritems
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions, get_dimension_with_children
 from collections import OrderedDict
+import hashlib
+
+# number of GL Entries fetched per query by GeneralLedgerStream
+GL_CHUNK_SIZE = 5000
 
 def execute(filters=None):
 	if not filters:
 		return [], []
 
+	# the desk loads the report a page at a time, see `get_next_general_ledger_page`
+	page_length = cint(filters.get("page_length"))
+	cursor_key = get_cursor_key(filters) if page_length else None
+
+	filters, account_details = prepare_filters(filters)
+
+	columns = get_columns(filters)
+
+	if page_length:
+		stream = GeneralLedgerStream(filters, chunk_size=page_length)
+		res = stream.get_next_rows()
+		set_cursor(cursor_key, stream.get_cursor())
+		return columns, res
+
+	res = get_result(filters, account_details)
+
+	return columns, res
+
+def prepare_filters(filters):
 	account_details = {}
 
 	if filters and filters.get('print_in_account_currency') and \
@@ -35,11 +58,7 @@ def execute(filters=None):
 
 	filters = set_account_currency(filters)
 
-	columns = get_columns(filters)
-
-	res = get_result(filters, account_details)
-
-	return columns, res
+	return filters, account_details
 
 
 def validate_filters(filters, account_details):
@@ -283,22 +302,22 @@ def initialize_gle_map(gl_entries, filters):
 	return gle_map
 
 
+def update_value_in_dict(data, key, gle):
+	data[key].debit += flt(gle.debit)
+	data[key].credit += flt(gle.credit)
+
+	data[key].debit_in_account_currency += flt(gle.debit_in_account_currency)
+	data[key].credit_in_account_currency += flt(gle.credit_in_account_currency)
+
+	if data[key].against_voucher and gle.against_voucher:
+		data[key].against_voucher += ', ' + gle.against_voucher
+
 def get_accountwise_gle(filters, gl_entries, gle_map):
 	totals = get_totals_dict()
 	entries = []
 	consolidated_gle = OrderedDict()
 	group_by = group_by_field(filters.get('group_by'))
 
-	def update_value_in_dict(data, key, gle):
-		data[key].debit += flt(gle.debit)
-		data[key].credit += flt(gle.credit)
-
-		data[key].debit_in_account_currency += flt(gle.debit_in_account_currency)
-		data[key].credit_in_account_currency += flt(gle.credit_in_account_currency)
-
-		if data[key].against_voucher and gle.against_voucher:
-			data[key].against_voucher += ', ' + gle.against_voucher
-
 	from_date, to_date = getdate(filters.from_date), getdate(filters.to_date)
 	for gle in gl_entries:
 		if (gle.posting_date < from_date or
@@ -359,6 +378,393 @@ def get_balance(row, balance, debit_field, credit_field):
 
 	return balance
 
+class GeneralLedgerStream(object):
+	"""General Ledger rows built from keyset paginated chunks of GL Entries.
+
+	The running balance, the totals of the current group and the report totals
+	are carried from chunk to chunk, so the GL Entries are never loaded at once.
+	The groups are ordered by the group field, and the entries of a group by
+	posting date. `state` is the cursor returned by `get_cursor` after the
+	previous chunk."""
+
+	def __init__(self, filters, state=None, chunk_size=GL_CHUNK_SIZE):
+		self.filters = filters
+		self.chunk_size = chunk_size
+		self.conditions = get_conditions(filters)
+		self.group_by = group_by_field(filters.get("group_by"))
+		self.consolidated = filters.get("group_by") == _('Group by Voucher (Consolidated)')
+		self.show_group_opening = filters.get("group_by") != _("Group by Voucher")
+		self.currency_map = get_currency(filters) if filters.get("presentation_currency") else None
+
+		if filters.get("include_default_book_entries"):
+			filters['company_fb'] = frappe.db.get_value("Company",
+				filters.get("company"), 'default_finance_book')
+
+		# GL Entry names are random, entries are ordered as posted by creation
+		if self.consolidated:
+			self.sort_fields = ["posting_date", "voucher_type", "voucher_no", "account",
+				"ifnull(cost_center, '')", "creation", "name"]
+		elif self.group_by == "voucher_no":
+			self.sort_fields = ["posting_date", "voucher_type", "voucher_no", "creation", "name"]
+		elif self.group_by == "account":
+			self.sort_fields = ["ifnull(account, '')", "posting_date", "creation", "name"]
+		else:
+			self.sort_fields = ["ifnull({0}, '')".format(self.group_by), "posting_date", "account",
+				"creation", "name"]
+
+		state = _dict(state or {})
+		self.stage = state.stage or "start"
+		self.last_key = state.last_key
+		self.balance = flt(state.balance)
+		self.group = state.group
+		self.totals = load_totals(state.totals)
+		self.group_totals = load_totals(state.group_totals)
+		self.consolidated_entry = _dict(state.consolidated_entry) if state.consolidated_entry else None
+		self.group_openings = {}
+
+	def get_cursor(self):
+		"""Returns the state after the last chunk, None if all the rows are built"""
+		if self.stage == "done":
+			return None
+
+		return frappe.as_json({
+			"stage": self.stage,
+			"last_key": self.last_key,
+			"balance": self.balance,
+			"group": self.group,
+			"totals": self.totals,
+			"group_totals": self.group_totals,
+			"consolidated_entry": self.consolidated_entry
+		})
+
+	def iterate_rows(self):
+		"""Yields the rows of all the chunks"""
+		while self.stage != "done":
+			for row in self.get_next_rows():
+				yield row
+
+	def get_next_rows(self):
+		"""Returns the rows built from the next chunk of GL Entries, with the
+		opening rows before the first and the closing rows after the last chunk"""
+		rows = []
+
+		if self.stage == "start":
+			self.totals = get_totals_dict()
+			self.add_opening(self.totals, self.get_opening_totals())
+			self.append(rows, self.totals.opening)
+			self.stage = "entries"
+
+		if self.stage == "entries":
+			gl_entries, self.last_key = self.get_chunk(self.get_period_condition(), self.filters, self.last_key)
+			self.group_openings = self.get_group_openings(gl_entries)
+			for gle in gl_entries:
+				self.add_entry(rows, gle)
+
+			if len(gl_entries) < self.chunk_size:
+				self.stage = "end"
+
+		if self.stage == "end":
+			self.close_group(rows)
+
+			if not self.consolidated:
+				self.append(rows, {})
+
+			self.append(rows, self.totals.total)
+			self.append(rows, self.totals.closing)
+			self.stage = "done"
+
+		set_bill_no(rows)
+
+		return rows
+
+	def add_entry(self, rows, gle):
+		update_value_in_dict(self.totals, 'total', gle)
+		update_value_in_dict(self.totals, 'closing', gle)
+
+		if self.consolidated:
+			# entries of a voucher, account and cost center are consecutive
+			key = [gle.voucher_type, gle.voucher_no, gle.account, gle.cost_center]
+			if self.consolidated_entry and self.consolidated_entry.key == key:
+				update_value_in_dict(_dict(entry=self.consolidated_entry), 'entry', gle)
+			else:
+				self.close_group(rows)
+				self.consolidated_entry = _dict(gle, key=key)
+			return
+
+		if self.group_totals is None or gle.get(self.group_by) != self.group:
+			self.close_group(rows)
+			self.open_group(rows, gle.get(self.group_by))
+
+		update_value_in_dict(self.group_totals, 'total', gle)
+		update_value_in_dict(self.group_totals, 'closing', gle)
+		self.append(rows, gle)
+
+	def open_group(self, rows, group):
+		self.group = group
+		self.group_totals = get_totals_dict()
+
+		self.append(rows, {})
+		if self.show_group_opening:
+			self.add_opening(self.group_totals, self.group_openings.get(cstr(group).lower()) or get_opening_dict())
+			self.append(rows, self.group_totals.opening)
+
+	def close_group(self, rows):
+		if self.consolidated_entry:
+			entry = self.consolidated_entry
+			del entry["key"]
+			self.append(rows, entry)
+			self.consolidated_entry = None
+
+		elif self.group_totals is not None:
+			self.append(rows, self.group_totals.total)
+			if self.show_group_opening:
+				self.append(rows, self.group_totals.closing)
+			self.group_totals = None
+
+	def add_opening(self, totals, opening):
+		update_value_in_dict(totals, 'opening', opening)
+		update_value_in_dict(totals, 'closing', opening)
+
+	def append(self, rows, row):
+		# running balance, reset at the opening and total rows
+		if not row.get('posting_date'):
+			self.balance = 0
+
+		self.balance = get_balance(row, self.balance, 'debit', 'credit')
+		row['balance'] = self.balance
+		row['account_currency'] = self.filters.account_currency
+
+		rows.append(row)
+
+	def get_opening_condition(self):
+		if self.filters.get("show_opening_entries"):
+			return "posting_date < %(from_date)s"
+
+		return "(posting_date < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')"
+
+	def get_period_condition(self):
+		return "not {0} and posting_date <= %(to_date)s".format(self.get_opening_condition())
+
+	def get_opening_totals(self):
+		"""Returns the opening debit and credit of the report"""
+		return self.get_openings(self.get_opening_condition(), self.filters).get("") or get_opening_dict()
+
+	def get_group_openings(self, gl_entries):
+		"""Returns the opening debit and credit of the groups opened in the chunk,
+		as {lowercased group: opening}"""
+		if self.consolidated or not self.show_group_opening:
+			return {}
+
+		groups = set(cstr(gle.get(self.group_by)) for gle in gl_entries)
+		groups.discard(cstr(self.group) if self.group_totals is not None else None)
+		if not groups:
+			return {}
+
+		condition = self.get_opening_condition() + " and ifnull({0}, '') in %(gl_groups)s".format(self.group_by)
+		return self.get_openings(condition, dict(self.filters, gl_groups=tuple(groups)), self.group_by)
+
+	def get_openings(self, condition, values, group_by=None):
+		"""Returns the debit and credit of the GL Entries matching the condition,
+		as {lowercased value of the `group_by` field: opening}"""
+		group_field = "ifnull({0}, '')".format(group_by) if group_by else "''"
+		openings = {}
+
+		if not self.currency_map:
+			for gle in frappe.db.sql("""
+				select
+					{group_field} as gl_group,
+					sum(debit) as debit, sum(credit) as credit,
+					sum(debit_in_account_currency) as debit_in_account_currency,
+					sum(credit_in_account_currency) as credit_in_account_currency
+				from `tabGL Entry`
+				where company=%(company)s {conditions} and {condition}
+				group by {group_field}
+			""".format(group_field=group_field, conditions=self.conditions, condition=condition), values, as_dict=1):
+				opening = openings.setdefault(cstr(gle.gl_group).lower(), get_opening_dict())
+				update_value_in_dict(_dict(opening=opening), 'opening', gle)
+
+			return openings
+
+		# entries are converted to the presentation currency one by one
+		last_key = None
+		while True:
+			gl_entries, last_key = self.get_chunk(condition, values, last_key)
+			for gle in gl_entries:
+				opening = openings.setdefault(cstr(gle.get(group_by) if group_by else "").lower(), get_opening_dict())
+				update_value_in_dict(_dict(opening=opening), 'opening', gle)
+
+			if len(gl_entries) < self.chunk_size:
+				return openings
+
+	def get_chunk(self, condition, values, last_key=None):
+		"""Returns the next `chunk_size` GL Entries after `last_key` and the
+		sort key of the last of them"""
+		values = dict(values)
+		key_condition = ""
+		if last_key:
+			key_condition = "and ({0}) > ({1})".format(", ".join(self.sort_fields),
+				", ".join(["%(sort_key_{0})s".format(i) for i in range(len(self.sort_fields))]))
+			for i, value in enumerate(last_key):
+				values["sort_key_{0}".format(i)] = value
+
+		gl_entries = frappe.db.sql("""
+			select
+				name as gl_entry, posting_date, account, party_type, party,
+				voucher_type, voucher_no, cost_center, project,
+				against_voucher_type, against_voucher, account_currency,
+				remarks, against, is_opening, debit, credit, debit_in_account_currency,
+				credit_in_account_currency, {sort_keys}
+			from `tabGL Entry`
+			where company=%(company)s {conditions} and {condition} {key_condition}
+			order by {order_by}
+			limit {limit}
+		""".format(
+			sort_keys=", ".join(["{0} as sort_key_{1}".format(field, i) for i, field in enumerate(self.sort_fields)]),
+			conditions=self.conditions, condition=condition, key_condition=key_condition,
+			order_by=", ".join(self.sort_fields), limit=cint(self.chunk_size)
+		), values, as_dict=1)
+
+		if gl_entries:
+			last_key = [cstr(gl_entries[-1]["sort_key_{0}".format(i)]) for i in range(len(self.sort_fields))]
+
+		for gle in gl_entries:
+			for i in range(len(self.sort_fields)):
+				del gle["sort_key_{0}".format(i)]
+
+		if self.currency_map:
+			convert_to_presentation_currency(gl_entries, self.currency_map)
+
+		return gl_entries, last_key
+
+def get_opening_dict():
+	return _dict(debit=0.0, credit=0.0, debit_in_account_currency=0.0, credit_in_account_currency=0.0)
+
+def load_totals(totals):
+	if totals is None:
+		return None
+
+	return _dict((key, _dict(value)) for key, value in iteritems(totals))
+
+def set_bill_no(rows):
+	against_vouchers = list(set(d.get('against_voucher') for d in rows if d.get('against_voucher')))
+
+	inv_details = {}
+	if against_vouchers:
+		inv_details = dict(frappe.db.sql(""" select name, bill_no from `tabPurchase Invoice`
+			where docstatus = 1 and bill_no is not null and bill_no != ''
+			and name in ({0})""".format(", ".join(["%s"] * len(against_vouchers))), tuple(against_vouchers)))
+
+	for d in rows:
+		d['bill_no'] = inv_details.get(d.get('against_voucher'), '')
+
+@frappe.whitelist()
+def get_general_ledger_page(filters, cursor=None, page_length=None):
+	"""Returns the rows built from the next `page_length` GL Entries and the
+	cursor to get the next page with, None after the last page"""
+	check_permission()
+
+	filters, account_details = prepare_filters(_dict(frappe.parse_json(filters)))
+	stream = GeneralLedgerStream(filters, frappe.parse_json(cursor) if cursor else None,
+		cint(page_length) or GL_CHUNK_SIZE)
+
+	return {
+		"columns": get_columns(filters),
+		"result": stream.get_next_rows(),
+		"cursor": stream.get_cursor()
+	}
+
+@frappe.whitelist()
+def get_next_general_ledger_page(filters):
+	"""Returns the page of the General Ledger after the one last loaded in the
+	desk with the same filters, by `execute` or by this method"""
+	filters = _dict(frappe.parse_json(filters))
+	cursor_key = get_cursor_key(filters)
+
+	cursor = frappe.cache().get_value(cursor_key)
+	if not cursor:
+		return {"result": [], "cursor": None}
+
+	page = get_general_ledger_page(_dict(filters), cursor, filters.get("page_length"))
+	set_cursor(cursor_key, page["cursor"])
+
+	return page
+
+def get_cursor_key(filters):
+	return "general_ledger_cursor:{0}:{1}".format(frappe.session.user,
+		hashlib.md5(frappe.as_json(filters).encode("utf-8")).hexdigest())
+
+def set_cursor(cursor_key, cursor):
+	if cursor:
+		frappe.cache().set_value(cursor_key, cursor, expires_in_sec=3600)
+	else:
+		frappe.cache().delete_value(cursor_key)
+
+@frappe.whitelist()
+def export_general_ledger(filters, file_format="CSV"):
+	"""Export the General Ledger in a background job, the file is attached to
+	a private File and the user is notified when it is ready"""
+	check_permission()
+
+	if file_format not in ("CSV", "Excel"):
+		frappe.throw(_("Invalid file format {0}").format(file_format))
+
+	frappe.enqueue(make_general_ledger_file, queue="long", timeout=6000,
+		filters=filters, file_format=file_format, user=frappe.session.user)
+
+	frappe.msgprint(_("The General Ledger is being exported, you will be notified when the file is ready"))
+
+def make_general_ledger_file(filters, file_format, user):
+	"""Write the rows of the General Ledger to a file chunk by chunk"""
+	from frappe.utils.csvutils import UnicodeWriter
+
+	frappe.set_user(user)
+	filters, account_details = prepare_filters(_dict(frappe.parse_json(filters)))
+	columns = get_columns(filters)
+
+	file_name = "general_ledger_{0}.{1}".format(frappe.generate_hash(length=10),
+		"xlsx" if file_format == "Excel" else "csv")
+	path = frappe.get_site_path("private", "files", file_name)
+
+	stream = GeneralLedgerStream(filters)
+	header = [d["label"] for d in columns]
+
+	if file_format == "Excel":
+		from openpyxl import Workbook
+
+		# rows are written to a temporary file as they are added
+		workbook = Workbook(write_only=True)
+		sheet = workbook.create_sheet(_("General Ledger"))
+		sheet.append(header)
+		for row in stream.iterate_rows():
+			sheet.append([row.get(d["fieldname"]) for d in columns])
+		workbook.save(path)
+	else:
+		with open(path, "wb") as f:
+			writer = UnicodeWriter()
+			writer.writerow(header)
+			while stream.stage != "done":
+				for row in stream.get_next_rows():
+					writer.writerow([row.get(d["fieldname"]) for d in columns])
+
+				f.write(cstr(writer.getvalue()).encode("utf-8"))
+				writer = UnicodeWriter()
+
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": file_name,
+		"file_url": "/private/files/" + file_name,
+		"is_private": 1
+	})
+	file_doc.insert(ignore_permissions=True)
+	frappe.db.commit()
+
+	frappe.publish_realtime("msgprint", _("The General Ledger export is ready: {0}").format(
+		"<a href='{0}'>{1}</a>".format(file_doc.file_url, file_name)), user=user)
+
+def check_permission():
+	if not frappe.has_permission("GL Entry", "report"):
+		frappe.throw(_("Not permitted"), frappe.PermissionError)
+
 def get_columns(filters):
 	if filters.get("presentation_currency"):
 		currency = filters["presentation_currency"]
@@ -0,0 +1,69 @@
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate, add_days, flt
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.report.general_ledger.general_ledger import (execute, prepare_filters,
+	GeneralLedgerStream, get_next_general_ledger_page)
+
+class TestGeneralLedger(unittest.TestCase):
+	def test_streamed_rows(self):
+		for days in (-20, -10, -5, -1):
+			make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100 + days,
+				posting_date=add_days(nowdate(), days), submit=True)
+
+		filters = frappe._dict({
+			"company": "_Test Company",
+			"from_date": add_days(nowdate(), -15),
+			"to_date": nowdate(),
+			"account": "_Test Bank - _TC",
+			"group_by": "Group by Voucher"
+		})
+
+		columns, data = execute(frappe._dict(filters))
+
+		# chunks of 2 entries, resumed from the cursor after every chunk
+		streamed_data, cursor = [], None
+		while True:
+			stream = GeneralLedgerStream(prepare_filters(frappe._dict(filters))[0],
+				frappe.parse_json(cursor) if cursor else None, chunk_size=2)
+			streamed_data += stream.get_next_rows()
+			cursor = stream.get_cursor()
+			if not cursor:
+				break
+
+		self.assertEqual(len(streamed_data), len(data))
+		for row, streamed_row in zip(data, streamed_data):
+			self.assertEqual(row.get("gl_entry"), streamed_row.get("gl_entry"))
+			self.assertEqual(row.get("account"), streamed_row.get("account"))
+			self.assertEqual(flt(row.get("balance"), 2), flt(streamed_row.get("balance"), 2))
+
+	def test_paged_rows_with_group_openings(self):
+		for days in (-20, -10, -5, -1):
+			make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100 + days,
+				posting_date=add_days(nowdate(), days), submit=True)
+
+		filters = frappe._dict({
+			"company": "_Test Company",
+			"from_date": add_days(nowdate(), -15),
+			"to_date": nowdate(),
+			"group_by": "Group by Account"
+		})
+
+		columns, data = execute(frappe._dict(filters))
+
+		# first page from execute, the next pages as loaded by the desk
+		columns, paged_data = execute(frappe._dict(filters, page_length=1))
+		while True:
+			page = get_next_general_ledger_page(frappe.as_json(dict(filters, page_length=1)))
+			paged_data += page["result"]
+			if not page["cursor"]:
+				break
+
+		self.assertEqual(len(paged_data), len(data))
+		for row, paged_row in zip(data, paged_data):
+			self.assertEqual(row.get("gl_entry"), paged_row.get("gl_entry"))
+			self.assertEqual(row.get("account"), paged_row.get("account"))
+			self.assertEqual(flt(row.get("debit"), 2), flt(paged_row.get("debit"), 2))
+			self.assertEqual(flt(row.get("balance"), 2), flt(paged_row.get("balance"), 2))
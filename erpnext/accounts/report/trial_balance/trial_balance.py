@@ -8,6 +8,7 @@ from frappe.utils import flt, getdate, formatdate, cstr
 from erpnext.accounts.report.financial_statements \
 	import filter_accounts, set_gl_entries_by_account, filter_out_zero_value_rows
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions, get_dimension_with_children
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import get_gl_entry_table
 
 value_fields = ("opening_debit", "opening_credit", "debit", "credit", "closing_debit", "closing_credit")
 
@@ -74,8 +75,12 @@ def get_data(filters):
 	if filters.project:
 		filters.project = [filters.project]
 
+	# summed in the query, the entries between the dates form a single period
+	period_list = [frappe._dict(from_date=filters.from_date, to_date=filters.to_date)]
+
 	set_gl_entries_by_account(filters.company, filters.from_date,
-		filters.to_date, min_lft, max_rgt, filters, gl_entries_by_account, ignore_closing_entries=not flt(filters.with_period_closing_entry))
+		filters.to_date, min_lft, max_rgt, filters, gl_entries_by_account, ignore_closing_entries=not flt(filters.with_period_closing_entry),
+		period_list=period_list)
 
 	total_row = calculate_values(accounts, gl_entries_by_account, opening_balances, filters, company_currency)
 	accumulate_values_into_parents(accounts, accounts_by_name)
@@ -146,13 +151,14 @@ def get_rootwise_opening_balances(filters, report_type):
 	gle = frappe.db.sql("""
 		select
 			account, sum(debit) as opening_debit, sum(credit) as opening_credit
-		from `tabGL Entry`
+		from `tab{table}`
 		where
 			company=%(company)s
 			{additional_conditions}
 			and (posting_date < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')
 			and account in (select name from `tabAccount` where report_type=%(report_type)s)
-		group by account""".format(additional_conditions=additional_conditions), query_filters , as_dict=True)
+		group by account""".format(table=get_gl_entry_table([filters.from_date, filters.year_start_date], [], filters),
+			additional_conditions=additional_conditions), query_filters , as_dict=True)
 
 	opening = frappe._dict()
 	for d in gle:
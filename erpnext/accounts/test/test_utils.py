@@ -1,6 +1,10 @@
 from __future__ import unicode_literals
 import unittest
+import frappe
+from frappe.utils import nowdate, flt
 from erpnext.accounts.party import get_party_shipping_address
+from erpnext.accounts.utils import (get_balances_on, get_balance_on, get_fiscal_year,
+	get_balance_on_cache, clear_balance_on_cache)
 from frappe.test_runner import make_test_objects
 
 
@@ -18,6 +22,47 @@ class TestUtils(unittest.TestCase):
 		address = get_party_shipping_address('Customer', '_Test Customer 2')
 		self.assertEqual(address, '_Test Shipping Address 2 Title-Shipping')
 
+	def test_get_balances_on(self):
+		year_start_date = get_fiscal_year(nowdate(), company="_Test Company")[1]
+		balances = get_balances_on(["_Test Bank - _TC", "Current Assets - _TC",
+			"_Test Account Cost for Goods Sold - _TC"], nowdate(), in_account_currency=False)
+
+		self.assertEqual(balances["_Test Bank - _TC"], get_gl_balance("""
+			gle.account = '_Test Bank - _TC'"""))
+		self.assertEqual(balances["Current Assets - _TC"], get_gl_balance("""
+			gle.account in (select ac.name from `tabAccount` ac, `tabAccount` grp
+				where grp.name = 'Current Assets - _TC' and ac.lft >= grp.lft and ac.rgt <= grp.rgt)"""))
+		self.assertEqual(balances["_Test Account Cost for Goods Sold - _TC"], get_gl_balance("""
+			gle.account = '_Test Account Cost for Goods Sold - _TC' and gle.posting_date >= %s
+			and gle.voucher_type != 'Period Closing Voucher'""", year_start_date))
+
+	def test_balance_on_cache(self):
+		from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+
+		frappe.flags.cache_balance_on = True
+		clear_balance_on_cache()
+		try:
+			balance = get_balance_on("_Test Bank - _TC", nowdate())
+
+			# later lookups in the request are served from the cache
+			key = ("_Test Bank - _TC", nowdate(), None, None, None, True, None)
+			self.assertEqual(get_balance_on_cache().get(key), balance)
+			get_balance_on_cache()[key] = balance + 1000
+			self.assertEqual(get_balance_on("_Test Bank - _TC", nowdate()), balance + 1000)
+
+			# posting GL Entries clears the cache
+			make_journal_entry("_Test Bank - _TC", "_Test Account Cost for Goods Sold - _TC", 100, submit=True)
+			self.assertEqual(get_balance_on("_Test Bank - _TC", nowdate()), balance + 100)
+		finally:
+			frappe.flags.cache_balance_on = False
+			clear_balance_on_cache()
+			frappe.db.rollback()
+
+def get_gl_balance(condition, year_start_date=None):
+	return flt(frappe.db.sql("""select sum(debit) - sum(credit) from `tabGL Entry` gle
+		where gle.posting_date <= %s and {0}""".format(condition),
+		(nowdate(), year_start_date) if year_start_date else (nowdate(),))[0][0])
+
 
 ADDRESS_RECORDS = [
 	{
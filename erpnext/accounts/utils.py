@@ -10,11 +10,15 @@ from frappe.utils import nowdate, cstr, flt, cint, now, getdate
 from frappe import throw, _
 from frappe.utils import formatdate, get_number_format_info
 from six import iteritems
+from bisect import bisect_right
+from collections import OrderedDict
 # imported to enable erpnext.accounts.utils.get_account_currency
 from erpnext.accounts.doctype.account.account import get_account_currency
 
 from erpnext.stock.utils import get_stock_value_on
 from erpnext.stock import get_warehouse_account_map
+from erpnext.accounts.doctype.account_closing_balance.account_closing_balance import (get_latest_closing,
+	update_closing_balances)
 
 
 class FiscalYearError(frappe.ValidationError): pass
@@ -24,13 +28,84 @@ def get_fiscal_year(date=None, fiscal_year=None, label="Date", verbose=1, compan
 	return get_fiscal_years(date, fiscal_year, label, verbose, company, as_dict=as_dict)[0]
 
 def get_fiscal_years(transaction_date=None, fiscal_year=None, label="Date", verbose=1, company=None, as_dict=False):
+	fy = get_fiscal_year_index(company).find(transaction_date and getdate(transaction_date), fiscal_year)
+
+	if fy:
+		if as_dict:
+			return (frappe._dict(fy),)
+		else:
+			return ((fy.name, fy.year_start_date, fy.year_end_date),)
+
+	error_msg = _("""{0} {1} is not in any active Fiscal Year""").format(label, formatdate(transaction_date))
+	if company:
+		error_msg = _("""{0} for {1}""").format(error_msg, frappe.bold(company))
+		
+	if verbose==1: frappe.msgprint(error_msg)
+	raise FiscalYearError(error_msg)
+
+# fiscal year indexes of the process, by site and company
+fiscal_year_indexes = {}
+
+class FiscalYearIndex(object):
+	"""Active fiscal years of a company, sorted by start date for a binary
+	search of the year of a date"""
+	def __init__(self, fiscal_years):
+		# fiscal years are given latest first, the first year that matches is returned
+		self.position_by_name = {}
+		for position, fy in enumerate(fiscal_years):
+			self.position_by_name.setdefault(fy.name, position)
+
+		self.fiscal_years = fiscal_years
+		self.positions = sorted(range(len(fiscal_years)),
+			key=lambda position: (getdate(fiscal_years[position].year_start_date), -position))
+		self.start_ordinals = [getdate(fiscal_years[position].year_start_date).toordinal()
+			for position in self.positions]
+
+		# latest end date of the years starting up to each year, to stop the search
+		# as soon as no earlier year can contain the date
+		self.max_end_ordinals, max_end_ordinal = [], 0
+		for position in self.positions:
+			max_end_ordinal = max(max_end_ordinal, getdate(fiscal_years[position].year_end_date).toordinal())
+			self.max_end_ordinals.append(max_end_ordinal)
+
+	def find(self, date=None, fiscal_year=None):
+		"""Returns the first fiscal year, latest first, named `fiscal_year` or
+		containing the date"""
+		positions = []
+
+		if fiscal_year and fiscal_year in self.position_by_name:
+			positions.append(self.position_by_name[fiscal_year])
+
+		if date:
+			ordinal = date.toordinal()
+			i = bisect_right(self.start_ordinals, ordinal) - 1
+			while i >= 0 and self.max_end_ordinals[i] >= ordinal:
+				fy = self.fiscal_years[self.positions[i]]
+				if getdate(fy.year_end_date).toordinal() >= ordinal:
+					positions.append(self.positions[i])
+					break
+				i -= 1
+
+		if positions:
+			return self.fiscal_years[min(positions)]
+
+def get_fiscal_year_index(company=None):
+	"""Returns the fiscal year index of the company, kept in the process until
+	fiscal years are changed in any process"""
+	version = frappe.cache().get_value("fiscal_years_version", generator=frappe.generate_hash)
+	key = (getattr(frappe.local, "site", None), company)
+
+	if key not in fiscal_year_indexes or fiscal_year_indexes[key][0] != version:
+		fiscal_year_indexes[key] = (version, FiscalYearIndex(get_active_fiscal_years(company)))
+
+	return fiscal_year_indexes[key][1]
+
+def get_active_fiscal_years(company=None):
 	fiscal_years = frappe.cache().hget("fiscal_years", company) or []
 
 	if not fiscal_years:
 		# if year start date is 2012-04-01, year end date should be 2013-03-31 (hence subdate)
 		cond = ""
-		if fiscal_year:
-			cond += " and fy.name = {0}".format(frappe.db.escape(fiscal_year))
 		if company:
 			cond += """
 				and (not exists (select name
@@ -57,30 +132,12 @@ def get_fiscal_years(transaction_date=None, fiscal_year=None, label="Date", verb
 
 		frappe.cache().hset("fiscal_years", company, fiscal_years)
 
-	if transaction_date:
-		transaction_date = getdate(transaction_date)
-
-	for fy in fiscal_years:
-		matched = False
-		if fiscal_year and fy.name == fiscal_year:
-			matched = True
+	return fiscal_years
 
-		if (transaction_date and getdate(fy.year_start_date) <= transaction_date
-			and getdate(fy.year_end_date) >= transaction_date):
-			matched = True
-
-		if matched:
-			if as_dict:
-				return (fy,)
-			else:
-				return ((fy.name, fy.year_start_date, fy.year_end_date),)
-
-	error_msg = _("""{0} {1} is not in any active Fiscal Year""").format(label, formatdate(transaction_date))
-	if company:
-		error_msg = _("""{0} for {1}""").format(error_msg, frappe.bold(company))
-		
-	if verbose==1: frappe.msgprint(error_msg)
-	raise FiscalYearError(error_msg)
+def clear_fiscal_years_cache():
+	"""Clears the cached fiscal years, and the indexes of all processes with them"""
+	frappe.cache().delete_value("fiscal_years")
+	frappe.cache().set_value("fiscal_years_version", frappe.generate_hash())
 
 def validate_fiscal_year(date, fiscal_year, company, label="Date", doc=None):
 	years = [f[0] for f in get_fiscal_years(date, label=_(label), company=company)]
@@ -104,89 +161,209 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 	if not cost_center and frappe.form_dict.get("cost_center"):
 		cost_center = frappe.form_dict.get("cost_center")
 
-
-	cond = []
-	if date:
-		cond.append("posting_date <= %s" % frappe.db.escape(cstr(date)))
-	else:
-		# get balance of all entries that exist
-		date = nowdate()
-
 	if account:
-		acc = frappe.get_doc("Account", account)
+		return get_balances_on([account], date, party_type, party, company, in_account_currency,
+			cost_center, ignore_account_permission)[account]
 
-	try:
-		year_start_date = get_fiscal_year(date, company=company, verbose=0)[1]
-	except FiscalYearError:
-		if getdate(date) > getdate(nowdate()):
-			# if fiscal year not found and the date is greater than today
-			# get fiscal year for today's date and its corresponding year start date
-			year_start_date = get_fiscal_year(nowdate(), verbose=1)[1]
-		else:
-			# this indicates that it is a date older than any existing fiscal year.
-			# hence, assuming balance as 0.0
-			return 0.0
+	if party_type and party:
+		balance_on_cache = get_balance_on_cache()
+		key = (None, cstr(date), party_type, party, company, in_account_currency, cost_center)
 
-	if account:
-		report_type = acc.report_type
-	else:
-		report_type = ""
+		if key not in balance_on_cache:
+			balance_on_cache[key] = get_party_balance_on(date, party_type, party, company, in_account_currency)
 
-	if cost_center and report_type == 'Profit and Loss':
-		cc = frappe.get_doc("Cost Center", cost_center)
-		if cc.is_group:
-			cond.append(""" exists (
-				select 1 from `tabCost Center` cc where cc.name = gle.cost_center
-				and cc.lft >= %s and cc.rgt <= %s
-			)""" % (cc.lft, cc.rgt))
+		return balance_on_cache[key]
 
-		else:
-			cond.append("""gle.cost_center = %s """ % (frappe.db.escape(cost_center, percent=False), ))
+def get_balances_on(accounts, date=None, party_type=None, party=None, company=None,
+	in_account_currency=True, cost_center=None, ignore_account_permission=False):
+	"""Returns a dict of the balances of the accounts on the date, as returned by
+	`get_balance_on`. Balances not already memoised for the request are
+	queried together, grouped by account in one query per report type for
+	ledger and for group accounts"""
+	balance_on_cache = get_balance_on_cache()
+	balances, pending = {}, []
+
+	for account in accounts:
+		if not (frappe.flags.ignore_account_permission or ignore_account_permission):
+			frappe.get_cached_doc("Account", account).check_permission("read")
+
+		key = (account, cstr(date), party_type, party, company, in_account_currency, cost_center)
+		if key in balance_on_cache:
+			balances[account] = balance_on_cache[key]
+		elif account not in pending:
+			pending.append(account)
+
+	if pending:
+		for account, balance in iteritems(query_balances_on(pending, date, party_type, party, company,
+			in_account_currency, cost_center)):
+			key = (account, cstr(date), party_type, party, company, in_account_currency, cost_center)
+			balances[account] = balance_on_cache[key] = balance
+
+	return balances
+
+def query_balances_on(accounts, date, party_type, party, company, in_account_currency, cost_center):
+	balances = dict.fromkeys(accounts, 0.0)
+
+	year_start_date = get_balance_year_start_date(date, company)
+	if not year_start_date:
+		return balances
+
+	accounts_by_type = {}
+	for d in frappe.db.sql("""select name, report_type, is_group, account_currency, company
+		from `tabAccount` where name in %s""", (tuple(accounts),), as_dict=1):
+		is_pl_account = d.report_type == "Profit and Loss"
+		accounts_by_type.setdefault((is_pl_account, cint(d.is_group), None if is_pl_account else d.company),
+			[]).append(d)
+
+	for (is_pl_account, is_group, account_company), account_details in iteritems(accounts_by_type):
+		cond = []
+		if date:
+			cond.append("gle.posting_date <= %(date)s")
+
+		# balance sheet balances start from the closing balances of the last
+		# period closing, followed by the GL Entries after it
+		closing = None
+		if not is_pl_account and not (party_type and party):
+			closing = get_latest_closing(account_company, date)
+
+		tables = [("GL Entry", cond)]
+		if closing:
+			tables.append(("Account Closing Balance", ["gle.period_closing_voucher = %(period_closing_voucher)s"]))
+			cond.append("gle.posting_date > %(closing_date)s")
+
+		if is_pl_account:
+			# for pl accounts, get balance within a fiscal year
+			cond.append("gle.posting_date >= %(year_start_date)s and gle.voucher_type != 'Period Closing Voucher'")
 
+			if cost_center:
+				cond.append(get_cost_center_condition(cost_center))
 
-	if account:
+		if party_type and party:
+			cond.append("gle.party_type = %(party_type)s and gle.party = %(party)s")
 
-		if not (frappe.flags.ignore_account_permission
-			or ignore_account_permission):
-			acc.check_permission("read")
-
-		if report_type == 'Profit and Loss':
-			# for pl accounts, get balance within a fiscal year
-			cond.append("posting_date >= '%s' and voucher_type != 'Period Closing Voucher'" \
-				% year_start_date)
-		# different filter for group and ledger - improved performance
-		if acc.is_group:
-			cond.append("""exists (
-				select name from `tabAccount` ac where ac.name = gle.account
-				and ac.lft >= %s and ac.rgt <= %s
-			)""" % (acc.lft, acc.rgt))
+		if company:
+			for table, conditions in tables:
+				conditions.append("gle.company = %(company)s")
+
+		# different query for group and ledger - improved performance
+		if is_group:
+			query = """
+				select
+					grp.name,
+					sum(gle.debit) - sum(gle.credit),
+					sum(gle.debit_in_account_currency) - sum(gle.credit_in_account_currency)
+				from `tabAccount` grp
+					inner join `tabAccount` ac on ac.lft >= grp.lft and ac.rgt <= grp.rgt
+					inner join `tab{0}` gle on gle.account = ac.name
+				where grp.name in %(accounts)s {1}
+				group by grp.name"""
+		else:
+			query = """
+				select
+					gle.account,
+					sum(gle.debit) - sum(gle.credit),
+					sum(gle.debit_in_account_currency) - sum(gle.credit_in_account_currency)
+				from `tab{0}` gle
+				where gle.account in %(accounts)s {1}
+				group by gle.account"""
+
+		account_balances = {}
+		for table, conditions in tables:
+			for row in frappe.db.sql(query.format(table, "".join([" and " + c for c in conditions])), {
+				"accounts": tuple(d.name for d in account_details),
+				"date": date,
+				"year_start_date": year_start_date,
+				"party_type": party_type,
+				"party": party,
+				"company": company,
+				"closing_date": closing and closing.posting_date,
+				"period_closing_voucher": closing and closing.name
+			}):
+				balance = account_balances.setdefault(row[0], [0.0, 0.0])
+				balance[0] += flt(row[1])
+				balance[1] += flt(row[2])
+
+		for d in account_details:
+			balance, balance_in_account_currency = account_balances.get(d.name, (0.0, 0.0))
 
 			# If group and currency same as company,
 			# always return balance based on debit and credit in company currency
-			if acc.account_currency == frappe.get_cached_value('Company',  acc.company,  "default_currency"):
-				in_account_currency = False
-		else:
-			cond.append("""gle.account = %s """ % (frappe.db.escape(account, percent=False), ))
+			if in_account_currency and not (d.is_group and
+				d.account_currency == frappe.get_cached_value('Company', d.company, "default_currency")):
+				balances[d.name] = flt(balance_in_account_currency)
+			else:
+				balances[d.name] = flt(balance)
 
-	if party_type and party:
-		cond.append("""gle.party_type = %s and gle.party = %s """ %
-			(frappe.db.escape(party_type), frappe.db.escape(party, percent=False)))
+	return balances
+
+def get_party_balance_on(date, party_type, party, company, in_account_currency):
+	if not get_balance_year_start_date(date, company):
+		return 0.0
+
+	cond = ["gle.party_type = %(party_type)s and gle.party = %(party)s"]
+	if date:
+		cond.append("gle.posting_date <= %(date)s")
 
 	if company:
-		cond.append("""gle.company = %s """ % (frappe.db.escape(company, percent=False)))
+		cond.append("gle.company = %(company)s")
 
-	if account or (party_type and party):
-		if in_account_currency:
-			select_field = "sum(debit_in_account_currency) - sum(credit_in_account_currency)"
-		else:
-			select_field = "sum(debit) - sum(credit)"
-		bal = frappe.db.sql("""
-			SELECT {0}
-			FROM `tabGL Entry` gle
-			WHERE {1}""".format(select_field, " and ".join(cond)))[0][0]
+	if in_account_currency:
+		select_field = "sum(debit_in_account_currency) - sum(credit_in_account_currency)"
+	else:
+		select_field = "sum(debit) - sum(credit)"
 
-		# if bal is None, return 0
-		return flt(bal)
+	return flt(frappe.db.sql("""
+		SELECT {0}
+		FROM `tabGL Entry` gle
+		WHERE {1}""".format(select_field, " and ".join(cond)), {
+			"date": date,
+			"party_type": party_type,
+			"party": party,
+			"company": company
+		})[0][0])
+
+def get_balance_year_start_date(date, company=None):
+	"""Returns the start date of the fiscal year of the date, None if the date
+	is older than any fiscal year, since the balance is then zero"""
+	try:
+		return get_fiscal_year(date or nowdate(), company=company, verbose=0)[1]
+	except FiscalYearError:
+		if getdate(date or nowdate()) > getdate(nowdate()):
+			# if fiscal year not found and the date is greater than today
+			# get fiscal year for today's date and its corresponding year start date
+			return get_fiscal_year(nowdate(), verbose=1)[1]
+
+def get_cost_center_condition(cost_center):
+	cc = frappe.get_cached_value("Cost Center", cost_center, ["is_group", "lft", "rgt"], as_dict=1)
+	if cc.is_group:
+		return """gle.cost_center in (
+			select name from `tabCost Center` where lft >= {0} and rgt <= {1}
+		)""".format(cint(cc.lft), cint(cc.rgt))
+	else:
+		return "gle.cost_center = {0}".format(frappe.db.escape(cost_center, percent=False))
+
+def get_balance_on_cache():
+	"""Balances memoised for the request, cleared when GL Entries are posted or
+	deleted. Off in tests, unless `frappe.flags.cache_balance_on` is set"""
+	if frappe.flags.in_test and not frappe.flags.cache_balance_on:
+		return {}
+
+	if frappe.flags.balance_on_cache is None:
+		frappe.flags.balance_on_cache = {}
+
+	return frappe.flags.balance_on_cache
+
+def clear_balance_on_cache():
+	frappe.flags.balance_on_cache = None
+
+def get_vouchers_by_type(vouchers):
+	"""Returns the (voucher type, voucher no) pairs as {voucher type: [voucher nos]},
+	in the order of the vouchers, to query the vouchers of each type together"""
+	vouchers_by_type = OrderedDict()
+	for voucher_type, voucher_no in vouchers:
+		vouchers_by_type.setdefault(voucher_type, []).append(voucher_no)
+
+	return vouchers_by_type
 
 def get_count_on(account, fieldname, date):
 	cond = []
@@ -490,12 +667,13 @@ def unlink_ref_doc_from_payment_entries(ref_doc):
 	remove_ref_doc_link_from_jv(ref_doc.doctype, ref_doc.name)
 	remove_ref_doc_link_from_pe(ref_doc.doctype, ref_doc.name)
 
-	frappe.db.sql("""update `tabGL Entry`
-		set against_voucher_type=null, against_voucher=null,
-		modified=%s, modified_by=%s
-		where against_voucher_type=%s and against_voucher=%s
-		and voucher_no != ifnull(against_voucher, '')""",
-		(now(), frappe.session.user, ref_doc.doctype, ref_doc.name))
+	for doctype in ("GL Entry", "Payment Ledger Entry"):
+		frappe.db.sql("""update `tab{0}`
+			set against_voucher_type=null, against_voucher=null,
+			modified=%s, modified_by=%s
+			where against_voucher_type=%s and against_voucher=%s
+			and voucher_no != ifnull(against_voucher, '')""".format(doctype),
+			(now(), frappe.session.user, ref_doc.doctype, ref_doc.name))
 
 	if ref_doc.doctype in ("Sales Invoice", "Purchase Invoice"):
 		ref_doc.set("advances", [])
@@ -556,14 +734,30 @@ def fix_total_debit_credit():
 		group by voucher_type, voucher_no
 		having sum(debit) != sum(credit)""", as_dict=1)
 
+	# erpnext.accounts.doctype.account_period_balance imports this module
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance import update_account_period_balances
+
 	for d in vouchers:
 		if abs(d.diff) > 0:
 			dr_or_cr = d.voucher_type == "Sales Invoice" and "credit" or "debit"
 
-			frappe.db.sql("""update `tabGL Entry` set %s = %s + %s
-				where voucher_type = %s and voucher_no = %s and %s > 0 limit 1""" %
-				(dr_or_cr, dr_or_cr, '%s', '%s', '%s', dr_or_cr),
-				(d.diff, d.voucher_type, d.voucher_no))
+			gle = frappe.db.sql("""select * from `tabGL Entry`
+				where voucher_type = %s and voucher_no = %s and {0} > 0 limit 1""".format(dr_or_cr),
+				(d.voucher_type, d.voucher_no), as_dict=1)
+			if not gle:
+				continue
+
+			frappe.db.sql("""update `tabGL Entry` set {0} = {0} + %s where name = %s""".format(dr_or_cr),
+				(d.diff, gle[0].name))
+
+			# apply the same difference to the balances kept from the GL Entries
+			difference = frappe._dict(gle[0], debit=0, credit=0,
+				debit_in_account_currency=0, credit_in_account_currency=0)
+			difference[dr_or_cr] = d.diff
+			update_account_period_balances([difference])
+			update_closing_balances([difference])
+
+	clear_balance_on_cache()
 
 def get_stock_and_account_balance(account=None, posting_date=None, company=None):
 	if not posting_date: posting_date = nowdate()
@@ -662,7 +856,7 @@ def get_outstanding_invoices(party_type, party, account, condition=None, filters
 			ifnull(sum({dr_or_cr}), 0) as invoice_amount,
 			account_currency as currency
 		from
-			`tabGL Entry`
+			`tabPayment Ledger Entry`
 		where
 			party_type = %(party_type)s and party = %(party)s
 			and account = %(account)s and {dr_or_cr} > 0
@@ -683,7 +877,7 @@ def get_outstanding_invoices(party_type, party, account, condition=None, filters
 	payment_entries = frappe.db.sql("""
 		select against_voucher_type, against_voucher,
 			ifnull(sum({payment_dr_or_cr}), 0) as payment_amount
-		from `tabGL Entry`
+		from `tabPayment Ledger Entry`
 		where party_type = %(party_type)s and party = %(party)s
 			and account = %(account)s
 			and {payment_dr_or_cr} > 0
@@ -768,12 +962,17 @@ def get_children(doctype, parent, company, is_root=False):
 	if doctype == 'Account':
 		sort_accounts(acc, is_root, key="value")
 		company_currency = frappe.get_cached_value('Company',  company,  "default_currency")
+		balances = get_balances_on([each.get("value") for each in acc], in_account_currency=False,
+			company=company)
+		balances_in_account_currency = get_balances_on([each.get("value") for each in acc
+			if each.account_currency != company_currency], company=company)
+
 		for each in acc:
 			each["company_currency"] = company_currency
-			each["balance"] = flt(get_balance_on(each.get("value"), in_account_currency=False, company=company))
+			each["balance"] = flt(balances[each.get("value")])
 
 			if each.account_currency != company_currency:
-				each["balance_in_account_currency"] = flt(get_balance_on(each.get("value"), company=company))
+				each["balance_in_account_currency"] = flt(balances_in_account_currency[each.get("value")])
 
 	return acc
 
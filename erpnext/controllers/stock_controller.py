@@ -6,11 +6,18 @@ import frappe, erpnext
 from frappe.utils import cint, flt, cstr
 from frappe import _
 import frappe.defaults
-from erpnext.accounts.utils import get_fiscal_year
+from six import iteritems
+from erpnext.accounts.utils import get_fiscal_year, clear_balance_on_cache, get_vouchers_by_type
 from erpnext.accounts.general_ledger import make_gl_entries, delete_gl_entries, process_gl_map
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import \
+	remove_vouchers_from_account_period_balances
+from erpnext.accounts.doctype.account_closing_balance.account_closing_balance import \
+	remove_vouchers_from_closing_balances
+from erpnext.accounts.doctype.payment_ledger_entry.payment_ledger_entry import delete_payment_ledger_entries
 from erpnext.controllers.accounts_controller import AccountsController
 from erpnext.stock.stock_ledger import get_valuation_rate
 from erpnext.stock import get_warehouse_account_map
+from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import is_reposting_pending
 
 class QualityInspectionRequiredError(frappe.ValidationError): pass
 class QualityInspectionRejectedError(frappe.ValidationError): pass
@@ -38,8 +45,10 @@ class StockController(AccountsController):
 
 			if (repost_future_gle or self.flags.repost_future_gle):
 				items, warehouses = self.get_items_and_warehouses()
-				update_gl_entries_after(self.posting_date, self.posting_time, warehouses, items,
-					warehouse_account, company=self.company)
+				# future vouchers of back-dated entries are reposted by the repost job
+				if not is_reposting_pending(self.posting_date, self.posting_time, items, warehouses):
+					update_gl_entries_after(self.posting_date, self.posting_time, warehouses, items,
+						warehouse_account, company=self.company)
 		elif self.doctype in ['Purchase Receipt', 'Purchase Invoice'] and self.docstatus == 1:
 			gl_entries = []
 			gl_entries = self.get_asset_gl_entry(gl_entries)
@@ -389,27 +398,55 @@ class StockController(AccountsController):
 				d.allow_zero_valuation_rate = 1
 
 def update_gl_entries_after(posting_date, posting_time, for_warehouses=None, for_items=None,
-		warehouse_account=None, company=None):
-	def _delete_gl_entries(voucher_type, voucher_no):
-		frappe.db.sql("""delete from `tabGL Entry`
-			where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
+		warehouse_account=None, company=None, exclude_vouchers=None, future_stock_vouchers=None):
+	"""Repost the GL Entries of the future stock vouchers.
 
+	`future_stock_vouchers` are the vouchers whose stock value changed in the
+	repost of the stock ledger, if not set all the stock vouchers after the
+	posting datetime in the warehouses are compared"""
 	if not warehouse_account:
 		warehouse_account = get_warehouse_account_map(company)
 
-	future_stock_vouchers = get_future_stock_vouchers(posting_date, posting_time, for_warehouses, for_items)
+	if future_stock_vouchers is None:
+		future_stock_vouchers = get_future_stock_vouchers(posting_date, posting_time, for_warehouses, for_items)
+
 	gle = get_voucherwise_gl_entries(future_stock_vouchers, posting_date)
 
+	exclude_vouchers = [tuple(d) for d in exclude_vouchers or []]
+	vouchers_to_delete, vouchers_to_repost = [], []
 	for voucher_type, voucher_no in future_stock_vouchers:
+		if (voucher_type, voucher_no) in exclude_vouchers:
+			continue
+
 		existing_gle = gle.get((voucher_type, voucher_no), [])
 		voucher_obj = frappe.get_doc(voucher_type, voucher_no)
 		expected_gle = voucher_obj.get_gl_entries(warehouse_account)
 		if expected_gle:
 			if not existing_gle or not compare_existing_and_expected_gle(existing_gle, expected_gle):
-				_delete_gl_entries(voucher_type, voucher_no)
-				voucher_obj.make_gl_entries(gl_entries=expected_gle, repost_future_gle=False, from_repost=True)
+				vouchers_to_delete.append((voucher_type, voucher_no))
+				vouchers_to_repost.append((voucher_obj, expected_gle))
 		else:
-			_delete_gl_entries(voucher_type, voucher_no)
+			vouchers_to_delete.append((voucher_type, voucher_no))
+
+	delete_voucherwise_gl_entries(vouchers_to_delete)
+
+	for voucher_obj, expected_gle in vouchers_to_repost:
+		voucher_obj.make_gl_entries(gl_entries=expected_gle, repost_future_gle=False, from_repost=True)
+
+def delete_voucherwise_gl_entries(vouchers):
+	"""delete the GL Entries of the vouchers, one query per voucher type"""
+	remove_vouchers_from_account_period_balances(vouchers)
+	remove_vouchers_from_closing_balances(vouchers)
+	delete_payment_ledger_entries(vouchers)
+
+	vouchers_by_type = get_vouchers_by_type(vouchers)
+
+	for voucher_type, voucher_nos in iteritems(vouchers_by_type):
+		frappe.db.sql("""delete from `tabGL Entry`
+			where voucher_type=%s and voucher_no in ({0})""".format(", ".join(["%s"] * len(voucher_nos))),
+			tuple([voucher_type] + voucher_nos))
+
+	clear_balance_on_cache()
 
 def compare_existing_and_expected_gle(existing_gle, expected_gle):
 	matched = True
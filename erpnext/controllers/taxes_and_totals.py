@@ -158,23 +158,35 @@ class calculate_taxes_and_totals(object):
 		if not any((cint(tax.included_in_print_rate) for tax in self.doc.get("taxes"))):
 			return
 
-		for item in self.doc.get("items"):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
-			cumulated_tax_fraction = 0
-			total_inclusive_tax_amount_per_qty = 0
-			for i, tax in enumerate(self.doc.get("taxes")):
-				tax.tax_fraction_for_current_item, inclusive_tax_amount_per_qty = self.get_current_tax_fraction(tax, item_tax_map)
-
-				if i==0:
-					tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
-				else:
-					tax.grand_total_fraction_for_current_item = \
-						self.doc.get("taxes")[i-1].grand_total_fraction_for_current_item \
-						+ tax.tax_fraction_for_current_item
+		items = self.doc.get("items")
+		item_tax_maps = [self._load_item_tax_rate(item.item_tax_rate) for item in items]
+		cumulated_tax_fractions = [0] * len(items)
+		total_inclusive_tax_amounts_per_qty = [0] * len(items)
+
+		# fractions of each tax row for all the items, used by the later rows
+		tax_fractions, grand_total_fractions = [], []
+		for i, tax in enumerate(self.doc.get("taxes")):
+			current_tax_fractions, inclusive_tax_amounts_per_qty = self.get_current_tax_fractions(tax,
+				item_tax_maps, tax_fractions, grand_total_fractions)
+
+			if i==0:
+				current_grand_total_fractions = [1 + d for d in current_tax_fractions]
+			else:
+				current_grand_total_fractions = [previous + d for previous, d
+					in zip(grand_total_fractions[i-1], current_tax_fractions)]
+
+			for n, item in enumerate(items):
+				cumulated_tax_fractions[n] += current_tax_fractions[n]
+				total_inclusive_tax_amounts_per_qty[n] += inclusive_tax_amounts_per_qty[n] * flt(item.qty)
 
-				cumulated_tax_fraction += tax.tax_fraction_for_current_item
-				total_inclusive_tax_amount_per_qty += inclusive_tax_amount_per_qty * flt(item.qty)
+			tax_fractions.append(current_tax_fractions)
+			grand_total_fractions.append(current_grand_total_fractions)
 
+			tax.tax_fraction_for_current_item = current_tax_fractions[-1]
+			tax.grand_total_fraction_for_current_item = current_grand_total_fractions[-1]
+
+		for item, cumulated_tax_fraction, total_inclusive_tax_amount_per_qty in zip(items,
+			cumulated_tax_fractions, total_inclusive_tax_amounts_per_qty):
 			if not self.discount_amount_applied and item.qty and (cumulated_tax_fraction or total_inclusive_tax_amount_per_qty):
 				amount = flt(item.amount) - total_inclusive_tax_amount_per_qty
 
@@ -188,36 +200,36 @@ class calculate_taxes_and_totals(object):
 	def _load_item_tax_rate(self, item_tax_rate):
 		return json.loads(item_tax_rate) if item_tax_rate else {}
 
-	def get_current_tax_fraction(self, tax, item_tax_map):
+	def get_current_tax_fractions(self, tax, item_tax_maps, tax_fractions, grand_total_fractions):
 		"""
-			Get tax fraction for calculating tax exclusive amount
+			Get tax fraction of each item for calculating tax exclusive amount
 			from tax inclusive amount
 		"""
-		current_tax_fraction = 0
-		inclusive_tax_amount_per_qty = 0
+		current_tax_fractions = [0] * len(item_tax_maps)
+		inclusive_tax_amounts_per_qty = [0] * len(item_tax_maps)
 
 		if cint(tax.included_in_print_rate):
-			tax_rate = self._get_tax_rate(tax, item_tax_map)
+			tax_rates = [self._get_tax_rate(tax, item_tax_map) for item_tax_map in item_tax_maps]
 
 			if tax.charge_type == "On Net Total":
-				current_tax_fraction = tax_rate / 100.0
+				current_tax_fractions = [tax_rate / 100.0 for tax_rate in tax_rates]
 
 			elif tax.charge_type == "On Previous Row Amount":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.doc.get("taxes")[cint(tax.row_id) - 1].tax_fraction_for_current_item
+				current_tax_fractions = [(tax_rate / 100.0) * d for tax_rate, d
+					in zip(tax_rates, tax_fractions[cint(tax.row_id) - 1])]
 
 			elif tax.charge_type == "On Previous Row Total":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+				current_tax_fractions = [(tax_rate / 100.0) * d for tax_rate, d
+					in zip(tax_rates, grand_total_fractions[cint(tax.row_id) - 1])]
 
 			elif tax.charge_type == "On Item Quantity":
-				inclusive_tax_amount_per_qty = flt(tax_rate)
+				inclusive_tax_amounts_per_qty = [flt(tax_rate) for tax_rate in tax_rates]
 
 		if getattr(tax, "add_deduct_tax", None) and tax.add_deduct_tax == "Deduct":
-			current_tax_fraction *= -1.0
-			inclusive_tax_amount_per_qty *= -1.0
+			current_tax_fractions = [d * -1.0 for d in current_tax_fractions]
+			inclusive_tax_amounts_per_qty = [d * -1.0 for d in inclusive_tax_amounts_per_qty]
 
-		return current_tax_fraction, inclusive_tax_amount_per_qty
+		return current_tax_fractions, inclusive_tax_amounts_per_qty
 
 	def _get_tax_rate(self, tax, item_tax_map):
 		if tax.account_head in item_tax_map:
@@ -246,54 +258,62 @@ class calculate_taxes_and_totals(object):
 		actual_tax_dict = dict([[tax.idx, flt(tax.tax_amount, tax.precision("tax_amount"))]
 			for tax in self.doc.get("taxes") if tax.charge_type == "Actual"])
 
-		for n, item in enumerate(self.doc.get("items")):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
-			for i, tax in enumerate(self.doc.get("taxes")):
-				# tax_amount represents the amount of tax for the current step
-				current_tax_amount = self.get_current_tax_amount(item, tax, item_tax_map)
+		items = self.doc.get("items")
+		item_tax_maps = [self._load_item_tax_rate(item.item_tax_rate) for item in items]
+
+		# taxes are calculated row by row, for all the items at once;
+		# amounts of each tax row for all the items, used by the later rows
+		tax_amounts, grand_totals = [], []
+		for i, tax in enumerate(self.doc.get("taxes")):
+			# tax_amount represents the amount of tax for the current step
+			current_tax_amounts = self.get_current_tax_amounts(tax, item_tax_maps, tax_amounts, grand_totals)
 
-				# Adjust divisional loss to the last item
-				if tax.charge_type == "Actual":
+			# Adjust divisional loss to the last item
+			if tax.charge_type == "Actual":
+				for current_tax_amount in current_tax_amounts:
 					actual_tax_dict[tax.idx] -= current_tax_amount
-					if n == len(self.doc.get("items")) - 1:
-						current_tax_amount += actual_tax_dict[tax.idx]
+				current_tax_amounts[-1] += actual_tax_dict[tax.idx]
 
-				# accumulate tax amount into tax.tax_amount
-				if tax.charge_type != "Actual" and \
-					not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
+			# accumulate tax amount into tax.tax_amount
+			if tax.charge_type != "Actual" and \
+				not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
+					for current_tax_amount in current_tax_amounts:
 						tax.tax_amount += current_tax_amount
 
-				# store tax_amount for current item as it will be used for
-				# charge type = 'On Previous Row Amount'
-				tax.tax_amount_for_current_item = current_tax_amount
-
-				# set tax after discount
+			# set tax after discount
+			for current_tax_amount in current_tax_amounts:
 				tax.tax_amount_after_discount_amount += current_tax_amount
 
-				current_tax_amount = self.get_tax_amount_if_for_valuation_or_deduction(current_tax_amount, tax)
+			# note: grand_total_for_current_item contains the contribution of
+			# item's amount, previously applied tax and the current tax on that item
+			if i==0:
+				current_grand_totals = [flt(item.net_amount + self.get_tax_amount_if_for_valuation_or_deduction(d, tax))
+					for item, d in zip(items, current_tax_amounts)]
+			else:
+				current_grand_totals = [flt(previous + self.get_tax_amount_if_for_valuation_or_deduction(d, tax))
+					for previous, d in zip(grand_totals[i-1], current_tax_amounts)]
+
+			# store tax_amount for each item as it will be used for
+			# charge type = 'On Previous Row Amount'
+			tax_amounts.append(current_tax_amounts)
+			grand_totals.append(current_grand_totals)
 
-				# note: grand_total_for_current_item contains the contribution of
-				# item's amount, previously applied tax and the current tax on that item
-				if i==0:
-					tax.grand_total_for_current_item = flt(item.net_amount + current_tax_amount)
-				else:
-					tax.grand_total_for_current_item = \
-						flt(self.doc.get("taxes")[i-1].grand_total_for_current_item + current_tax_amount)
+			tax.tax_amount_for_current_item = current_tax_amounts[-1]
+			tax.grand_total_for_current_item = current_grand_totals[-1]
 
-				# set precision in the last item iteration
-				if n == len(self.doc.get("items")) - 1:
-					self.round_off_totals(tax)
-					self.set_cumulative_total(i, tax)
+			# set precision
+			self.round_off_totals(tax)
+			self.set_cumulative_total(i, tax)
 
-					self._set_in_company_currency(tax,
-						["total", "tax_amount", "tax_amount_after_discount_amount"])
+			self._set_in_company_currency(tax,
+				["total", "tax_amount", "tax_amount_after_discount_amount"])
 
-					# adjust Discount Amount loss in last tax iteration
-					if i == (len(self.doc.get("taxes")) - 1) and self.discount_amount_applied \
-						and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
-							self.doc.rounding_adjustment = flt(self.doc.grand_total
-								- flt(self.doc.discount_amount) - tax.total,
-								self.doc.precision("rounding_adjustment"))
+			# adjust Discount Amount loss in last tax iteration
+			if i == (len(self.doc.get("taxes")) - 1) and self.discount_amount_applied \
+				and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
+					self.doc.rounding_adjustment = flt(self.doc.grand_total
+						- flt(self.doc.discount_amount) - tax.total,
+						self.doc.precision("rounding_adjustment"))
 
 	def get_tax_amount_if_for_valuation_or_deduction(self, tax_amount, tax):
 		# if just for valuation, do not add the tax amount in total
@@ -313,29 +333,34 @@ class calculate_taxes_and_totals(object):
 		else:
 			tax.total = flt(self.doc.get("taxes")[row_idx-1].total + tax_amount, tax.precision("total"))
 
-	def get_current_tax_amount(self, item, tax, item_tax_map):
-		tax_rate = self._get_tax_rate(tax, item_tax_map)
-		current_tax_amount = 0.0
+	def get_current_tax_amounts(self, tax, item_tax_maps, tax_amounts, grand_totals):
+		items = self.doc.get("items")
+		tax_rates = [self._get_tax_rate(tax, item_tax_map) for item_tax_map in item_tax_maps]
 
 		if tax.charge_type == "Actual":
 			# distribute the tax amount proportionally to each item row
 			actual = flt(tax.tax_amount, tax.precision("tax_amount"))
-			current_tax_amount = item.net_amount*actual / self.doc.net_total if self.doc.net_total else 0.0
+			current_tax_amounts = [item.net_amount*actual / self.doc.net_total if self.doc.net_total else 0.0
+				for item in items]
 
 		elif tax.charge_type == "On Net Total":
-			current_tax_amount = (tax_rate / 100.0) * item.net_amount
+			current_tax_amounts = [(tax_rate / 100.0) * item.net_amount
+				for tax_rate, item in zip(tax_rates, items)]
 		elif tax.charge_type == "On Previous Row Amount":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.doc.get("taxes")[cint(tax.row_id) - 1].tax_amount_for_current_item
+			current_tax_amounts = [(tax_rate / 100.0) * d
+				for tax_rate, d in zip(tax_rates, tax_amounts[cint(tax.row_id) - 1])]
 		elif tax.charge_type == "On Previous Row Total":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_for_current_item
+			current_tax_amounts = [(tax_rate / 100.0) * d
+				for tax_rate, d in zip(tax_rates, grand_totals[cint(tax.row_id) - 1])]
 		elif tax.charge_type == "On Item Quantity":
-			current_tax_amount = tax_rate * item.qty
+			current_tax_amounts = [tax_rate * item.qty for tax_rate, item in zip(tax_rates, items)]
+		else:
+			current_tax_amounts = [0.0] * len(items)
 
-		self.set_item_wise_tax(item, tax, tax_rate, current_tax_amount)
+		for item, tax_rate, current_tax_amount in zip(items, tax_rates, current_tax_amounts):
+			self.set_item_wise_tax(item, tax, tax_rate, current_tax_amount)
 
-		return current_tax_amount
+		return current_tax_amounts
 
 	def set_item_wise_tax(self, item, tax, tax_rate, current_tax_amount):
 		# store tax breakup for each item
@@ -239,6 +239,10 @@ doc_events = {
 	"Website Settings": {
 		"validate": "erpnext.portal.doctype.products_settings.products_settings.home_page_is_products"
 	},
+	("Pricing Rule", "Promotional Scheme", "Item Group", "Customer Group", "Territory", "Supplier Group", "Warehouse"): {
+		"on_change": "erpnext.accounts.doctype.pricing_rule.utils.clear_pricing_rule_index",
+		"on_trash": "erpnext.accounts.doctype.pricing_rule.utils.clear_pricing_rule_index"
+	},
 	"Tax Category": {
 		"validate": "erpnext.regional.india.utils.validate_tax_category"
 	},
@@ -290,6 +294,9 @@ scheduler_events = {
 		"erpnext.hr.doctype.shift_type.shift_type.process_auto_attendance_for_all_shifts",
 		"erpnext.support.doctype.issue.issue.set_service_level_agreement_variance",
 	],
+	"hourly_long": [
+		"erpnext.stock.doctype.repost_item_valuation.repost_item_valuation.repost_entries"
+	],
 	"daily": [
 		"erpnext.stock.reorder_item.reorder_item",
 		"erpnext.support.doctype.issue.issue.auto_close_tickets",
@@ -323,7 +330,8 @@ scheduler_events = {
 	"monthly_long": [
 		"erpnext.accounts.deferred_revenue.convert_deferred_revenue_to_income",
 		"erpnext.accounts.deferred_revenue.convert_deferred_expense_to_expense",
-		"erpnext.hr.utils.allocate_earned_leaves"
+		"erpnext.hr.utils.allocate_earned_leaves",
+		"erpnext.stock.doctype.stock_closing_balance.stock_closing_balance.create_closing_balances"
 	]
 }
 
@@ -0,0 +1,11 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import \
+	create_accounting_dimensions_for_doctype
+from erpnext.accounts.doctype.account_closing_balance.account_closing_balance import rebuild_closing_balances
+
+def execute():
+	frappe.reload_doc('accounts', 'doctype', 'account_closing_balance')
+	create_accounting_dimensions_for_doctype("Account Closing Balance")
+
+	rebuild_closing_balances()
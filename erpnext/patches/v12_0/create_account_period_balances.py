@@ -0,0 +1,11 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import \
+	create_accounting_dimensions_for_doctype
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import rebuild_account_period_balances
+
+def execute():
+	frappe.reload_doc('accounts', 'doctype', 'account_period_balance')
+	create_accounting_dimensions_for_doctype("Account Period Balance")
+
+	rebuild_account_period_balances()
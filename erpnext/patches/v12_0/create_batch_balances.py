@@ -0,0 +1,8 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.stock.doctype.batch_balance.batch_balance import reconcile_batch_balances
+
+def execute():
+	frappe.reload_doc('stock', 'doctype', 'batch_balance')
+
+	reconcile_batch_balances()
@@ -0,0 +1,11 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import \
+	create_accounting_dimensions_for_doctype
+from erpnext.accounts.doctype.payment_ledger_entry.payment_ledger_entry import rebuild_payment_ledger
+
+def execute():
+	frappe.reload_doc('accounts', 'doctype', 'payment_ledger_entry')
+	create_accounting_dimensions_for_doctype("Payment Ledger Entry")
+
+	rebuild_payment_ledger()
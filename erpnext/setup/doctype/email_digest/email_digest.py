@@ -10,7 +10,7 @@ from datetime import timedelta
 from dateutil.relativedelta import relativedelta
 from frappe.core.doctype.user.user import STANDARD_USERS
 import frappe.desk.notifications
-from erpnext.accounts.utils import get_balance_on, get_count_on, get_fiscal_year
+from erpnext.accounts.utils import get_balance_on, get_balances_on, get_count_on, get_fiscal_year
 
 user_specific_content = ["calendar_events", "todo_list"]
 
@@ -326,8 +326,11 @@ class EmailDigest(Document):
 		balance = 0.0
 		count = 0
 
-		for account in self.get_root_type_accounts(root_type):
-			balance += get_balance_on(account, date = self.future_to_date)
+		accounts = self.get_root_type_accounts(root_type)
+		balances = get_balances_on(accounts, date = self.future_to_date)
+
+		for account in accounts:
+			balance += balances[account]
 			count += get_count_on(account, fieldname, date = self.future_to_date)
 
 		if fieldname == 'income':
@@ -513,10 +516,13 @@ class EmailDigest(Document):
 
 		balance = prev_balance = 0.0
 		count = 0
+		balances = get_balances_on(accounts, date=self.future_to_date, in_account_currency=False)
+		prev_balances = get_balances_on(accounts, date=self.past_to_date, in_account_currency=False)
+
 		for account in accounts:
-			balance += get_balance_on(account, date=self.future_to_date, in_account_currency=False)
+			balance += balances[account]
 			count += get_count_on(account, fieldname, date=self.future_to_date)
-			prev_balance += get_balance_on(account, date=self.past_to_date, in_account_currency=False)
+			prev_balance += prev_balances[account]
 
 		if fieldname in ("bank_balance","credit_balance"):
 			label = ""
@@ -11,6 +11,7 @@ from frappe.utils import flt, cint, get_link_to_form
 from frappe.utils.jinja import render_template
 from frappe.utils.data import add_days
 from six import string_types
+from erpnext.stock.doctype.batch_balance.batch_balance import get_batch_balance
 
 class UnableToSelectBatchError(frappe.ValidationError):
 	pass
@@ -155,27 +156,28 @@ def get_batch_qty(batch_no=None, warehouse=None, item_code=None, posting_date=No
 
 	out = 0
 	if batch_no and warehouse:
-		cond = ""
+		# the current qty is kept in the Batch Balance, the qty on a date is
+		# summed from the ledger
 		if posting_date and posting_time:
-			cond = " and timestamp(posting_date, posting_time) <= timestamp('{0}', '{1}')".format(posting_date,
-				posting_time)
-
-		out = float(frappe.db.sql("""select sum(actual_qty)
-			from `tabStock Ledger Entry`
-			where warehouse=%s and batch_no=%s {0}""".format(cond),
-			(warehouse, batch_no))[0][0] or 0)
+			out = float(frappe.db.sql("""select sum(actual_qty)
+				from `tabStock Ledger Entry`
+				where warehouse=%s and batch_no=%s
+				and timestamp(posting_date, posting_time) <= timestamp(%s, %s)""",
+				(warehouse, batch_no, posting_date, posting_time))[0][0] or 0)
+		else:
+			out = get_batch_balance(batch_no, warehouse)
 
 	if batch_no and not warehouse:
-		out = frappe.db.sql('''select warehouse, sum(actual_qty) as qty
-			from `tabStock Ledger Entry`
+		out = frappe.db.sql('''select warehouse, actual_qty as qty
+			from `tabBatch Balance`
 			where batch_no=%s
-			group by warehouse''', batch_no, as_dict=1)
+			order by warehouse''', batch_no, as_dict=1)
 
 	if not batch_no and item_code and warehouse:
-		out = frappe.db.sql('''select batch_no, sum(actual_qty) as qty
-			from `tabStock Ledger Entry`
+		out = frappe.db.sql('''select batch_no, actual_qty as qty
+			from `tabBatch Balance`
 			where item_code = %s and warehouse=%s
-			group by batch_no''', (item_code, warehouse), as_dict=1)
+			order by batch_no''', (item_code, warehouse), as_dict=1)
 
 	return out
 
@@ -289,13 +291,11 @@ def get_batches(item_code, warehouse, qty=1, throw=False, serial_no=None):
 		cond = " and `tabBatch`.name = %s" %(frappe.db.escape(batch[0].batch_no))
 
 	return frappe.db.sql("""
-		select batch_id, sum(`tabStock Ledger Entry`.actual_qty) as qty
+		select batch_id, `tabBatch Balance`.actual_qty as qty
 		from `tabBatch`
-			join `tabStock Ledger Entry` ignore index (item_code, warehouse)
-				on (`tabBatch`.batch_id = `tabStock Ledger Entry`.batch_no )
-		where `tabStock Ledger Entry`.item_code = %s and `tabStock Ledger Entry`.warehouse = %s
+			join `tabBatch Balance` on (`tabBatch`.batch_id = `tabBatch Balance`.batch_no)
+		where `tabBatch Balance`.item_code = %s and `tabBatch Balance`.warehouse = %s
 			and (`tabBatch`.expiry_date >= CURDATE() or `tabBatch`.expiry_date IS NULL) {0}
-		group by batch_id
 		order by `tabBatch`.expiry_date ASC, `tabBatch`.creation ASC
 	""".format(cond), (item_code, warehouse), as_dict=True)
 
@@ -175,6 +175,23 @@ class TestBatch(unittest.TestCase):
 
 		self.assertEqual(get_batch_qty('batch a', '_Test Warehouse - _TC'), 90)
 
+	def test_batch_balance_reconciliation(self):
+		'''Test the Batch Balance kept on submit and cancel, and its reconciliation'''
+		from erpnext.stock.doctype.batch_balance.batch_balance import reconcile_batch_balances
+
+		receipt = self.test_purchase_receipt(20)
+		batch_no, warehouse = receipt.items[0].batch_no, receipt.items[0].warehouse
+		self.assertEqual(get_batch_qty(batch_no=batch_no), [{'warehouse': warehouse, 'qty': 20.0}])
+
+		frappe.db.set_value("Batch Balance", {"batch_no": batch_no, "warehouse": warehouse}, "actual_qty", 5)
+		drifted = reconcile_batch_balances(item_code='ITEM-BATCH-1')
+		self.assertEqual([(d.batch_no, d.batch_balance_qty, d.actual_qty) for d in drifted], [(batch_no, 5, 20)])
+		self.assertEqual(get_batch_qty(batch_no, warehouse), 20)
+
+		receipt.cancel()
+		self.assertEqual(get_batch_qty(batch_no, warehouse), 0)
+		self.assertEqual(reconcile_batch_balances(item_code='ITEM-BATCH-1'), [])
+
 	@classmethod
 	def make_new_batch_and_entry(cls, item_name, batch_name, warehouse):
 		'''Make a new stock entry for given target warehouse and batch name of item'''
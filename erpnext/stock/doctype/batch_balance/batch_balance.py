@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt
+
+class BatchBalance(Document):
+	pass
+
+def update_batch_balance(item_code, warehouse, batch_no, qty, company=None):
+	'''Add `qty` to the balance of the batch in the warehouse, like the actual qty
+	of a Bin. Called for every Stock Ledger Entry of a batch, with the negative
+	qty when the entry is cancelled'''
+	name = frappe.db.sql("""select name from `tabBatch Balance`
+		where batch_no = %s and warehouse = %s
+		limit 1 for update""", (batch_no, warehouse))
+
+	if name:
+		frappe.db.sql("""update `tabBatch Balance` set actual_qty = actual_qty + %s
+			where name = %s""", (flt(qty), name[0][0]))
+	else:
+		frappe.get_doc({
+			"doctype": "Batch Balance",
+			"item_code": item_code,
+			"warehouse": warehouse,
+			"batch_no": batch_no,
+			"company": company or frappe.get_cached_value("Warehouse", warehouse, "company"),
+			"actual_qty": flt(qty)
+		}).db_insert()
+
+def get_batch_balance(batch_no, warehouse):
+	balance = frappe.db.sql("""select actual_qty from `tabBatch Balance`
+		where batch_no = %s and warehouse = %s""", (batch_no, warehouse))
+
+	return flt(balance[0][0]) if balance else 0.0
+
+def reconcile_batch_balances(item_code=None, warehouse=None):
+	'''Compare the batch balances with the Stock Ledger and correct the ones
+	which differ. Returns the corrected balances with the qty as per the ledger
+
+		bench --site [site] execute erpnext.stock.doctype.batch_balance.batch_balance.reconcile_batch_balances
+	'''
+	conditions, values = "", {"item_code": item_code, "warehouse": warehouse}
+	if item_code:
+		conditions += " and item_code = %(item_code)s"
+	if warehouse:
+		conditions += " and warehouse = %(warehouse)s"
+
+	ledger_balances = frappe.db.sql("""
+		select item_code, warehouse, batch_no, company, sum(actual_qty) as actual_qty
+		from `tabStock Ledger Entry`
+		where ifnull(batch_no, '') != '' {0}
+		group by item_code, warehouse, batch_no
+	""".format(conditions), values, as_dict=1)
+
+	batch_balances = {}
+	for d in frappe.db.sql("""select name, item_code, warehouse, batch_no, actual_qty
+		from `tabBatch Balance` where 1=1 {0}""".format(conditions), values, as_dict=1):
+		batch_balances[(d.item_code, d.warehouse, d.batch_no)] = d
+
+	drifted = []
+	for d in ledger_balances:
+		balance = batch_balances.pop((d.item_code, d.warehouse, d.batch_no), None)
+		if not balance:
+			update_batch_balance(d.item_code, d.warehouse, d.batch_no, d.actual_qty, d.company)
+			drifted.append(frappe._dict(d, batch_balance_qty=None))
+		elif flt(balance.actual_qty, 6) != flt(d.actual_qty, 6):
+			frappe.db.set_value("Batch Balance", balance.name, "actual_qty", flt(d.actual_qty),
+				update_modified=False)
+			drifted.append(frappe._dict(d, batch_balance_qty=balance.actual_qty))
+
+	# balances of batches without any ledger entry
+	for balance in batch_balances.values():
+		if flt(balance.actual_qty, 6):
+			frappe.db.set_value("Batch Balance", balance.name, "actual_qty", 0, update_modified=False)
+			drifted.append(frappe._dict(balance, batch_balance_qty=balance.actual_qty, actual_qty=0))
+
+	return drifted
+
+def on_doctype_update():
+	frappe.db.add_index("Batch Balance", ["batch_no", "warehouse"])
+	frappe.db.add_index("Batch Balance", ["item_code", "warehouse"])
@@ -18,7 +18,10 @@ class Bin(Document):
 		self.update_qty(args)
 
 		if args.get("actual_qty") or args.get("voucher_type") == "Stock Reconciliation":
-			from erpnext.stock.stock_ledger import update_entries_after
+			from erpnext.stock.stock_ledger import (update_entries_after, future_sle_exists,
+				validate_future_negative_qty)
+			from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import \
+				create_repost_item_valuation_entry
 
 			if not args.get("posting_date"):
 				args["posting_date"] = nowdate()
@@ -26,13 +29,30 @@ class Bin(Document):
 			# update valuation and qty after transaction for post dated entry
 			if args.get("is_cancelled") == "Yes" and via_landed_cost_voucher:
 				return
-			update_entries_after({
+
+			sle_args = {
 				"item_code": self.item_code,
 				"warehouse": self.warehouse,
 				"posting_date": args.get("posting_date"),
 				"posting_time": args.get("posting_time"),
+				"voucher_type": args.get("voucher_type"),
 				"voucher_no": args.get("voucher_no")
-			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher)
+			}
+
+			if future_sle_exists(sle_args):
+				# back-dated entry: value the entries of this voucher now
+				# and queue the future entries for reposting in background
+				validate_future_negative_qty(sle_args, args.get("actual_qty"), allow_negative_stock)
+
+				if args.get("is_cancelled") != "Yes":
+					update_entries_after(sle_args, allow_negative_stock=allow_negative_stock,
+						via_landed_cost_voucher=via_landed_cost_voucher, only_current_voucher=True)
+
+				create_repost_item_valuation_entry(dict(sle_args, allow_negative_stock=allow_negative_stock,
+					via_landed_cost_voucher=via_landed_cost_voucher))
+			else:
+				update_entries_after(sle_args, allow_negative_stock=allow_negative_stock,
+					via_landed_cost_voucher=via_landed_cost_voucher)
 
 	def update_qty(self, args):
 		# update the stock values (for current quantities)
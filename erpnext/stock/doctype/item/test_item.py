@@ -102,6 +102,31 @@ class TestItem(unittest.TestCase):
 		for key, value in iteritems(to_check):
 			self.assertEqual(value, details.get(key))
 
+	def test_get_items_details(self):
+		from erpnext.stock.get_item_details import get_items_details
+
+		make_test_objects("Item Price")
+
+		args_list = []
+		for item_code, qty in [("_Test Item", 1), ("_Test Item 2", 5), ("_Test Item Home Desktop 100", 2), ("_Test Item", 10)]:
+			args_list.append({
+				"item_code": item_code,
+				"qty": qty,
+				"company": "_Test Company",
+				"price_list": "_Test Price List",
+				"currency": "_Test Currency",
+				"doctype": "Sales Order",
+				"conversion_rate": 1,
+				"price_list_currency": "_Test Currency",
+				"plc_conversion_rate": 1,
+				"order_type": "Sales",
+				"customer": "_Test Customer",
+				"warehouse": "_Test Warehouse - _TC"
+			})
+
+		expected = [get_item_details(args.copy()) for args in args_list]
+		self.assertEqual(get_items_details(args_list), expected)
+
 	def test_item_tax_template(self):
 		expected_item_tax_template = [
 			{"item_code": "_Test Item With Item Tax Template", "tax_category": "",
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe, erpnext
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import cint, cstr, get_datetime, add_to_date, now_datetime
+from collections import OrderedDict
+from six import iteritems
+
+# number of background jobs the queued entries are split across
+REPOST_WORKERS = 4
+
+# hours after which an entry in progress without any progress is resumed
+REPOST_STALE_AFTER = 1
+
+class RepostItemValuation(Document):
+	def validate(self):
+		self.set_company()
+
+	def set_company(self):
+		if not self.company:
+			self.company = frappe.get_cached_value("Warehouse", self.warehouse, "company")
+
+	def set_status(self, status, error_log=None):
+		self.db_set({
+			"status": status,
+			"entries_reposted": cint(self.entries_reposted),
+			"error_log": error_log
+		})
+
+	def update_progress(self, sle, entries_reposted, affected_vouchers=None):
+		'''Called from `update_entries_after` after every batch of reposted
+		entries is written.
+
+		Records the posting datetime of the last reposted entry, appends the
+		vouchers whose stock value changed for the first time in the batch, and
+		commits, so that the repost resumes from there if the worker is stopped
+		midway'''
+		self.db_set({
+			"reposted_upto_date": sle.posting_date,
+			"reposted_upto_time": sle.posting_time,
+			"entries_reposted": cint(self.entries_reposted) + entries_reposted
+		})
+
+		if affected_vouchers:
+			# one line per voucher, appended so that the vouchers of earlier
+			# batches are not read and written again
+			lines = "".join("{0}\t{1}\n".format(voucher_type, voucher_no)
+				for voucher_type, voucher_no in sorted(affected_vouchers))
+			frappe.db.sql("""update `tabRepost Item Valuation`
+				set affected_vouchers = concat(ifnull(affected_vouchers, ''), %s)
+				where name = %s""", (lines, self.name))
+			self.affected_vouchers = cstr(self.affected_vouchers) + lines
+
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+	def get_affected_vouchers(self):
+		return parse_affected_vouchers(self.affected_vouchers)
+
+	@frappe.whitelist()
+	def restart_reposting(self):
+		if self.status != "Failed":
+			frappe.throw(_("Only failed reposts can be restarted"))
+
+		self.set_status("Queued")
+
+def parse_affected_vouchers(affected_vouchers):
+	'''(voucher type, voucher no) of the lines written by `update_progress`'''
+	return sorted(set(tuple(line.split("\t", 1)) for line in cstr(affected_vouchers).splitlines() if line))
+
+def create_repost_item_valuation_entry(args):
+	'''Queue reposting of the stock ledger of an item in a warehouse
+	from the given posting datetime onwards.
+
+	A queued entry for the same item and warehouse is reused and moved
+	back to the earliest posting datetime, so that each ledger is reposted
+	only once per run of the repost job'''
+	args = frappe._dict(args)
+
+	existing_entry = frappe.db.get_value("Repost Item Valuation", {
+		"item_code": args.item_code,
+		"warehouse": args.warehouse,
+		"status": "Queued"
+	})
+
+	if existing_entry:
+		repost_entry = frappe.get_doc("Repost Item Valuation", existing_entry)
+		if get_posting_datetime(args) < get_posting_datetime(repost_entry):
+			repost_entry.update({
+				"posting_date": args.posting_date,
+				"posting_time": args.posting_time,
+				"voucher_type": args.voucher_type,
+				"voucher_no": args.voucher_no,
+				"reposted_upto_date": None,
+				"reposted_upto_time": None
+			})
+	else:
+		repost_entry = frappe.new_doc("Repost Item Valuation")
+		repost_entry.update({
+			"item_code": args.item_code,
+			"warehouse": args.warehouse,
+			"posting_date": args.posting_date,
+			"posting_time": args.posting_time,
+			"voucher_type": args.voucher_type,
+			"voucher_no": args.voucher_no
+		})
+
+	for fieldname in ("allow_negative_stock", "via_landed_cost_voucher", "allow_zero_rate"):
+		repost_entry.set(fieldname, cint(repost_entry.get(fieldname)) or cint(args.get(fieldname)))
+
+	repost_entry.flags.ignore_permissions = True
+	repost_entry.save()
+
+	if frappe.flags.in_test and not frappe.flags.dont_execute_stock_reposts:
+		repost(repost_entry)
+	else:
+		enqueue_repost_entries()
+
+	return repost_entry
+
+def enqueue_repost_entries():
+	'''Start reposting the queued entries in background jobs once the request
+	is committed, rather than at the next run of the scheduled job. Enqueued
+	once per request, for all the entries queued by it'''
+	if frappe.flags.in_test or frappe.flags.repost_entries_enqueued:
+		return
+
+	frappe.flags.repost_entries_enqueued = True
+	frappe.enqueue(repost_entries, queue="long", timeout=6000, enqueue_after_commit=True)
+
+def get_posting_datetime(args):
+	return get_datetime("{0} {1}".format(args.posting_date, args.posting_time or "00:00"))
+
+def is_reposting_pending(posting_date, posting_time, items, warehouses):
+	'''Returns True if the stock ledger of any of the items in the warehouses
+	is queued for reposting on or before the given posting datetime. The GL
+	Entries of future vouchers are then reposted by the repost job'''
+	if not (items and warehouses):
+		return False
+
+	return bool(frappe.db.sql("""
+		select name from `tabRepost Item Valuation`
+		where
+			status in ('Queued', 'In Progress', 'GL Pending')
+			and item_code in ({items})
+			and warehouse in ({warehouses})
+			and timestamp(posting_date, posting_time) <= timestamp(%s, %s)
+		limit 1""".format(items=", ".join(["%s"] * len(items)),
+			warehouses=", ".join(["%s"] * len(warehouses))),
+		tuple(items + warehouses + [posting_date, posting_time])))
+
+def repost(doc, repost_gl=True):
+	try:
+		doc.set_status("In Progress")
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+		repost_sl_entries(doc)
+
+		if repost_gl:
+			repost_gl_entries(doc)
+			doc.set_status("Completed")
+		elif cint(erpnext.is_perpetual_inventory_enabled(doc.company)):
+			doc.set_status("GL Pending")
+		else:
+			doc.set_status("Completed")
+	except Exception:
+		if frappe.flags.in_test:
+			raise
+
+		frappe.db.rollback()
+		doc.set_status("Failed", frappe.get_traceback())
+	finally:
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+def repost_sl_entries(doc):
+	from erpnext.stock.stock_ledger import update_entries_after
+
+	update_entries_after({
+		"item_code": doc.item_code,
+		"warehouse": doc.warehouse,
+		"posting_date": doc.reposted_upto_date or doc.posting_date,
+		"posting_time": doc.reposted_upto_time if doc.reposted_upto_date else doc.posting_time
+	}, allow_zero_rate=cint(doc.allow_zero_rate), allow_negative_stock=cint(doc.allow_negative_stock),
+		via_landed_cost_voucher=cint(doc.via_landed_cost_voucher), repost_doc=doc)
+
+def repost_gl_entries(doc):
+	from erpnext.controllers.stock_controller import update_gl_entries_after
+
+	if not cint(erpnext.is_perpetual_inventory_enabled(doc.company)):
+		return
+
+	# vouchers being saved in this request make their own GL Entries
+	update_gl_entries_after(doc.posting_date, doc.posting_time, [doc.warehouse], [doc.item_code],
+		company=doc.company, exclude_vouchers=frappe.local.flags.currently_saving,
+		future_stock_vouchers=doc.get_affected_vouchers())
+
+def repost_entries():
+	'''Scheduled job, also enqueued by `enqueue_repost_entries` when entries
+	are queued: repost queued entries, and resume entries whose worker has not
+	reported progress for an hour.
+
+	The entries are partitioned by item and warehouse across background
+	jobs, as the ledger of each item and warehouse is reposted independently.
+	Entries stay queued until a job claims them, see `claim_entry`. GL
+	Entries are reposted once all the partitions are done'''
+	entries = get_repost_item_valuation_entries()
+	if not entries:
+		repost_pending_gl_entries()
+		return
+
+	partitions = get_partitions(entries, get_repost_workers())
+
+	if len(partitions) == 1 or frappe.flags.in_test:
+		for names in partitions:
+			repost_partition(names)
+		return
+
+	for names in partitions:
+		frappe.enqueue(repost_partition, queue="long", timeout=6000, names=names)
+
+def get_repost_workers():
+	return cint(frappe.conf.stock_repost_workers) or REPOST_WORKERS
+
+def get_partitions(entries, workers):
+	'''Split the entries into at most `workers` partitions of about the same size,
+	keeping the entries of an item and warehouse in the same partition, in order'''
+	partitions, partition_of_ledger = [], {}
+
+	for d in entries:
+		ledger = (d.item_code, d.warehouse)
+		if ledger not in partition_of_ledger:
+			if len(partitions) < workers:
+				partitions.append([])
+			partition_of_ledger[ledger] = min(range(len(partitions)), key=lambda i: len(partitions[i]))
+
+		partitions[partition_of_ledger[ledger]].append(d.name)
+
+	return partitions
+
+def repost_partition(names):
+	'''Repost the stock ledger of the given entries, each entry is committed
+	on its own. The last partition to finish reposts the GL Entries'''
+	failed_entries = []
+
+	for name in names:
+		# the entry may have been claimed by a job enqueued by an earlier run
+		if not claim_entry(name):
+			continue
+
+		doc = frappe.get_doc("Repost Item Valuation", name)
+		repost(doc, repost_gl=False)
+		if doc.status == "Failed":
+			failed_entries.append("{0} ({1}, {2})".format(doc.name, doc.item_code, doc.warehouse))
+
+	if failed_entries:
+		frappe.log_error(_("Reposting failed for {0}").format(", ".join(failed_entries)),
+			title=_("Stock Reposting Failed"))
+
+	repost_pending_gl_entries()
+
+def claim_entry(name):
+	'''Mark the entry as in progress if it is queued, or in progress without
+	any progress reported for `REPOST_STALE_AFTER` hours. The row is locked,
+	so that only one job claims an entry. Returns True if claimed'''
+	entry = frappe.db.sql("""select status, modified from `tabRepost Item Valuation`
+		where name = %s for update""", name, as_dict=1)
+
+	if not entry or not (entry[0].status == "Queued" or (entry[0].status == "In Progress"
+		and get_datetime(entry[0].modified) < get_stale_datetime())):
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+		return False
+
+	frappe.db.sql("""update `tabRepost Item Valuation` set status = 'In Progress', modified = %s
+		where name = %s""", (now_datetime(), name))
+
+	if not frappe.flags.in_test:
+		frappe.db.commit()
+
+	return True
+
+def get_stale_datetime():
+	return add_to_date(now_datetime(), hours=-REPOST_STALE_AFTER)
+
+def repost_pending_gl_entries():
+	'''Repost the GL Entries of the entries whose stock ledger is reposted,
+	once no entry is left to be reposted. The vouchers affected by all the entries
+	of a company are reposted in one pass, so each voucher is reposted only once'''
+	from erpnext.controllers.stock_controller import update_gl_entries_after
+
+	if frappe.db.exists("Repost Item Valuation", {"status": ("in", ("Queued", "In Progress"))}):
+		return
+
+	# rows are locked, so that only one of the partitions finishing together reposts them
+	entries = frappe.db.sql("""
+		select name, company, item_code, warehouse, posting_date, posting_time, affected_vouchers
+		from `tabRepost Item Valuation`
+		where status = 'GL Pending'
+		order by timestamp(posting_date, posting_time) asc, creation asc
+		for update""", as_dict=1)
+
+	entries_by_company = OrderedDict()
+	for d in entries:
+		entries_by_company.setdefault(d.company, []).append(d)
+
+	for company, company_entries in iteritems(entries_by_company):
+		names = [d.name for d in company_entries]
+		affected_vouchers = set()
+		for d in company_entries:
+			affected_vouchers.update(parse_affected_vouchers(d.affected_vouchers))
+
+		try:
+			update_gl_entries_after(company_entries[0].posting_date, company_entries[0].posting_time,
+				list(set(d.warehouse for d in company_entries)), list(set(d.item_code for d in company_entries)),
+				company=company, future_stock_vouchers=sorted(affected_vouchers))
+			status, error_log = "Completed", None
+		except Exception:
+			if frappe.flags.in_test:
+				raise
+
+			frappe.db.rollback()
+			status, error_log = "Failed", frappe.get_traceback()
+
+		frappe.db.sql("""update `tabRepost Item Valuation` set status = %s, error_log = %s, modified = %s
+			where name in ({0})""".format(", ".join(["%s"] * len(names))),
+			tuple([status, error_log, now_datetime()] + names))
+
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+def get_repost_item_valuation_entries():
+	return frappe.db.sql("""
+		select name, item_code, warehouse from `tabRepost Item Valuation`
+		where
+			status = 'Queued'
+			or (status = 'In Progress' and modified < %s)
+		order by timestamp(posting_date, posting_time) asc, creation asc
+	""", get_stale_datetime(), as_dict=1)
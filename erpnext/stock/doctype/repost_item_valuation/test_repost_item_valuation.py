@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate, add_days, getdate, add_to_date, now_datetime
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import (
+	create_repost_item_valuation_entry, repost_entries, get_partitions, claim_entry)
+
+class TestRepostItemValuation(unittest.TestCase):
+	def setUp(self):
+		frappe.flags.dont_execute_stock_reposts = True
+
+	def tearDown(self):
+		frappe.flags.dont_execute_stock_reposts = False
+
+	def test_queued_entries_are_merged(self):
+		args = {
+			"item_code": "_Test Item",
+			"warehouse": "_Test Warehouse - _TC",
+			"posting_date": add_days(nowdate(), -5),
+			"posting_time": "10:00:00"
+		}
+
+		first_entry = create_repost_item_valuation_entry(args)
+		earlier_entry = create_repost_item_valuation_entry(dict(args, posting_date=add_days(nowdate(), -10)))
+		later_entry = create_repost_item_valuation_entry(dict(args, posting_date=add_days(nowdate(), -2)))
+
+		self.assertEqual(first_entry.name, earlier_entry.name)
+		self.assertEqual(first_entry.name, later_entry.name)
+		self.assertEqual(getdate(later_entry.posting_date), getdate(add_days(nowdate(), -10)))
+
+		frappe.delete_doc("Repost Item Valuation", first_entry.name)
+
+	def test_entry_is_claimed_once(self):
+		entry = create_repost_item_valuation_entry({
+			"item_code": "_Test Item",
+			"warehouse": "_Test Warehouse - _TC",
+			"posting_date": add_days(nowdate(), -5),
+			"posting_time": "10:00:00"
+		})
+
+		self.assertTrue(claim_entry(entry.name))
+		self.assertFalse(claim_entry(entry.name))
+
+		# resumed once its own progress is stale
+		frappe.db.set_value("Repost Item Valuation", entry.name, "modified",
+			add_to_date(now_datetime(), hours=-2), update_modified=False)
+		self.assertTrue(claim_entry(entry.name))
+
+		frappe.delete_doc("Repost Item Valuation", entry.name)
+
+	def test_backdated_entry_is_reposted_in_background(self):
+		item_code = make_item("_Test Item For Reposting", {"is_stock_item": 1}).name
+		warehouse = "_Test Warehouse - _TC"
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100)
+		backdated_entry = make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=100,
+			posting_date=add_days(nowdate(), -2))
+
+		repost_entry = frappe.db.get_value("Repost Item Valuation", {
+			"item_code": item_code, "warehouse": warehouse, "status": "Queued"},
+			["name", "voucher_no"], as_dict=1)
+		self.assertEqual(repost_entry.voucher_no, backdated_entry.name)
+
+		repost_entries()
+
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", repost_entry.name, "status"), "Completed")
+		qty_after_transaction = frappe.db.get_value("Stock Ledger Entry", {
+			"item_code": item_code, "warehouse": warehouse, "posting_date": nowdate()},
+			"qty_after_transaction")
+		self.assertEqual(qty_after_transaction, 15)
+
+	def test_affected_vouchers(self):
+		item_code = make_item("_Test Item For Affected Vouchers", {"is_stock_item": 1}).name
+		warehouse = "_Test Warehouse - _TC"
+
+		receipt = make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date=add_days(nowdate(), -3))
+		issue = make_stock_entry(item_code=item_code, source=warehouse, qty=5)
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=200,
+			posting_date=add_days(nowdate(), -5))
+
+		repost_entry = frappe.db.get_value("Repost Item Valuation", {
+			"item_code": item_code, "warehouse": warehouse, "status": "Queued"})
+		repost_entries()
+
+		# only the issue is valued differently, the GL Entries of the receipt are not reposted
+		affected_vouchers = frappe.get_doc("Repost Item Valuation", repost_entry).get_affected_vouchers()
+		self.assertIn(("Stock Entry", issue.name), affected_vouchers)
+		self.assertNotIn(("Stock Entry", receipt.name), affected_vouchers)
+
+	def test_partitions(self):
+		entries = [frappe._dict(name=str(i), item_code="Item " + str(i % 5), warehouse="Stores")
+			for i in range(20)]
+
+		partitions = get_partitions(entries, 3)
+		self.assertEqual(len(partitions), 3)
+		self.assertEqual(sorted(sum(partitions, []), key=int), [d.name for d in entries])
+
+		# entries of an item stay in one partition, in order
+		partition_of_item = {}
+		for i, names in enumerate(partitions):
+			self.assertEqual(names, sorted(names, key=int))
+			for name in names:
+				self.assertEqual(partition_of_item.setdefault(entries[int(name)].item_code, i), i)
+
+		self.assertEqual(len(get_partitions(entries, 10)), 5)
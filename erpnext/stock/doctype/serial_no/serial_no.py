@@ -4,14 +4,26 @@
 from __future__ import unicode_literals
 import frappe
 
-from frappe.model.naming import make_autoname
-from frappe.utils import cint, cstr, flt, add_days, nowdate, getdate, get_link_to_form
+from frappe.model.naming import make_autoname, set_new_name
+from frappe.utils import cint, cstr, flt, add_days, nowdate, now, getdate, get_link_to_form
 from erpnext.stock.get_item_details import get_reserved_qty_for_so
 
 from frappe import _, ValidationError
 
 from erpnext.controllers.stock_controller import StockController
+from collections import OrderedDict
+from six import iteritems
 from six.moves import map
+
+SERIAL_NO_BATCH_SIZE = 500
+
+# fields of the Serial No set from the Stock Ledger Entries of the serial no
+ledger_fields = ("item_code", "company", "batch_no", "supplier", "location", "warehouse", "sales_order",
+	"item_group", "description", "item_name", "brand", "warranty_period", "purchase_document_type",
+	"purchase_document_no", "purchase_date", "purchase_time", "purchase_rate", "supplier_name",
+	"sales_invoice", "delivery_document_type", "delivery_document_no", "delivery_date", "delivery_time",
+	"customer", "customer_name", "warranty_expiry_date", "maintenance_status", "status")
+
 class SerialNoCannotCreateDirectError(ValidationError): pass
 class SerialNoCannotCannotChangeError(ValidationError): pass
 class SerialNoNotRequiredError(ValidationError): pass
@@ -96,9 +108,8 @@ class SerialNo(StockController):
 			self.purchase_time = purchase_sle.posting_time
 			self.purchase_rate = purchase_sle.incoming_rate
 			if purchase_sle.voucher_type in ("Purchase Receipt", "Purchase Invoice"):
-				self.supplier, self.supplier_name = \
-					frappe.db.get_value(purchase_sle.voucher_type, purchase_sle.voucher_no,
-						["supplier", "supplier_name"])
+				self.supplier, self.supplier_name = get_voucher_party(purchase_sle.voucher_type,
+					purchase_sle.voucher_no, ["supplier", "supplier_name"])
 
 			# If sales return entry
 			if self.purchase_document_type == 'Delivery Note':
@@ -115,9 +126,8 @@ class SerialNo(StockController):
 			self.delivery_date = delivery_sle.posting_date
 			self.delivery_time = delivery_sle.posting_time
 			if delivery_sle.voucher_type  in ("Delivery Note", "Sales Invoice"):
-				self.customer, self.customer_name = \
-					frappe.db.get_value(delivery_sle.voucher_type, delivery_sle.voucher_no,
-						["customer", "customer_name"])
+				self.customer, self.customer_name = get_voucher_party(delivery_sle.voucher_type,
+					delivery_sle.voucher_no, ["customer", "customer_name"])
 			if self.warranty_period:
 				self.warranty_expiry_date	= add_days(cstr(delivery_sle.posting_date),
 					cint(self.warranty_period))
@@ -127,9 +137,11 @@ class SerialNo(StockController):
 				"warranty_expiry_date"):
 					self.set(fieldname, None)
 
-	def get_last_sle(self, serial_no=None):
+	def get_last_sle(self, serial_no=None, sle_dict=None):
 		entries = {}
-		sle_dict = self.get_stock_ledger_entries(serial_no)
+		if sle_dict is None:
+			sle_dict = self.get_stock_ledger_entries(serial_no)
+
 		if sle_dict:
 			if sle_dict.get("incoming", []):
 				entries["purchase_sle"] = sle_dict["incoming"][0]
@@ -203,8 +215,8 @@ class SerialNo(StockController):
 					where name=%s""" % (dt[0], '%s', '%s'),
 					('\n'.join(list(serial_nos)), item[0]))
 
-	def update_serial_no_reference(self, serial_no=None):
-		last_sle = self.get_last_sle(serial_no)
+	def update_serial_no_reference(self, serial_no=None, sle_dict=None):
+		last_sle = self.get_last_sle(serial_no, sle_dict)
 		self.set_purchase_details(last_sle.get("purchase_sle"))
 		self.set_sales_details(last_sle.get("delivery_sle"))
 		self.set_maintenance_status()
@@ -235,12 +247,16 @@ def validate_serial_no(sle, item_det):
 			if len(serial_nos) != len(set(serial_nos)):
 				frappe.throw(_("Duplicate Serial No entered for Item {0}").format(sle.item_code), SerialNoDuplicateError)
 
-			for serial_no in serial_nos:
-				if frappe.db.exists("Serial No", serial_no):
-					sr = frappe.db.get_value("Serial No", serial_no, ["name", "item_code", "batch_no", "sales_order",
-						"delivery_document_no", "delivery_document_type", "warehouse", "purchase_document_type",
-						"purchase_document_no", "company"], as_dict=1)
+			serial_no_details = get_serial_no_details(serial_nos, ["name", "item_code", "batch_no", "sales_order",
+				"delivery_document_no", "delivery_document_type", "warehouse", "purchase_document_type",
+				"purchase_document_no", "company"])
 
+			# lookups on the voucher, made once for all the serial nos
+			voucher_details = {}
+
+			for serial_no in serial_nos:
+				sr = serial_no_details.get(serial_no)
+				if sr:
 					if sr.item_code!=sle.item_code:
 						if not allow_serial_nos_with_different_item(serial_no, sle):
 							frappe.throw(_("Serial No {0} does not belong to Item {1}").format(serial_no,
@@ -253,7 +269,11 @@ def validate_serial_no(sle, item_det):
 
 					if (sr.delivery_document_no and sle.voucher_type not in ['Stock Entry', 'Stock Reconciliation']
 						and sle.voucher_type == sr.delivery_document_type):
-						return_against = frappe.db.get_value(sle.voucher_type, sle.voucher_no, 'return_against')
+						if "return_against" not in voucher_details:
+							voucher_details["return_against"] = frappe.db.get_value(sle.voucher_type,
+								sle.voucher_no, 'return_against')
+
+						return_against = voucher_details["return_against"]
 						if return_against and return_against != sr.delivery_document_no:
 							frappe.throw(_("Serial no {0} has been already returned").format(sr.name))
 
@@ -274,53 +294,86 @@ def validate_serial_no(sle, item_det):
 
 							# if Sales Order reference in Serial No validate the Delivery Note or Invoice is against the same
 							if sr.sales_order:
-								if sle.voucher_type == "Sales Invoice":
-									if not frappe.db.exists("Sales Invoice Item", {"parent": sle.voucher_no,
-										"item_code": sle.item_code, "sales_order": sr.sales_order}):
-										frappe.throw(_("Cannot deliver Serial No {0} of item {1} as it is reserved \
-											to fullfill Sales Order {2}").format(sr.name, sle.item_code, sr.sales_order))
-								elif sle.voucher_type == "Delivery Note":
-									if not frappe.db.exists("Delivery Note Item", {"parent": sle.voucher_no,
-										"item_code": sle.item_code, "against_sales_order": sr.sales_order}):
-										invoice = frappe.db.get_value("Delivery Note Item", {"parent": sle.voucher_no,
-											"item_code": sle.item_code}, "against_sales_invoice")
-										if not invoice or frappe.db.exists("Sales Invoice Item",
-											{"parent": invoice, "item_code": sle.item_code,
-											"sales_order": sr.sales_order}):
-											frappe.throw(_("Cannot deliver Serial No {0} of item {1} as it is reserved to \
-												fullfill Sales Order {2}").format(sr.name, sle.item_code, sr.sales_order))
+								key = ("against_sales_order", sr.sales_order)
+								if key not in voucher_details:
+									voucher_details[key] = is_against_sales_order(sle, sr.sales_order)
+
+								if not voucher_details[key]:
+									frappe.throw(_("Cannot deliver Serial No {0} of item {1} as it is reserved \
+										to fullfill Sales Order {2}").format(sr.name, sle.item_code, sr.sales_order))
+
 							# if Sales Order reference in Delivery Note or Invoice validate SO reservations for item
-							if sle.voucher_type == "Sales Invoice":
-								sales_order = frappe.db.get_value("Sales Invoice Item", {"parent": sle.voucher_no,
-									"item_code": sle.item_code}, "sales_order")
-								if sales_order and get_reserved_qty_for_so(sales_order, sle.item_code):
-									validate_so_serial_no(sr, sales_order)
-							elif sle.voucher_type == "Delivery Note":
-								sales_order = frappe.get_value("Delivery Note Item", {"parent": sle.voucher_no,
-									"item_code": sle.item_code}, "against_sales_order")
-								if sales_order and get_reserved_qty_for_so(sales_order, sle.item_code):
-									validate_so_serial_no(sr, sales_order)
-								else:
-									sales_invoice = frappe.get_value("Delivery Note Item", {"parent": sle.voucher_no,
-										"item_code": sle.item_code}, "against_sales_invoice")
-									if sales_invoice:
-										sales_order = frappe.db.get_value("Sales Invoice Item", {
-											"parent": sales_invoice, "item_code": sle.item_code}, "sales_order")
-										if sales_order and get_reserved_qty_for_so(sales_order, sle.item_code):
-											validate_so_serial_no(sr, sales_order)
+							if "reserved_sales_order" not in voucher_details:
+								voucher_details["reserved_sales_order"] = get_reserved_sales_order(sle)
+
+							if voucher_details["reserved_sales_order"]:
+								validate_so_serial_no(sr, voucher_details["reserved_sales_order"])
 				elif cint(sle.actual_qty) < 0:
 					# transfer out
 					frappe.throw(_("Serial No {0} not in stock").format(serial_no), SerialNoNotExistsError)
 		elif cint(sle.actual_qty) < 0 or not item_det.serial_no_series:
 			frappe.throw(_("Serial Nos Required for Serialized Item {0}").format(sle.item_code),
 				SerialNoRequiredError)
-	elif serial_nos:
+	elif serial_nos and cint(sle.actual_qty) < 0:
+		serial_no_details = get_serial_no_details(serial_nos, ["name", "warehouse"])
 		for serial_no in serial_nos:
-			sr = frappe.db.get_value("Serial No", serial_no, ["name", "warehouse"], as_dict=1)
-			if sr and cint(sle.actual_qty) < 0 and sr.warehouse != sle.warehouse:
+			sr = serial_no_details.get(serial_no)
+			if sr and sr.warehouse != sle.warehouse:
 				frappe.throw(_("Cannot cancel {0} {1} because Serial No {2} does not belong to the warehouse {3}")
 					.format(sle.voucher_type, sle.voucher_no, serial_no, sle.warehouse))
 
+def get_serial_no_details(serial_nos, fields):
+	'''Fields of the existing Serial Nos, `SERIAL_NO_BATCH_SIZE` serial nos per query,
+	as {serial no: details}'''
+	serial_no_details = {}
+	for start in range(0, len(serial_nos), SERIAL_NO_BATCH_SIZE):
+		batch = serial_nos[start:start + SERIAL_NO_BATCH_SIZE]
+		for d in frappe.db.sql("""select {0} from `tabSerial No` where name in ({1})""".format(
+			", ".join(fields), ", ".join(["%s"] * len(batch))), tuple(batch), as_dict=1):
+			serial_no_details[d.name.upper()] = d
+
+	return serial_no_details
+
+def is_against_sales_order(sle, sales_order):
+	'''Whether the Sales Invoice or Delivery Note of the entry can deliver
+	serial nos reserved for the Sales Order'''
+	if sle.voucher_type == "Sales Invoice":
+		return frappe.db.exists("Sales Invoice Item", {"parent": sle.voucher_no,
+			"item_code": sle.item_code, "sales_order": sales_order})
+	elif sle.voucher_type == "Delivery Note":
+		if frappe.db.exists("Delivery Note Item", {"parent": sle.voucher_no,
+			"item_code": sle.item_code, "against_sales_order": sales_order}):
+			return True
+
+		invoice = frappe.db.get_value("Delivery Note Item", {"parent": sle.voucher_no,
+			"item_code": sle.item_code}, "against_sales_invoice")
+		return invoice and not frappe.db.exists("Sales Invoice Item",
+			{"parent": invoice, "item_code": sle.item_code, "sales_order": sales_order})
+
+	return True
+
+def get_reserved_sales_order(sle):
+	'''Sales Order of the Sales Invoice or Delivery Note of the entry, if it
+	has a reservation for the item'''
+	if sle.voucher_type == "Sales Invoice":
+		sales_order = frappe.db.get_value("Sales Invoice Item", {"parent": sle.voucher_no,
+			"item_code": sle.item_code}, "sales_order")
+		if sales_order and get_reserved_qty_for_so(sales_order, sle.item_code):
+			return sales_order
+	elif sle.voucher_type == "Delivery Note":
+		sales_order = frappe.get_value("Delivery Note Item", {"parent": sle.voucher_no,
+			"item_code": sle.item_code}, "against_sales_order")
+		if sales_order and get_reserved_qty_for_so(sales_order, sle.item_code):
+			return sales_order
+
+		sales_invoice = frappe.get_value("Delivery Note Item", {"parent": sle.voucher_no,
+			"item_code": sle.item_code}, "against_sales_invoice")
+		if sales_invoice:
+			sales_order = frappe.db.get_value("Sales Invoice Item", {
+				"parent": sales_invoice, "item_code": sle.item_code}, "sales_order")
+			if sales_order and get_reserved_qty_for_so(sales_order, sle.item_code):
+				return sales_order
+
 def validate_material_transfer_entry(sle_doc):
 	sle_doc.update({
 		"skip_update_serial_no": False,
@@ -355,7 +408,7 @@ def has_serial_no_exists(sn, sle):
 			status = True
 
 		# If status is receipt then system will allow to in-ward the delivered serial no
-		if (status and sle.voucher_type == 'Stock Entry' and frappe.db.get_value('Stock Entry',
+		if (status and sle.voucher_type == 'Stock Entry' and frappe.get_cached_value('Stock Entry',
 			sle.voucher_no, 'purpose') in ("Material Receipt", "Material Transfer")):
 			status = False
 
@@ -396,26 +449,135 @@ def get_auto_serial_nos(serial_no_series, qty):
 	return "\n".join(serial_nos)
 
 def auto_make_serial_nos(args):
+	'''Create or update the Serial Nos of the Stock Ledger Entry. The existing
+	Serial Nos and the ledger entries of all the serial nos are read in a few
+	queries, and the records written in batches'''
 	serial_nos = get_serial_nos(args.get('serial_no'))
-	created_numbers = []
+	existing_serial_nos = get_serial_no_docs(serial_nos)
+
+	# a new serial no has no entries other than this one
+	sle_dicts = get_stock_ledger_entries_by_serial_no(args.get("item_code"), args.get("company"),
+		[serial_no for serial_no in serial_nos if serial_no in existing_serial_nos])
+	current_sle = frappe._dict((fieldname, args.get(fieldname)) for fieldname in ("voucher_type", "voucher_no",
+		"posting_date", "posting_time", "incoming_rate", "actual_qty", "serial_no"))
+
+	new_serial_nos, updated_serial_nos = [], []
 	for serial_no in serial_nos:
 		is_new = False
-		if frappe.db.exists("Serial No", serial_no):
-			sr = frappe.get_cached_doc("Serial No", serial_no)
+		if serial_no in existing_serial_nos:
+			sr = existing_serial_nos[serial_no]
 		elif args.get('actual_qty', 0) > 0:
 			sr = frappe.new_doc("Serial No")
 			is_new = True
+		else:
+			continue
 
-		sr = update_args_for_serial_no(sr, serial_no, args, is_new=is_new)
+		sle_dict = {"incoming": [current_sle]} if is_new else sle_dicts.get(serial_no, {})
+		set_serial_no_details(sr, serial_no, args, is_new=is_new, sle_dict=sle_dict)
 		if is_new:
-			created_numbers.append(sr.name)
+			new_serial_nos.append(sr)
+		else:
+			updated_serial_nos.append(sr)
+
+	insert_serial_nos(new_serial_nos)
+	update_serial_no_records(updated_serial_nos)
 
+	created_numbers = [sr.name for sr in new_serial_nos]
 	form_links = list(map(lambda d: get_link_to_form('Serial No', d), created_numbers))
 	if len(form_links) == 1:
 		frappe.msgprint(_("Serial No {0} created").format(form_links[0]))
 	elif len(form_links) > 0:
 		frappe.msgprint(_("The following serial numbers were created: <br> {0}").format(', '.join(form_links)))
 
+def get_serial_no_docs(serial_nos):
+	return dict((serial_no, frappe.get_doc(dict(d, doctype="Serial No")))
+		for serial_no, d in iteritems(get_serial_no_details(serial_nos, ["*"])))
+
+def get_stock_ledger_entries_by_serial_no(item_code, company, serial_nos):
+	'''Stock Ledger Entries of the serial nos, latest first, as
+	{serial no: {"incoming": [], "outgoing": []}} like `SerialNo.get_stock_ledger_entries`.
+
+	The entries are matched like `SerialNo.get_stock_ledger_entries`, for
+	`SERIAL_NO_BATCH_SIZE` serial nos per query'''
+	serial_nos = list(serial_nos)
+	sle_dicts = {}
+
+	for start in range(0, len(serial_nos), SERIAL_NO_BATCH_SIZE):
+		batch = serial_nos[start:start + SERIAL_NO_BATCH_SIZE]
+
+		conditions, values = [], [item_code, company]
+		for serial_no in batch:
+			conditions.append("serial_no = %s or serial_no like %s or serial_no like %s or serial_no like %s")
+			values.extend([serial_no, serial_no+'\n%', '%\n'+serial_no, '%\n'+serial_no+'\n%'])
+
+		batch = set(batch)
+		for sle in frappe.db.sql("""
+			SELECT voucher_type, voucher_no,
+				posting_date, posting_time, incoming_rate, actual_qty, serial_no
+			FROM
+				`tabStock Ledger Entry`
+			WHERE
+				item_code=%s AND company = %s AND ifnull(is_cancelled, 'No')='No'
+				AND ({0})
+			ORDER BY
+				posting_date desc, posting_time desc, creation desc""".format(" or ".join(conditions)),
+			tuple(values), as_dict=1):
+				for serial_no in batch.intersection(get_serial_nos(sle.serial_no)):
+					sle_dicts.setdefault(serial_no, {}).setdefault("incoming" if cint(sle.actual_qty) > 0
+						else "outgoing", []).append(sle)
+
+	return sle_dicts
+
+def insert_serial_nos(serial_no_docs):
+	"""Insert new Serial Nos, `SERIAL_NO_BATCH_SIZE` rows per statement"""
+	if not serial_no_docs: return
+
+	timestamp, user = now(), frappe.session.user
+
+	rows = []
+	for sr in serial_no_docs:
+		set_new_name(sr)
+		sr.owner = sr.modified_by = user
+		sr.creation = sr.modified = timestamp
+		rows.append(sr.get_valid_dict(convert_dates_to_str=True))
+
+	columns = list(rows[0])
+	placeholders = "({0})".format(", ".join(["%s"] * len(columns)))
+
+	for start in range(0, len(rows), SERIAL_NO_BATCH_SIZE):
+		batch = rows[start:start + SERIAL_NO_BATCH_SIZE]
+		frappe.db.sql("""insert into `tabSerial No` ({columns}) values {values}""".format(
+			columns=", ".join(["`{0}`".format(column) for column in columns]),
+			values=", ".join([placeholders] * len(batch))),
+			tuple(row.get(column) for row in batch for column in columns))
+
+def update_serial_no_records(serial_no_docs):
+	"""Write the `ledger_fields` of the Serial Nos, one statement for each set of
+	serial nos with the same values"""
+	serial_nos_by_values = OrderedDict()
+	for sr in serial_no_docs:
+		values = sr.get_valid_dict(convert_dates_to_str=True)
+		serial_nos_by_values.setdefault(tuple(values.get(fieldname) for fieldname in ledger_fields),
+			[]).append(sr.name)
+
+	for values, names in iteritems(serial_nos_by_values):
+		for start in range(0, len(names), SERIAL_NO_BATCH_SIZE):
+			batch = names[start:start + SERIAL_NO_BATCH_SIZE]
+			frappe.db.sql("""update `tabSerial No` set {0} where name in ({1})""".format(
+				", ".join(["`{0}` = %s".format(fieldname) for fieldname in ledger_fields]),
+				", ".join(["%s"] * len(batch))), values + tuple(batch))
+
+def get_voucher_party(voucher_type, voucher_no, fields):
+	'''Party of the voucher, looked up once per voucher for all its serial nos'''
+	key = (voucher_type, voucher_no, tuple(fields))
+	if frappe.flags.serial_no_voucher_parties is None:
+		frappe.flags.serial_no_voucher_parties = {}
+
+	if key not in frappe.flags.serial_no_voucher_parties:
+		frappe.flags.serial_no_voucher_parties[key] = frappe.db.get_value(voucher_type, voucher_no, fields)
+
+	return frappe.flags.serial_no_voucher_parties[key]
+
 def get_item_details(item_code):
 	return frappe.db.sql("""select name, has_batch_no, docstatus,
 		is_stock_item, has_serial_no, serial_no_series
@@ -428,7 +590,7 @@ def get_serial_nos(serial_no):
 	return [s.strip() for s in cstr(serial_no).strip().upper().replace(',', '\n').split('\n')
 		if s.strip()]
 
-def update_args_for_serial_no(serial_no_doc, serial_no, args, is_new=False):
+def set_serial_no_details(serial_no_doc, serial_no, args, is_new=False, sle_dict=None):
 	serial_no_doc.update({
 		"item_code": args.get("item_code"),
 		"company": args.get("company"),
@@ -448,14 +610,7 @@ def update_args_for_serial_no(serial_no_doc, serial_no, args, is_new=False):
 		serial_no_doc.sales_order = None
 
 	serial_no_doc.validate_item()
-	serial_no_doc.update_serial_no_reference(serial_no)
-
-	if is_new:
-		serial_no_doc.db_insert()
-	else:
-		serial_no_doc.db_update()
-
-	return serial_no_doc
+	serial_no_doc.update_serial_no_reference(serial_no, sle_dict)
 
 def update_serial_nos_after_submit(controller, parentfield):
 	stock_ledger_entries = frappe.db.sql("""select voucher_detail_no, serial_no, actual_qty, warehouse
@@ -464,6 +619,10 @@ def update_serial_nos_after_submit(controller, parentfield):
 
 	if not stock_ledger_entries: return
 
+	stock_ledger_entries_by_row = {}
+	for sle in stock_ledger_entries:
+		stock_ledger_entries_by_row.setdefault(sle.voucher_detail_no, []).append(sle)
+
 	for d in controller.get(parentfield):
 		if d.serial_no:
 			continue
@@ -479,22 +638,21 @@ def update_serial_nos_after_submit(controller, parentfield):
 			warehouse = d.warehouse
 			qty = (d.qty if controller.doctype == "Stock Reconciliation"
 				else d.stock_qty)
-		for sle in stock_ledger_entries:
-			if sle.voucher_detail_no==d.name:
-				if not accepted_serial_nos_updated and qty and abs(sle.actual_qty)==qty \
-					and sle.warehouse == warehouse and sle.serial_no != d.serial_no:
-						d.serial_no = sle.serial_no
-						frappe.db.set_value(d.doctype, d.name, "serial_no", sle.serial_no)
-						accepted_serial_nos_updated = True
-						if not update_rejected_serial_nos:
-							break
-				elif update_rejected_serial_nos and abs(sle.actual_qty)==d.rejected_qty \
-					and sle.warehouse == d.rejected_warehouse and sle.serial_no != d.rejected_serial_no:
-						d.rejected_serial_no = sle.serial_no
-						frappe.db.set_value(d.doctype, d.name, "rejected_serial_no", sle.serial_no)
-						update_rejected_serial_nos = False
-						if accepted_serial_nos_updated:
-							break
+		for sle in stock_ledger_entries_by_row.get(d.name, []):
+			if not accepted_serial_nos_updated and qty and abs(sle.actual_qty)==qty \
+				and sle.warehouse == warehouse and sle.serial_no != d.serial_no:
+					d.serial_no = sle.serial_no
+					frappe.db.set_value(d.doctype, d.name, "serial_no", sle.serial_no)
+					accepted_serial_nos_updated = True
+					if not update_rejected_serial_nos:
+						break
+			elif update_rejected_serial_nos and abs(sle.actual_qty)==d.rejected_qty \
+				and sle.warehouse == d.rejected_warehouse and sle.serial_no != d.rejected_serial_no:
+					d.rejected_serial_no = sle.serial_no
+					frappe.db.set_value(d.doctype, d.name, "rejected_serial_no", sle.serial_no)
+					update_rejected_serial_nos = False
+					if accepted_serial_nos_updated:
+						break
 
 def update_maintenance_status():
 	serial_nos = frappe.db.sql('''select name from `tabSerial No` where (amc_expiry_date<%s or
@@ -10,7 +10,7 @@ import frappe, unittest
 from erpnext.stock.doctype.stock_entry.test_stock_entry import make_serialized_item
 from erpnext.stock.doctype.purchase_receipt.test_purchase_receipt import make_purchase_receipt
 from erpnext.stock.doctype.delivery_note.test_delivery_note import create_delivery_note
-from erpnext.stock.doctype.serial_no.serial_no import get_serial_nos
+from erpnext.stock.doctype.serial_no.serial_no import get_serial_nos, SerialNoWarehouseError
 from erpnext.stock.doctype.warehouse.test_warehouse import create_warehouse
 from erpnext.stock.doctype.purchase_receipt.test_purchase_receipt import set_perpetual_inventory
 
@@ -54,5 +54,29 @@ class TestSerialNo(unittest.TestCase):
 		self.assertEqual(serial_no.warehouse, wh)
 		self.assertEqual(serial_no.company, "_Test Company 1")
 
+	def test_serial_nos_made_in_bulk(self):
+		serial_nos = ["_TCBULKSER{0:04d}".format(i) for i in range(20)]
+		pr = make_purchase_receipt(item_code="_Test Serialized Item", qty=20, serial_no="\n".join(serial_nos))
+
+		details = frappe.get_all("Serial No", filters={"name": ("in", serial_nos)},
+			fields=["name", "warehouse", "status", "purchase_document_no", "supplier"])
+		self.assertEqual(len(details), 20)
+		for d in details:
+			self.assertEqual((d.warehouse, d.status, d.purchase_document_no, d.supplier),
+				("_Test Warehouse - _TC", "Active", pr.name, pr.supplier))
+
+		dn = create_delivery_note(item_code="_Test Serialized Item", qty=5, serial_no="\n".join(serial_nos[:5]))
+
+		details = frappe.get_all("Serial No", filters={"name": ("in", serial_nos)},
+			fields=["name", "warehouse", "status", "delivery_document_no"])
+		for d in details:
+			if d.name in serial_nos[:5]:
+				self.assertEqual((d.warehouse, d.status, d.delivery_document_no), (None, "Delivered", dn.name))
+			else:
+				self.assertEqual((d.warehouse, d.status, d.delivery_document_no), ("_Test Warehouse - _TC", "Active", None))
+
+		self.assertRaises(SerialNoWarehouseError, create_delivery_note, item_code="_Test Serialized Item",
+			qty=1, serial_no=serial_nos[0])
+
 	def tearDown(self):
 		frappe.db.rollback()
\ No newline at end of file
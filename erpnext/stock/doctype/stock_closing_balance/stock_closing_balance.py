@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.model.document import Document
+from frappe.utils import getdate, get_first_day, get_last_day, add_months, nowdate
+
+class StockClosingBalance(Document):
+	pass
+
+def get_closing_balance(item_code, warehouse, posting_date):
+	'''Returns the latest closing balance of the item in the warehouse
+	before the given posting date, if any'''
+	closing_balance = frappe.db.sql("""
+		select closing_date, stock_ledger_entry, qty_after_transaction, valuation_rate, stock_value, stock_queue
+		from `tabStock Closing Balance`
+		where item_code = %s and warehouse = %s and closing_date < %s
+		order by closing_date desc
+		limit 1
+	""", (item_code, warehouse, posting_date), as_dict=1)
+
+	return closing_balance[0] if closing_balance else None
+
+def invalidate_closing_balances(item_code, warehouse, posting_date):
+	'''Delete closing balances on or after the posting date of a
+	back-dated entry, they are recreated by `rebuild_closing_balances`
+	once the entries after it are reposted'''
+	frappe.db.sql("""
+		delete from `tabStock Closing Balance`
+		where item_code = %s and warehouse = %s and closing_date >= %s
+	""", (item_code, warehouse, posting_date))
+
+def create_closing_balances(closing_date=None, item_code=None, warehouse=None):
+	'''Scheduled job: create the closing balance of every item and warehouse
+	which had stock transactions in the month ending on `closing_date`
+	(by default, the previous month).
+
+	Items without transactions in the month are covered by their earlier
+	closing balance'''
+	if not closing_date:
+		closing_date = get_last_day(add_months(nowdate(), -1))
+
+	closing_date = getdate(closing_date)
+	from_date = get_first_day(closing_date)
+
+	conditions, values = "", [closing_date]
+	if item_code:
+		conditions += " and item_code = %s"
+		values.append(item_code)
+	if warehouse:
+		conditions += " and warehouse = %s"
+		values.append(warehouse)
+
+	frappe.db.sql("""delete from `tabStock Closing Balance`
+		where closing_date = %s {0}""".format(conditions), tuple(values))
+
+	last_entries = {}
+	for sle in frappe.db.sql("""
+		select
+			name, item_code, warehouse, company, qty_after_transaction,
+			valuation_rate, stock_value, stock_queue
+		from `tabStock Ledger Entry`
+		where
+			posting_date between %s and %s
+			and ifnull(is_cancelled, 'No') = 'No'
+			{0}
+		order by timestamp(posting_date, posting_time) asc, creation asc
+	""".format(conditions), tuple([from_date] + values), as_dict=1):
+		last_entries[(sle.item_code, sle.warehouse)] = sle
+
+	for sle in last_entries.values():
+		frappe.get_doc({
+			"doctype": "Stock Closing Balance",
+			"item_code": sle.item_code,
+			"warehouse": sle.warehouse,
+			"company": sle.company,
+			"closing_date": closing_date,
+			"stock_ledger_entry": sle.name,
+			"qty_after_transaction": sle.qty_after_transaction,
+			"valuation_rate": sle.valuation_rate,
+			"stock_value": sle.stock_value,
+			"stock_queue": sle.stock_queue
+		}).db_insert()
+
+def rebuild_closing_balances(from_date=None, to_date=None, item_code=None, warehouse=None):
+	'''Create the closing balances of every month from `from_date` (by default,
+	the first stock transaction) till `to_date` (by default, the previous month)'''
+	if not from_date:
+		from_date = frappe.db.sql("""select min(posting_date) from `tabStock Ledger Entry`""")[0][0]
+		if not from_date:
+			return
+
+	to_date = getdate(to_date or get_last_day(add_months(nowdate(), -1)))
+	closing_date = get_last_day(from_date)
+	while closing_date <= to_date:
+		create_closing_balances(closing_date, item_code, warehouse)
+		closing_date = get_last_day(add_months(closing_date, 1))
+
+def rebuild_invalidated_closing_balances(item_code, warehouse, posting_date):
+	'''Recreate the closing balances of the item and warehouse deleted by
+	`invalidate_closing_balances`, up to the latest closing date of the site'''
+	if getdate(posting_date) > get_last_day(add_months(nowdate(), -1)):
+		return
+
+	last_closing_date = frappe.db.sql("""select max(closing_date) from `tabStock Closing Balance`""")[0][0]
+	if last_closing_date and getdate(last_closing_date) >= getdate(posting_date):
+		rebuild_closing_balances(posting_date, last_closing_date, item_code, warehouse)
+
+def on_doctype_update():
+	frappe.db.add_index("Stock Closing Balance", ["item_code", "warehouse", "closing_date"])
+	frappe.db.add_index("Stock Closing Balance", ["closing_date"])
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate, add_days, add_months, get_last_day, getdate
+from erpnext.stock.utils import get_stock_balance, get_stock_value_on
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from erpnext.stock.doctype.stock_closing_balance.stock_closing_balance import (create_closing_balances,
+	rebuild_closing_balances)
+
+class TestStockClosingBalance(unittest.TestCase):
+	def test_balance_from_closing_balance(self):
+		item_code = make_item("_Test Item For Closing Balance", {"is_stock_item": 1}).name
+		warehouse = "_Test Warehouse - _TC"
+		closing_date = get_last_day(add_months(nowdate(), -2))
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date=add_days(closing_date, -5))
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=100,
+			posting_date=add_days(closing_date, 5))
+
+		balance_before = get_stock_balance(item_code, warehouse, nowdate())
+		value_before = get_stock_value_on(warehouse, nowdate(), item_code)
+
+		create_closing_balances(closing_date)
+		self.assertEqual(frappe.db.get_value("Stock Closing Balance",
+			{"item_code": item_code, "warehouse": warehouse, "closing_date": closing_date},
+			"qty_after_transaction"), 10)
+
+		self.assertEqual(get_stock_balance(item_code, warehouse, nowdate()), balance_before)
+		self.assertEqual(get_stock_value_on(warehouse, nowdate(), item_code), value_before)
+		self.assertEqual(get_stock_balance(item_code, warehouse, add_days(closing_date, 1)), 10)
+
+		# back-dated entry: the closing balance is recreated after reposting
+		make_stock_entry(item_code=item_code, target=warehouse, qty=2, basic_rate=100,
+			posting_date=add_days(closing_date, -1))
+		self.assertEqual(frappe.db.get_value("Stock Closing Balance",
+			{"item_code": item_code, "warehouse": warehouse, "closing_date": closing_date},
+			"qty_after_transaction"), 12)
+		self.assertEqual(get_stock_balance(item_code, warehouse, nowdate()), 17)
+
+	def test_rebuild_closing_balances(self):
+		item_code = make_item("_Test Item For Closing Balance Rebuild", {"is_stock_item": 1}).name
+		warehouse = "_Test Warehouse - _TC"
+		first_closing_date = get_last_day(add_months(nowdate(), -3))
+		second_closing_date = get_last_day(add_months(nowdate(), -2))
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date=add_days(first_closing_date, -5))
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=100,
+			posting_date=add_days(second_closing_date, -5))
+
+		rebuild_closing_balances(add_days(first_closing_date, -5), item_code=item_code, warehouse=warehouse)
+
+		closing_balances = frappe.get_all("Stock Closing Balance", fields=["closing_date", "qty_after_transaction"],
+			filters={"item_code": item_code, "warehouse": warehouse}, order_by="closing_date")
+		self.assertEqual([(getdate(d.closing_date), d.qty_after_transaction) for d in closing_balances],
+			[(getdate(first_closing_date), 10), (getdate(second_closing_date), 15)])
+
+	def test_stock_balance_report_from_closing_balance(self):
+		from erpnext.stock.report.stock_balance.stock_balance import execute
+
+		item_code = make_item("_Test Item For Closing Balance Report", {"is_stock_item": 1}).name
+		warehouse = "_Test Warehouse - _TC"
+		closing_date = get_last_day(add_months(nowdate(), -3))
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+			posting_date=add_days(closing_date, -5))
+		make_stock_entry(item_code=item_code, source=warehouse, qty=3,
+			posting_date=add_days(closing_date, 5))
+		make_stock_entry(item_code=item_code, target=warehouse, qty=4, basic_rate=120,
+			posting_date=add_days(closing_date, 40))
+
+		filters = frappe._dict(company="_Test Company", item_code=item_code,
+			from_date=add_days(closing_date, 35), to_date=nowdate())
+		data_before = execute(filters)[1]
+
+		create_closing_balances(closing_date)
+		create_closing_balances(get_last_day(add_days(closing_date, 1)))
+		data_after = execute(filters)[1]
+
+		self.assertEqual(data_after, data_before)
+		self.assertEqual((data_after[0]["opening_qty"], data_after[0]["in_qty"], data_after[0]["bal_qty"]),
+			(7, 4, 11))
@@ -1527,12 +1527,12 @@ def get_uom_details(item_code, uom, qty):
 
 @frappe.whitelist()
 def get_expired_batch_items():
-	return frappe.db.sql("""select b.item, sum(sle.actual_qty) as qty, sle.batch_no, sle.warehouse, sle.stock_uom\
-	from `tabBatch` b, `tabStock Ledger Entry` sle
+	return frappe.db.sql("""select b.item, bb.actual_qty as qty, bb.batch_no, bb.warehouse, i.stock_uom\
+	from `tabBatch` b, `tabBatch Balance` bb, `tabItem` i
 	where b.expiry_date <= %s
 	and b.expiry_date is not NULL
-	and b.batch_id = sle.batch_no
-	group by sle.warehouse, sle.item_code, sle.batch_no""",(nowdate()), as_dict=1)
+	and b.batch_id = bb.batch_no
+	and i.name = bb.item_code""",(nowdate()), as_dict=1)
 
 @frappe.whitelist()
 def get_warehouse_details(args):
@@ -5,11 +5,12 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt, getdate, add_days, formatdate
+from frappe.utils import getdate, add_days, formatdate
 from frappe.model.document import Document
 from datetime import date
 from erpnext.controllers.item_variant import ItemTemplateCannotHaveStock
 from erpnext.accounts.utils import get_fiscal_year
+from erpnext.stock.doctype.batch_balance.batch_balance import get_batch_balance
 
 class StockFreezeError(frappe.ValidationError): pass
 
@@ -46,10 +47,7 @@ class StockLedgerEntry(Document):
 	#check for item quantity available in stock
 	def actual_amt_check(self):
 		if self.batch_no and not self.get("allow_negative_stock"):
-			batch_bal_after_transaction = flt(frappe.db.sql("""select sum(actual_qty)
-				from `tabStock Ledger Entry`
-				where warehouse=%s and item_code=%s and batch_no=%s""",
-				(self.warehouse, self.item_code, self.batch_no))[0][0])
+			batch_bal_after_transaction = get_batch_balance(self.batch_no, self.warehouse)
 
 			if batch_bal_after_transaction < 0:
 				frappe.throw(_("Stock balance in Batch {0} will become negative {1} for Item {2} at Warehouse {3}")
@@ -139,6 +137,19 @@ def on_doctype_update():
 			fields=["posting_date", "posting_time", "name"],
 			index_name="posting_sort_index")
 
+	# sort orders of the chunks read by `erpnext.stock.utils.iterate_stock_ledger_entries`
+	if not frappe.db.has_index('tabStock Ledger Entry', 'posting_creation_sort_index'):
+		frappe.db.commit()
+		frappe.db.add_index("Stock Ledger Entry",
+			fields=["posting_date", "posting_time", "creation", "name"],
+			index_name="posting_creation_sort_index")
+
+	if not frappe.db.has_index('tabStock Ledger Entry', 'item_posting_sort_index'):
+		frappe.db.commit()
+		frappe.db.add_index("Stock Ledger Entry",
+			fields=["item_code", "posting_date", "posting_time", "creation", "actual_qty", "name"],
+			index_name="item_posting_sort_index")
+
 	frappe.db.add_index("Stock Ledger Entry", ["voucher_no", "voucher_type"])
 	frappe.db.add_index("Stock Ledger Entry", ["batch_no", "item_code", "warehouse"])
 
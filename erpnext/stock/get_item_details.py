@@ -106,6 +106,90 @@ def get_item_details(args, doc=None, for_validate=False, overwrite_warehouse=Tru
 
 	return out
 
+@frappe.whitelist()
+def get_items_details(args_list, doc=None, for_validate=False, overwrite_warehouse=True):
+	"""Returns the details of each item row in `args_list`, same as `get_item_details`
+	for each row.
+
+	The Items, Item Prices, Bins and UOM conversion factors of all the rows are
+	fetched together before the rows are filled"""
+	if isinstance(args_list, string_types):
+		args_list = json.loads(args_list)
+
+	if isinstance(doc, string_types):
+		doc = json.loads(doc)
+
+	args_list = [process_args(args) for args in args_list]
+
+	frappe.flags.item_details_prefetch = prefetch_item_details(args_list)
+	try:
+		return [get_item_details(args, doc, for_validate=for_validate,
+			overwrite_warehouse=overwrite_warehouse) for args in args_list]
+	finally:
+		frappe.flags.item_details_prefetch = None
+
+def prefetch_item_details(args_list):
+	prefetched = {}
+
+	item_codes = list(set(args.item_code for args in args_list if args.item_code))
+	if not item_codes:
+		return prefetched
+
+	items = frappe.get_all("Item", filters={"name": ("in", item_codes)},
+		fields=["name", "variant_of", "stock_uom", "default_item_manufacturer", "default_manufacturer_part_no"])
+
+	variant_of = {}
+	for d in items:
+		prefetched[("Item", d.name)] = frappe._dict({
+			"default_item_manufacturer": d.default_item_manufacturer,
+			"default_manufacturer_part_no": d.default_manufacturer_part_no
+		})
+		variant_of[d.name] = d.variant_of
+
+	# prices of the templates are used for the variants
+	all_item_codes = tuple(set(item_codes + [d for d in variant_of.values() if d]))
+
+	price_lists = tuple(set(args.price_list for args in args_list if args.price_list))
+	if price_lists:
+		for item_code in all_item_codes:
+			for price_list in price_lists:
+				prefetched[("Item Price", item_code, price_list)] = []
+
+		for d in frappe.db.sql("""select name, item_code, price_list, price_list_rate, uom,
+				customer, supplier, valid_from, valid_upto, packing_unit
+			from `tabItem Price`
+			where item_code in %(item_codes)s and price_list in %(price_lists)s
+			order by valid_from desc, uom desc""",
+			{"item_codes": all_item_codes, "price_lists": price_lists}, as_dict=1):
+			prefetched.setdefault(("Item Price", d.item_code, d.price_list), []).append(d)
+			prefetched[("Item Price", d.name)] = d
+
+	for item_code in item_codes:
+		prefetched[("Bin", item_code)] = {}
+
+	for d in frappe.db.sql("""select item_code, warehouse, projected_qty, actual_qty, reserved_qty, valuation_rate
+		from `tabBin` where item_code in %(item_codes)s""", {"item_codes": tuple(item_codes)}, as_dict=1):
+		prefetched.setdefault(("Bin", d.item_code), {})[d.warehouse] = d
+
+	conversion_factors = {}
+	for d in frappe.db.sql("""select parent, uom, conversion_factor from `tabUOM Conversion Detail`
+		where parent in %(item_codes)s""", {"item_codes": all_item_codes}, as_dict=1):
+		conversion_factors.setdefault(d.parent, {}).setdefault(d.uom, d.conversion_factor)
+
+	for item_code in item_codes:
+		# conversion factors of the item take precedence over its template's
+		item_conversion_factors = dict(conversion_factors.get(variant_of.get(item_code)) or {})
+		item_conversion_factors.update(conversion_factors.get(item_code) or {})
+		prefetched[("UOM Conversion Detail", item_code)] = item_conversion_factors
+
+	return prefetched
+
+def get_prefetched_details(key):
+	"""Returns the details prefetched by `get_items_details` for the key,
+	None if they are not prefetched"""
+	if frappe.flags.item_details_prefetch:
+		return frappe.flags.item_details_prefetch.get(key)
+
 def update_stock(args, out):
 	if (args.get("doctype") == "Delivery Note" or
 		(args.get("doctype") == "Sales Invoice" and args.get('update_stock'))) \
@@ -340,7 +424,7 @@ def get_basic_details(args, item, overwrite_warehouse=True):
 			out["manufacturer_part_no"] = None
 			out["manufacturer"] = None
 	else:
-		data = frappe.get_value("Item", item.name,
+		data = get_prefetched_details(("Item", item.name)) or frappe.get_value("Item", item.name,
 			["default_item_manufacturer", "default_manufacturer_part_no"] , as_dict=1)
 
 		if data:
@@ -636,6 +720,10 @@ def get_item_price(args, item_code, ignore_party=False):
 
 	args['item_code'] = item_code
 
+	item_prices = get_prefetched_details(("Item Price", item_code, args.get("price_list")))
+	if item_prices is not None:
+		return filter_item_prices(item_prices, args, ignore_party)
+
 	conditions = """where item_code=%(item_code)s
 		and price_list=%(price_list)s
 		and ifnull(uom, '') in ('', %(uom)s)"""
@@ -656,6 +744,30 @@ def get_item_price(args, item_code, ignore_party=False):
 		from `tabItem Price` {conditions}
 		order by valid_from desc, uom desc """.format(conditions=conditions), args)
 
+def filter_item_prices(item_prices, args, ignore_party=False):
+	"""Returns name, price_list_rate and uom of the prefetched Item Prices
+	which match the conditions of `get_item_price`"""
+	out = []
+	for d in item_prices:
+		if (d.uom or '') not in ('', args.get("uom") or ''):
+			continue
+
+		if not ignore_party:
+			if args.get("customer"):
+				if d.customer != args.get("customer"): continue
+			elif args.get("supplier"):
+				if d.supplier != args.get("supplier"): continue
+			elif d.customer or d.supplier:
+				continue
+
+		if args.get('transaction_date') and not (getdate(d.valid_from or '2000-01-01')
+			<= getdate(args.get('transaction_date')) <= getdate(d.valid_upto or '2500-12-31')):
+			continue
+
+		out.append((d.name, d.price_list_rate, d.uom))
+
+	return out
+
 def get_price_list_rate_for(args, item_code):
 	"""
 		:param customer: link to Customer DocType
@@ -712,7 +824,8 @@ def check_packing_list(price_list_rate_name, desired_qty, item_code):
 	"""
 
 	flag = True
-	item_price = frappe.get_doc("Item Price", price_list_rate_name)
+	item_price = get_prefetched_details(("Item Price", price_list_rate_name)) \
+		or frappe.get_doc("Item Price", price_list_rate_name)
 	if item_price.packing_unit:
 		packing_increment = desired_qty % item_price.packing_unit
 
@@ -858,12 +971,17 @@ def get_serial_no_batchwise(args, sales_order=None):
 
 @frappe.whitelist()
 def get_conversion_factor(item_code, uom):
-	variant_of = frappe.db.get_value("Item", item_code, "variant_of", cache=True)
-	filters = {"parent": item_code, "uom": uom}
-	if variant_of:
-		filters["parent"] = ("in", (item_code, variant_of))
-	conversion_factor = frappe.db.get_value("UOM Conversion Detail",
-		filters, "conversion_factor")
+	conversion_factors = get_prefetched_details(("UOM Conversion Detail", item_code))
+	if conversion_factors is not None:
+		conversion_factor = conversion_factors.get(uom)
+	else:
+		variant_of = frappe.db.get_value("Item", item_code, "variant_of", cache=True)
+		filters = {"parent": item_code, "uom": uom}
+		if variant_of:
+			filters["parent"] = ("in", (item_code, variant_of))
+		conversion_factor = frappe.db.get_value("UOM Conversion Detail",
+			filters, "conversion_factor")
+
 	if not conversion_factor:
 		stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
 		conversion_factor = get_uom_conv_factor(uom, stock_uom)
@@ -876,6 +994,15 @@ def get_projected_qty(item_code, warehouse):
 
 @frappe.whitelist()
 def get_bin_details(item_code, warehouse):
+	bins = get_prefetched_details(("Bin", item_code))
+	if bins is not None:
+		bin_details = bins.get(warehouse) or {}
+		return frappe._dict({
+			"projected_qty": flt(bin_details.get("projected_qty")),
+			"actual_qty": flt(bin_details.get("actual_qty")),
+			"reserved_qty": flt(bin_details.get("reserved_qty"))
+		})
+
 	return frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
 		["projected_qty", "actual_qty", "reserved_qty"], as_dict=True, cache=True) \
 			or {"projected_qty": 0, "actual_qty": 0, "reserved_qty": 0}
@@ -1029,6 +1156,10 @@ def get_valuation_rate(item_code, company, warehouse=None):
 		if not warehouse:
 			warehouse = item.get("default_warehouse") or item_group.get("default_warehouse") or brand.get("default_warehouse")
 
+		bins = get_prefetched_details(("Bin", item_code))
+		if bins is not None:
+			return {"valuation_rate": bins[warehouse].valuation_rate} if warehouse in bins else {"valuation_rate": 0}
+
 		return frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
 			["valuation_rate"], as_dict=True) or {"valuation_rate": 0}
 
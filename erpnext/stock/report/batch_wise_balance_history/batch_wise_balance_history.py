@@ -48,9 +48,7 @@ def get_conditions(filters):
 	if not filters.get("from_date"):
 		frappe.throw(_("'From Date' is required"))
 
-	if filters.get("to_date"):
-		conditions += " and posting_date <= '%s'" % filters["to_date"]
-	else:
+	if not filters.get("to_date"):
 		frappe.throw(_("'To Date' is required"))
 
 	for field in ["item_code", "warehouse", "batch_no", "company"]:
@@ -61,40 +59,54 @@ def get_conditions(filters):
 
 #get all details
 def get_stock_ledger_entries(filters):
+	"""Entries from the From Date, the balances before it are derived from the
+	current Batch Balances"""
 	conditions = get_conditions(filters)
 	return frappe.db.sql("""
 		select item_code, batch_no, warehouse, posting_date, sum(actual_qty) as actual_qty
 		from `tabStock Ledger Entry`
-		where docstatus < 2 and ifnull(batch_no, '') != '' %s
+		where docstatus < 2 and ifnull(batch_no, '') != '' and posting_date >= %(from_date)s {0}
 		group by voucher_no, batch_no, item_code, warehouse
-		order by item_code, warehouse""" %
-		conditions, as_dict=1)
+		order by item_code, warehouse""".format(conditions), filters, as_dict=1)
+
+def get_batch_balances(filters):
+	conditions = get_conditions(filters)
+	return frappe.db.sql("""
+		select item_code, batch_no, warehouse, actual_qty
+		from `tabBatch Balance`
+		where 1=1 %s""" % conditions, as_dict=1)
 
 def get_item_warehouse_batch_map(filters, float_precision):
-	sle = get_stock_ledger_entries(filters)
 	iwb_map = {}
 
-	from_date = getdate(filters["from_date"])
 	to_date = getdate(filters["to_date"])
 
-	for d in sle:
-		iwb_map.setdefault(d.item_code, {}).setdefault(d.warehouse, {})\
+	def get_qty_dict(d):
+		return iwb_map.setdefault(d.item_code, {}).setdefault(d.warehouse, {})\
 			.setdefault(d.batch_no, frappe._dict({
 				"opening_qty": 0.0, "in_qty": 0.0, "out_qty": 0.0, "bal_qty": 0.0
 			}))
-		qty_dict = iwb_map[d.item_code][d.warehouse][d.batch_no]
-		if d.posting_date < from_date:
-			qty_dict.opening_qty = flt(qty_dict.opening_qty, float_precision) \
-				+ flt(d.actual_qty, float_precision)
-		elif d.posting_date >= from_date and d.posting_date <= to_date:
-			if flt(d.actual_qty) > 0:
-				qty_dict.in_qty = flt(qty_dict.in_qty, float_precision) + flt(d.actual_qty, float_precision)
-			else:
-				qty_dict.out_qty = flt(qty_dict.out_qty, float_precision) \
-					+ abs(flt(d.actual_qty, float_precision))
 
+	# balance as on the To Date is the current balance less the entries after it
+	for d in get_batch_balances(filters):
+		qty_dict = get_qty_dict(d)
 		qty_dict.bal_qty = flt(qty_dict.bal_qty, float_precision) + flt(d.actual_qty, float_precision)
 
+	for d in get_stock_ledger_entries(filters):
+		qty_dict = get_qty_dict(d)
+		if d.posting_date > to_date:
+			qty_dict.bal_qty = flt(qty_dict.bal_qty, float_precision) - flt(d.actual_qty, float_precision)
+		elif flt(d.actual_qty) > 0:
+			qty_dict.in_qty = flt(qty_dict.in_qty, float_precision) + flt(d.actual_qty, float_precision)
+		else:
+			qty_dict.out_qty = flt(qty_dict.out_qty, float_precision) \
+				+ abs(flt(d.actual_qty, float_precision))
+
+	for item in iwb_map.values():
+		for warehouse in item.values():
+			for qty_dict in warehouse.values():
+				qty_dict.opening_qty = flt(qty_dict.bal_qty - qty_dict.in_qty + qty_dict.out_qty, float_precision)
+
 	return iwb_map
 
 def get_item_details(filters):
@@ -7,16 +7,17 @@ from frappe import _
 from frappe.utils import date_diff, flt
 from six import iteritems
 from erpnext.stock.doctype.serial_no.serial_no import get_serial_nos
+from erpnext.stock.utils import iterate_stock_ledger_entries
+from erpnext.stock.valuation import FIFOQueue
 
 def execute(filters=None):
 
 	columns = get_columns(filters)
-	item_details = get_fifo_queue(filters)
 	to_date = filters["to_date"]
 	_func = lambda x: x[1]
 
 	data = []
-	for item, item_dict in iteritems(item_details):
+	for item, item_dict in iterate_fifo_queues(filters):
 		earliest_age, latest_age = 0, 0
 
 		fifo_queue = sorted(filter(_func, item_dict["fifo_queue"]), key=_func)
@@ -138,16 +139,35 @@ def get_columns(filters):
 	return columns
 
 def get_fifo_queue(filters, sle=None):
-	item_details = {}
-	transferred_item_details = {}
-	serial_no_batch_purchase_details = {}
+	return dict(iterate_fifo_queues(filters, sle))
 
+def iterate_fifo_queues(filters, sle=None):
+	"""Yields the FIFO queue of each item, or item and warehouse, as soon as
+	the entries of the item are consumed, so that the queues of one item at a
+	time are held in memory. The entries are streamed from the database
+	ordered by item if `sle` is not given"""
 	if sle == None:
 		sle = get_stock_ledger_entries(filters)
+	else:
+		sle = sorted(sle, key=lambda d: d.name)
+
+	item_code = None
+	item_details = {}
+	transferred_item_details = {}
+	serial_no_batch_purchase_details = {}
 
 	for d in sle:
+		if d.name != item_code:
+			for key, details in get_item_queues(item_details):
+				yield key, details
+
+			item_code = d.name
+			item_details = {}
+			transferred_item_details = {}
+			serial_no_batch_purchase_details = {}
+
 		key = (d.name, d.warehouse) if filters.get('show_warehouse_wise_stock') else d.name
-		item_details.setdefault(key, {"details": d, "fifo_queue": []})
+		item_details.setdefault(key, {"details": d, "fifo_queue": FIFOQueue()})
 		fifo_queue = item_details[key]["fifo_queue"]
 
 		transferred_item_key = (d.voucher_no, d.name, d.warehouse)
@@ -175,21 +195,13 @@ def get_fifo_queue(filters, sle=None):
 					fifo_queue.append([d.actual_qty, d.posting_date])
 		else:
 			if serial_no_list:
-				fifo_queue[:] = [serial_no for serial_no in fifo_queue if serial_no[0] not in serial_no_list]
+				fifo_queue.remove_batches(lambda batch: batch[0] in serial_no_list)
 			else:
-				qty_to_pop = abs(d.actual_qty)
-				while qty_to_pop:
-					batch = fifo_queue[0] if fifo_queue else [0, None]
-					if 0 < flt(batch[0]) <= qty_to_pop:
-						# if batch qty > 0
-						# not enough or exactly same qty in current batch, clear batch
-						qty_to_pop -= flt(batch[0])
-						transferred_item_details[transferred_item_key].append(fifo_queue.pop(0))
-					else:
-						# all from current batch
-						batch[0] = flt(batch[0]) - qty_to_pop
-						transferred_item_details[transferred_item_key].append([qty_to_pop, batch[1]])
-						qty_to_pop = 0
+				consumed_batches, pending_qty = fifo_queue.consume(d.actual_qty)
+				transferred_item_details[transferred_item_key].extend(consumed_batches)
+				if pending_qty:
+					# stock not available in queue
+					transferred_item_details[transferred_item_key].append([pending_qty, None])
 
 		item_details[key]["qty_after_transaction"] = d.qty_after_transaction
 
@@ -198,23 +210,30 @@ def get_fifo_queue(filters, sle=None):
 		else:
 			item_details[key]["total_qty"] += d.actual_qty
 
-	return item_details
+	for key, details in get_item_queues(item_details):
+		yield key, details
+
+def get_item_queues(item_details):
+	for key, details in iteritems(item_details):
+		details["fifo_queue"] = details["fifo_queue"].get_state()
+		yield key, details
 
 def get_stock_ledger_entries(filters):
-	return frappe.db.sql("""select
-			item.name, item.item_name, item_group, brand, description, item.stock_uom,
-			actual_qty, posting_date, voucher_type, voucher_no, serial_no, batch_no, qty_after_transaction, warehouse
-		from `tabStock Ledger Entry` sle,
+	"""Stock Ledger Entries ordered by item, read in chunks as they are consumed"""
+	return iterate_stock_ledger_entries(
+		fields="""item.name, item.item_name, item_group, brand, description, item.stock_uom,
+			actual_qty, posting_date, voucher_type, voucher_no, serial_no, batch_no, qty_after_transaction, warehouse""",
+		tables="""`tabStock Ledger Entry` sle,
 			(select name, item_name, description, stock_uom, brand, item_group
-				from `tabItem` {item_conditions}) item
-		where item_code = item.name and
+				from `tabItem` {item_conditions}) item""".format(item_conditions=get_item_conditions(filters)),
+		conditions="""item_code = item.name and
 			company = %(company)s and
 			posting_date <= %(to_date)s and
 			is_cancelled != 1
-			{sle_conditions}
-			order by posting_date, posting_time, sle.creation, actual_qty""" #nosec
-		.format(item_conditions=get_item_conditions(filters),
-			sle_conditions=get_sle_conditions(filters)), filters, as_dict=True)
+			{sle_conditions}""".format(sle_conditions=get_sle_conditions(filters)),
+		values=filters,
+		sort_fields=["sle.item_code", "sle.posting_date", "sle.posting_time", "sle.creation",
+			"sle.actual_qty", "sle.name"])
 
 def get_item_conditions(filters):
 	conditions = []
@@ -0,0 +1,58 @@
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import nowdate, add_days
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from erpnext.stock.utils import iterate_stock_ledger_entries
+from erpnext.stock.report.stock_ageing.stock_ageing import execute
+
+class TestStockAgeing(unittest.TestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_streamed_entries(self):
+		items = [make_item("_Test Item For Ageing {0}".format(i), {"is_stock_item": 1}).name for i in range(2)]
+		for days in (-20, -10, -5):
+			for item_code in items:
+				make_stock_entry(item_code=item_code, target="_Test Warehouse - _TC", qty=5, basic_rate=100,
+					posting_date=add_days(nowdate(), days))
+		make_stock_entry(item_code=items[0], source="_Test Warehouse - _TC", qty=7)
+
+		entries = {}
+		for chunk_size in (2, 1000):
+			entries[chunk_size] = [sle.name for sle in iterate_stock_ledger_entries("sle.name",
+				"sle.item_code in %(items)s", {"items": tuple(items)}, ["sle.item_code", "sle.posting_date",
+				"sle.posting_time", "sle.creation", "sle.actual_qty", "sle.name"], chunk_size=chunk_size)]
+
+		self.assertEqual(len(entries[2]), 7)
+		self.assertEqual(entries[2], entries[1000])
+
+		data = execute(frappe._dict(company="_Test Company", to_date=nowdate()))[1]
+		rows = dict((row[0], row) for row in data if row[0] in items)
+		self.assertEqual((rows[items[0]][5], rows[items[1]][5]), (8, 15))
+		self.assertEqual(rows[items[0]][8], 5)
+
+	def test_entries_at_same_posting_time(self):
+		item_code = make_item("_Test Item For Ageing Same Time", {"is_stock_item": 1}).name
+		posting_date = add_days(nowdate(), -3)
+
+		# entries at the same posting datetime are read in the order they were made
+		names = []
+		for i in range(4):
+			se = make_stock_entry(item_code=item_code, target="_Test Warehouse - _TC", qty=5, basic_rate=100,
+				posting_date=posting_date, posting_time="10:00:00")
+			names.append(frappe.db.get_value("Stock Ledger Entry", {"voucher_no": se.name}, "name"))
+		se = make_stock_entry(item_code=item_code, source="_Test Warehouse - _TC", qty=20,
+			posting_date=posting_date, posting_time="10:00:00")
+		names.append(frappe.db.get_value("Stock Ledger Entry", {"voucher_no": se.name}, "name"))
+
+		entries = [sle.name for sle in iterate_stock_ledger_entries("sle.name", "sle.item_code = %(item_code)s",
+			{"item_code": item_code}, ["sle.item_code", "sle.posting_date", "sle.posting_time", "sle.creation",
+			"sle.actual_qty", "sle.name"], chunk_size=1)]
+		self.assertEqual(entries, names)
+
+		# the issue consumes the receipts before it, no stock is left
+		data = execute(frappe._dict(company="_Test Company", to_date=nowdate()))[1]
+		self.assertFalse([row for row in data if row[0] == item_code])
@@ -26,18 +26,23 @@ def execute(filters=None):
 	include_uom = filters.get("include_uom")
 	columns = get_columns(filters)
 	items = get_items(filters)
-	sle = get_stock_ledger_entries(filters, items)
+
+	# only the entries of the period are read, the opening balances are
+	# from the Stock Closing Balances and the entries after them
+	opening_balances = get_opening_balances(filters, items)
+	sle = get_stock_ledger_entries(filters, items, from_date=from_date)
 
 	if filters.get('show_stock_ageing_data'):
 		filters['show_warehouse_wise_stock'] = True
-		item_wise_fifo_queue = get_fifo_queue(filters, sle)
+		item_wise_fifo_queue = get_fifo_queue(filters, get_stock_ledger_entries(filters, items))
 
 	# if no stock ledger entry found return
-	if not sle:
+	if not sle and not opening_balances:
 		return columns, []
 
-	iwb_map = get_item_warehouse_map(filters, sle)
-	item_map = get_item_details(items, sle, filters)
+	iwb_map = get_item_warehouse_map(filters, sle, opening_balances)
+	item_map = get_item_details(items or list(set(item for (company, item, warehouse) in iwb_map)),
+		sle, filters)
 	item_reorder_detail_map = get_item_reorder_details(item_map.keys())
 
 	data = []
@@ -133,30 +138,40 @@ def get_conditions(filters):
 	else:
 		frappe.throw(_("'To Date' is required"))
 
+	return conditions + get_warehouse_conditions(filters)
+
+def get_warehouse_conditions(filters, alias="sle"):
+	conditions = ""
 	if filters.get("company"):
-		conditions += " and sle.company = %s" % frappe.db.escape(filters.get("company"))
+		conditions += " and {0}.company = {1}".format(alias, frappe.db.escape(filters.get("company")))
 
 	if filters.get("warehouse"):
 		warehouse_details = frappe.db.get_value("Warehouse",
 			filters.get("warehouse"), ["lft", "rgt"], as_dict=1)
 		if warehouse_details:
 			conditions += " and exists (select name from `tabWarehouse` wh \
-				where wh.lft >= %s and wh.rgt <= %s and sle.warehouse = wh.name)"%(warehouse_details.lft,
-				warehouse_details.rgt)
+				where wh.lft >= %s and wh.rgt <= %s and %s.warehouse = wh.name)"%(warehouse_details.lft,
+				warehouse_details.rgt, alias)
 
 	if filters.get("warehouse_type") and not filters.get("warehouse"):
 		conditions += " and exists (select name from `tabWarehouse` wh \
-			where wh.warehouse_type = '%s' and sle.warehouse = wh.name)"%(filters.get("warehouse_type"))
+			where wh.warehouse_type = '%s' and %s.warehouse = wh.name)"%(filters.get("warehouse_type"), alias)
 
 	return conditions
 
-def get_stock_ledger_entries(filters, items):
-	item_conditions_sql = ''
-	if items:
-		item_conditions_sql = ' and sle.item_code in ({})'\
-			.format(', '.join([frappe.db.escape(i, percent=False) for i in items]))
+def get_item_conditions(items, alias="sle", percent=False):
+	if not items:
+		return ""
+
+	return " and {0}.item_code in ({1})".format(alias,
+		", ".join([frappe.db.escape(i, percent=percent) for i in items]))
+
+def get_stock_ledger_entries(filters, items, from_date=None):
+	item_conditions_sql = get_item_conditions(items)
 
 	conditions = get_conditions(filters)
+	if from_date:
+		conditions += " and sle.posting_date >= %s" % frappe.db.escape(from_date)
 
 	return frappe.db.sql("""
 		select
@@ -169,13 +184,67 @@ def get_stock_ledger_entries(filters, items):
 		order by sle.posting_date, sle.posting_time, sle.creation, sle.actual_qty""" % #nosec
 		(item_conditions_sql, conditions), as_dict=1)
 
-def get_item_warehouse_map(filters, sle):
+def get_opening_balances(filters, items):
+	'''Balance of each item and warehouse before the from date, as
+	{(company, item_code, warehouse): balance}. Taken from the latest Stock
+	Closing Balance before the from date and the last entry after it, so
+	that only the entries of the partial month are read'''
+	from_date = getdate(filters.get("from_date"))
+	conditions = get_warehouse_conditions(filters, "scb") + get_item_conditions(items, "scb", percent=True)
+
+	closing_balances_query = """
+		select scb.company, scb.item_code, scb.warehouse, scb.closing_date, scb.qty_after_transaction,
+			scb.valuation_rate, scb.stock_value
+		from `tabStock Closing Balance` scb,
+			(select item_code, warehouse, max(closing_date) as closing_date
+			from `tabStock Closing Balance` scb
+			where closing_date < %(from_date)s {conditions}
+			group by item_code, warehouse) latest
+		where scb.item_code = latest.item_code and scb.warehouse = latest.warehouse
+			and scb.closing_date = latest.closing_date
+	""".format(conditions=conditions)
+
+	opening_balances = {}
+	for d in frappe.db.sql(closing_balances_query, {"from_date": from_date}, as_dict=1):
+		opening_balances[(d.company, d.item_code, d.warehouse)] = d
+
+	# last entry of each item and warehouse after its closing balance
+	order_by = "order by sle.posting_date desc, sle.posting_time desc, sle.creation desc, sle.actual_qty desc"
+	for d in frappe.db.sql("""
+		select
+			sle.company, sle.item_code, sle.warehouse,
+			substring_index(group_concat(sle.qty_after_transaction {order_by}), ',', 1) as qty_after_transaction,
+			substring_index(group_concat(sle.valuation_rate {order_by}), ',', 1) as valuation_rate,
+			substring_index(group_concat(sle.stock_value {order_by}), ',', 1) as stock_value
+		from `tabStock Ledger Entry` sle
+			left join ({closing_balances_query}) scb
+			on scb.item_code = sle.item_code and scb.warehouse = sle.warehouse
+		where sle.docstatus < 2 and sle.posting_date < %(from_date)s
+			and (scb.closing_date is null or sle.posting_date > scb.closing_date) {conditions}
+		group by sle.company, sle.item_code, sle.warehouse
+	""".format(order_by=order_by, closing_balances_query=closing_balances_query,
+		conditions=get_warehouse_conditions(filters) + get_item_conditions(items, percent=True)),
+		{"from_date": from_date}, as_dict=1):
+		opening_balances[(d.company, d.item_code, d.warehouse)] = d
+
+	return opening_balances
+
+def get_item_warehouse_map(filters, sle, opening_balances=None):
 	iwb_map = {}
 	from_date = getdate(filters.get("from_date"))
 	to_date = getdate(filters.get("to_date"))
 
 	float_precision = cint(frappe.db.get_default("float_precision")) or 3
 
+	for key, balance in iteritems(opening_balances or {}):
+		iwb_map[key] = frappe._dict({
+			"opening_qty": flt(balance.qty_after_transaction), "opening_val": flt(balance.stock_value),
+			"in_qty": 0.0, "in_val": 0.0,
+			"out_qty": 0.0, "out_val": 0.0,
+			"bal_qty": flt(balance.qty_after_transaction), "bal_val": flt(balance.stock_value),
+			"val_rate": flt(balance.valuation_rate)
+		})
+
 	for d in sle:
 		key = (d.company, d.item_code, d.warehouse)
 		if key not in iwb_map:
@@ -5,15 +5,15 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 from frappe.utils import cint, flt
-from erpnext.stock.utils import update_included_uom_in_report
+from erpnext.stock.utils import update_included_uom_in_report, iterate_stock_ledger_entries
 from erpnext.stock.doctype.serial_no.serial_no import get_serial_nos
 
 def execute(filters=None):
 	include_uom = filters.get("include_uom")
 	columns = get_columns()
 	items = get_items(filters)
+	item_details = get_item_details(items or get_items_with_entries(filters), include_uom)
 	sl_entries = get_stock_ledger_entries(filters, items)
-	item_details = get_item_details(items, sl_entries, include_uom)
 	opening_row = get_opening_balance(filters, columns)
 	precision = cint(frappe.db.get_single_value("System Settings", "float_precision"))
 
@@ -105,24 +105,32 @@ def get_columns():
 	return columns
 
 def get_stock_ledger_entries(filters, items):
+	"""Stock Ledger Entries of the period, read in chunks as they are consumed"""
+	return iterate_stock_ledger_entries(
+		fields="""concat_ws(" ", posting_date, posting_time) as date,
+			item_code, warehouse, actual_qty, qty_after_transaction, incoming_rate, valuation_rate,
+			stock_value, voucher_type, voucher_no, batch_no, serial_no, company, project, stock_value_difference""",
+		conditions=get_conditions(filters, items),
+		values=filters,
+		sort_fields=["sle.posting_date", "sle.posting_time", "sle.creation", "sle.name"])
+
+def get_items_with_entries(filters):
+	return frappe.db.sql_list("""select distinct item_code from `tabStock Ledger Entry` sle
+		where {0}""".format(get_conditions(filters)), filters)
+
+def get_conditions(filters, items=None):
 	item_conditions_sql = ''
 	if items:
 		item_conditions_sql = 'and sle.item_code in ({})'\
 			.format(', '.join([frappe.db.escape(i) for i in items]))
 
-	return frappe.db.sql("""select concat_ws(" ", posting_date, posting_time) as date,
-			item_code, warehouse, actual_qty, qty_after_transaction, incoming_rate, valuation_rate,
-			stock_value, voucher_type, voucher_no, batch_no, serial_no, company, project, stock_value_difference
-		from `tabStock Ledger Entry` sle
-		where company = %(company)s and
+	return """company = %(company)s and
 			posting_date between %(from_date)s and %(to_date)s
 			{sle_conditions}
-			{item_conditions_sql}
-			order by posting_date asc, posting_time asc, creation asc"""\
-		.format(
+			{item_conditions_sql}""".format(
 			sle_conditions=get_sle_conditions(filters),
 			item_conditions_sql = item_conditions_sql
-		), filters, as_dict=1)
+		)
 
 def get_items(filters):
 	conditions = []
@@ -140,11 +148,8 @@ def get_items(filters):
 			.format(" and ".join(conditions)), filters)
 	return items
 
-def get_item_details(items, sl_entries, include_uom):
+def get_item_details(items, include_uom):
 	item_details = {}
-	if not items:
-		items = list(set([d.item_code for d in sl_entries]))
-
 	if not items:
 		return item_details
 
@@ -172,6 +172,147 @@ def update_bin_qty(item_code, warehouse, qty_dict=None):
 		bin.db_update()
 		bin.clear_cache()
 
+BIN_UPDATE_BATCH_SIZE = 500
+
+bin_qty_fields = ("reserved_qty", "indented_qty", "ordered_qty", "planned_qty")
+
+def repost_bin_qty(item_code=None, warehouse=None):
+	"""Recompute the reserved, indented, ordered and planned qty of all the Bins
+	with one grouped query per qty, and correct the Bins which differ. Returns
+	the corrected Bins, with the earlier values as `bin_reserved_qty` etc., to
+	be run as a nightly consistency check. Use `repost` for the actual qty
+
+		bench --site [site] execute erpnext.stock.stock_balance.repost_bin_qty
+	"""
+	filters = frappe._dict(item_code=item_code, warehouse=warehouse)
+
+	qty_by_bin = {}
+	for fieldname, get_qty in (("reserved_qty", get_reserved_qty_by_bin),
+		("indented_qty", get_indented_qty_by_bin), ("ordered_qty", get_ordered_qty_by_bin),
+		("planned_qty", get_planned_qty_by_bin)):
+		for d in get_qty(filters):
+			qty_by_bin.setdefault((d[0], d[1]), frappe._dict())[fieldname] = flt(d[2])
+
+	drifted_bins = []
+	for bin in frappe.db.sql("""select name, item_code, warehouse, actual_qty, {0},
+		reserved_qty_for_production, reserved_qty_for_sub_contract
+		from `tabBin` where 1=1 {1}""".format(", ".join(bin_qty_fields),
+			get_conditions(filters, "item_code", "warehouse")), filters, as_dict=1):
+		qty_dict = qty_by_bin.get((bin.item_code, bin.warehouse), {})
+		if all(flt(bin.get(fieldname), 6) == flt(qty_dict.get(fieldname), 6) for fieldname in bin_qty_fields):
+			continue
+
+		drifted_bin = frappe._dict(bin)
+		for fieldname in bin_qty_fields:
+			drifted_bin["bin_" + fieldname] = bin.get(fieldname)
+			drifted_bin[fieldname] = flt(qty_dict.get(fieldname))
+
+		drifted_bin.projected_qty = (flt(bin.actual_qty) + drifted_bin.ordered_qty + drifted_bin.indented_qty
+			+ drifted_bin.planned_qty - drifted_bin.reserved_qty - flt(bin.reserved_qty_for_production)
+			- flt(bin.reserved_qty_for_sub_contract))
+		drifted_bins.append(drifted_bin)
+
+	update_bins(drifted_bins)
+
+	return drifted_bins
+
+def update_bins(bins):
+	"""Write the qty and projected qty of the Bins, `BIN_UPDATE_BATCH_SIZE` Bins
+	per statement"""
+	fieldnames = bin_qty_fields + ("projected_qty",)
+
+	for start in range(0, len(bins), BIN_UPDATE_BATCH_SIZE):
+		batch = bins[start:start + BIN_UPDATE_BATCH_SIZE]
+
+		values = []
+		for fieldname in fieldnames:
+			for bin in batch:
+				values.extend([bin.name, flt(bin.get(fieldname))])
+		values.extend([bin.name for bin in batch])
+
+		frappe.db.sql("""update `tabBin` set {0} where name in ({1})""".format(
+			", ".join(["`{0}` = case name {1} end".format(fieldname, " ".join(["when %s then %s"] * len(batch)))
+				for fieldname in fieldnames]), ", ".join(["%s"] * len(batch))), tuple(values))
+
+		for bin in batch:
+			frappe.clear_document_cache("Bin", bin.name)
+
+def get_conditions(filters, item_field, warehouse_field):
+	conditions = ""
+	if filters.item_code:
+		conditions += " and {0} = %(item_code)s".format(item_field)
+	if filters.warehouse:
+		conditions += " and {0} = %(warehouse)s".format(warehouse_field)
+
+	return conditions
+
+def get_reserved_qty_by_bin(filters):
+	"""Reserved qty of all the item and warehouses, as in `get_reserved_qty`"""
+	return frappe.db.sql("""
+		select
+			item_code, warehouse, sum(dnpi_qty * ((so_item_qty - so_item_delivered_qty) / so_item_qty))
+		from
+			(
+				(select
+					dnpi.item_code, dnpi.warehouse, dnpi.qty as dnpi_qty, so_item.qty as so_item_qty,
+					so_item.delivered_qty as so_item_delivered_qty, dnpi.parent, dnpi.name
+				from `tabPacked Item` dnpi, `tabSales Order Item` so_item, `tabSales Order` so
+				where so_item.name = dnpi.parent_detail_docname
+					and so_item.delivered_by_supplier = 0
+					and dnpi.parenttype="Sales Order"
+					and dnpi.item_code != dnpi.parent_item
+					and so.name = dnpi.parent and so.docstatus = 1 and so.status != 'Closed'
+					{packed_item_conditions})
+			union
+				(select so_item.item_code, so_item.warehouse, so_item.stock_qty as dnpi_qty,
+					so_item.qty as so_item_qty, so_item.delivered_qty as so_item_delivered_qty,
+					so_item.parent, so_item.name
+				from `tabSales Order Item` so_item, `tabSales Order` so
+				where (so_item.delivered_by_supplier is null or so_item.delivered_by_supplier = 0)
+					and so.name = so_item.parent and so.docstatus = 1
+					and so.status != 'Closed'
+					{so_item_conditions})
+			) tab
+		where
+			so_item_qty >= so_item_delivered_qty
+		group by item_code, warehouse
+	""".format(packed_item_conditions=get_conditions(filters, "dnpi.item_code", "dnpi.warehouse"),
+		so_item_conditions=get_conditions(filters, "so_item.item_code", "so_item.warehouse")), filters)
+
+def get_indented_qty_by_bin(filters):
+	"""Indented qty of all the item and warehouses, as in `get_indented_qty`"""
+	return frappe.db.sql("""
+		select mr_item.item_code, mr_item.warehouse,
+			sum(if(mr.material_request_type = 'Material Issue', -1, 1) * (mr_item.stock_qty - mr_item.ordered_qty))
+		from `tabMaterial Request Item` mr_item, `tabMaterial Request` mr
+		where mr.material_request_type in ('Purchase', 'Manufacture', 'Customer Provided',
+				'Material Transfer', 'Material Issue')
+			and mr_item.stock_qty > mr_item.ordered_qty and mr_item.parent=mr.name
+			and mr.status!='Stopped' and mr.docstatus=1 {0}
+		group by mr_item.item_code, mr_item.warehouse
+	""".format(get_conditions(filters, "mr_item.item_code", "mr_item.warehouse")), filters)
+
+def get_ordered_qty_by_bin(filters):
+	"""Ordered qty of all the item and warehouses, as in `get_ordered_qty`"""
+	return frappe.db.sql("""
+		select po_item.item_code, po_item.warehouse,
+			sum((po_item.qty - po_item.received_qty)*po_item.conversion_factor)
+		from `tabPurchase Order Item` po_item, `tabPurchase Order` po
+		where po_item.qty > po_item.received_qty and po_item.parent=po.name
+			and po.status not in ('Closed', 'Delivered') and po.docstatus=1
+			and po_item.delivered_by_supplier = 0 {0}
+		group by po_item.item_code, po_item.warehouse
+	""".format(get_conditions(filters, "po_item.item_code", "po_item.warehouse")), filters)
+
+def get_planned_qty_by_bin(filters):
+	"""Planned qty of all the item and warehouses, as in `get_planned_qty`"""
+	return frappe.db.sql("""
+		select production_item, fg_warehouse, sum(qty - produced_qty)
+		from `tabWork Order`
+		where status not in ("Stopped", "Completed") and docstatus=1 and qty > produced_qty {0}
+		group by production_item, fg_warehouse
+	""".format(get_conditions(filters, "production_item", "fg_warehouse")), filters)
+
 def set_stock_balance_as_per_serial_no(item_code=None, posting_date=None, posting_time=None,
 	 	fiscal_year=None):
 	if not posting_date: posting_date = nowdate()
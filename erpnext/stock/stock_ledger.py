@@ -6,6 +6,10 @@ import frappe, erpnext
 from frappe import _
 from frappe.utils import cint, flt, cstr, now
 from erpnext.stock.utils import get_valuation_method
+from erpnext.stock.valuation import FIFOValuation
+from erpnext.stock.doctype.stock_closing_balance.stock_closing_balance import (get_closing_balance,
+	invalidate_closing_balances, rebuild_invalidated_closing_balances)
+from erpnext.stock.doctype.batch_balance.batch_balance import update_batch_balance
 import json
 
 from six import iteritems
@@ -13,6 +17,9 @@ from six import iteritems
 # future reposting
 class NegativeStockError(frappe.ValidationError): pass
 
+# number of reposted Stock Ledger Entries written per update statement
+REPOST_BATCH_SIZE = 500
+
 _exceptions = frappe.local('stockledger_exceptions')
 # _exceptions = []
 
@@ -29,7 +36,14 @@ def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via
 			if sle.get('is_cancelled') == 'Yes':
 				sle['actual_qty'] = -flt(sle['actual_qty'])
 
+			invalidate_closing_balances(sle.get("item_code"), sle.get("warehouse"), sle.get("posting_date"))
+
 			if sle.get("actual_qty") or sle.get("voucher_type")=="Stock Reconciliation":
+				# the batch balance is checked against negative stock when the entry is submitted
+				if sle.get("batch_no") and sle.get("actual_qty"):
+					update_batch_balance(sle.get("item_code"), sle.get("warehouse"), sle.get("batch_no"),
+						sle.get("actual_qty"), sle.get("company"))
+
 				sle_id = make_entry(sle, allow_negative_stock, via_landed_cost_voucher)
 
 			args = sle.copy()
@@ -76,7 +90,8 @@ class update_entries_after(object):
 				"posting_time": "12:00"
 			}
 	"""
-	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False, verbose=1):
+	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False,
+			verbose=1, only_current_voucher=False, repost_doc=None, batch_size=None):
 		from frappe.model.meta import get_field_precision
 
 		self.exceptions = []
@@ -84,6 +99,14 @@ class update_entries_after(object):
 		self.allow_zero_rate = allow_zero_rate
 		self.allow_negative_stock = allow_negative_stock
 		self.via_landed_cost_voucher = via_landed_cost_voucher
+		self.only_current_voucher = only_current_voucher
+		self.repost_doc = repost_doc
+		self.batch_size = cint(batch_size) or REPOST_BATCH_SIZE
+		self.entries_to_update = []
+		# vouchers already recorded on the repost entry, and the ones found since
+		# the last batch
+		self.affected_vouchers = set(repost_doc.get_affected_vouchers()) if repost_doc else set()
+		self.new_affected_vouchers = []
 		if not self.allow_negative_stock:
 			self.allow_negative_stock = cint(frappe.db.get_single_value("Stock Settings",
 				"allow_negative_stock"))
@@ -95,6 +118,8 @@ class update_entries_after(object):
 		self.previous_sle = self.get_sle_before_datetime()
 		self.previous_sle = self.previous_sle[0] if self.previous_sle else frappe._dict()
 
+		invalidate_closing_balances(self.item_code, self.warehouse, self.args.get("posting_date"))
+
 		for key in ("qty_after_transaction", "valuation_rate", "stock_value"):
 			setattr(self, key, flt(self.previous_sle.get(key)))
 
@@ -103,7 +128,7 @@ class update_entries_after(object):
 			currency=frappe.get_cached_value('Company',  self.company,  "default_currency"))
 
 		self.prev_stock_value = self.previous_sle.stock_value or 0.0
-		self.stock_queue = json.loads(self.previous_sle.stock_queue or "[]")
+		self.stock_queue = FIFOValuation(json.loads(self.previous_sle.stock_queue or "[]"))
 		self.valuation_method = get_valuation_method(self.item_code)
 		self.stock_value_difference = 0.0
 		self.build()
@@ -112,13 +137,28 @@ class update_entries_after(object):
 		# includes current entry!
 		entries_to_fix = self.get_sle_after_datetime()
 
+		current_voucher_processed = False
 		for sle in entries_to_fix:
+			if self.only_current_voucher:
+				# back-dated entry, future entries are reposted in background
+				if sle.voucher_no == self.args.get("voucher_no"):
+					current_voucher_processed = True
+				elif current_voucher_processed:
+					break
+
 			self.process_sle(sle)
 
+			if len(self.entries_to_update) >= self.batch_size:
+				self.update_stock_ledger_entries()
+
+		self.update_stock_ledger_entries()
+
 		if self.exceptions:
 			self.raise_exceptions()
 
-		self.update_bin()
+		if not self.only_current_voucher:
+			self.update_bin()
+			rebuild_invalidated_closing_balances(self.item_code, self.warehouse, self.args.get("posting_date"))
 
 	def update_bin(self):
 		# update bin
@@ -169,7 +209,7 @@ class update_entries_after(object):
 					self.qty_after_transaction = sle.qty_after_transaction
 
 				self.valuation_rate = sle.valuation_rate
-				self.stock_queue = [[self.qty_after_transaction, self.valuation_rate]]
+				self.stock_queue = FIFOValuation([[self.qty_after_transaction, self.valuation_rate]])
 				self.stock_value = flt(self.qty_after_transaction) * flt(self.valuation_rate)
 			else:
 				if self.valuation_method == "Moving Average":
@@ -179,23 +219,55 @@ class update_entries_after(object):
 				else:
 					self.get_fifo_values(sle)
 					self.qty_after_transaction += flt(sle.actual_qty)
-					self.stock_value = sum((flt(batch[0]) * flt(batch[1]) for batch in self.stock_queue))
+					self.stock_value = self.stock_queue.total_value
 
 		# rounding as per precision
 		self.stock_value = flt(self.stock_value, self.precision)
 
 		stock_value_difference = self.stock_value - self.prev_stock_value
 
+		if flt(sle.stock_value_difference, self.precision) != flt(stock_value_difference, self.precision):
+			# GL Entries of the voucher are to be reposted
+			voucher = (sle.voucher_type, sle.voucher_no)
+			if voucher not in self.affected_vouchers:
+				self.affected_vouchers.add(voucher)
+				self.new_affected_vouchers.append(voucher)
+
 		self.prev_stock_value = self.stock_value
 
 		# update current sle
 		sle.qty_after_transaction = self.qty_after_transaction
 		sle.valuation_rate = self.valuation_rate
 		sle.stock_value = self.stock_value
-		sle.stock_queue = json.dumps(self.stock_queue)
+		sle.stock_queue = json.dumps(self.stock_queue.get_state())
 		sle.stock_value_difference = stock_value_difference
-		sle.doctype="Stock Ledger Entry"
-		frappe.get_doc(sle).db_update()
+		self.entries_to_update.append(sle)
+
+	def update_stock_ledger_entries(self):
+		"""write the recomputed values of the processed entries in one update statement"""
+		if not self.entries_to_update:
+			return
+
+		fields = ("qty_after_transaction", "valuation_rate", "stock_value",
+			"stock_queue", "stock_value_difference")
+
+		set_values, values = [], []
+		for field in fields:
+			set_values.append("`{0}` = case name {1} end".format(field,
+				" ".join(["when %s then %s"] * len(self.entries_to_update))))
+			for sle in self.entries_to_update:
+				values.extend([sle.name, sle.get(field)])
+
+		names = [sle.name for sle in self.entries_to_update]
+		frappe.db.sql("""update `tabStock Ledger Entry` set {0} where name in ({1})""".format(
+			", ".join(set_values), ", ".join(["%s"] * len(names))), tuple(values + names))
+
+		if self.repost_doc:
+			self.repost_doc.update_progress(self.entries_to_update[-1], len(self.entries_to_update),
+				self.new_affected_vouchers)
+			self.new_affected_vouchers = []
+
+		self.entries_to_update = []
 
 	def validate_negative_stock(self, sle):
 		"""
@@ -242,9 +314,7 @@ class update_entries_after(object):
 		if not self.valuation_rate and sle.voucher_detail_no:
 			allow_zero_rate = self.check_if_allow_zero_valuation_rate(sle.voucher_type, sle.voucher_detail_no)
 			if not allow_zero_rate:
-				self.valuation_rate = get_valuation_rate(sle.item_code, sle.warehouse,
-					sle.voucher_type, sle.voucher_no, self.allow_zero_rate,
-					currency=erpnext.get_company_currency(sle.company))
+				self.valuation_rate = self.get_valuation_rate(sle)
 
 	def get_incoming_value_for_serial_nos(self, sle, serial_nos):
 		# get rate from serial nos within same company
@@ -310,9 +380,7 @@ class update_entries_after(object):
 			if not self.valuation_rate and sle.voucher_detail_no:
 				allow_zero_valuation_rate = self.check_if_allow_zero_valuation_rate(sle.voucher_type, sle.voucher_detail_no)
 				if not allow_zero_valuation_rate:
-					self.valuation_rate = get_valuation_rate(sle.item_code, sle.warehouse,
-						sle.voucher_type, sle.voucher_no, self.allow_zero_rate,
-						currency=erpnext.get_company_currency(sle.company))
+					self.valuation_rate = self.get_valuation_rate(sle)
 
 	def get_fifo_values(self, sle):
 		incoming_rate = flt(sle.incoming_rate)
@@ -320,70 +388,19 @@ class update_entries_after(object):
 		outgoing_rate = flt(sle.outgoing_rate)
 
 		if actual_qty > 0:
-			if not self.stock_queue:
-				self.stock_queue.append([0, 0])
-
-			# last row has the same rate, just updated the qty
-			if self.stock_queue[-1][1]==incoming_rate:
-				self.stock_queue[-1][0] += actual_qty
-			else:
-				if self.stock_queue[-1][0] > 0:
-					self.stock_queue.append([actual_qty, incoming_rate])
-				else:
-					qty = self.stock_queue[-1][0] + actual_qty
-					self.stock_queue[-1] = [qty, incoming_rate]
+			self.stock_queue.add_stock(actual_qty, incoming_rate)
 		else:
-			qty_to_pop = abs(actual_qty)
-			while qty_to_pop:
-				if not self.stock_queue:
-					# Get valuation rate from last sle if exists or from valuation rate field in item master
-					allow_zero_valuation_rate = self.check_if_allow_zero_valuation_rate(sle.voucher_type, sle.voucher_detail_no)
-					if not allow_zero_valuation_rate:
-						_rate = get_valuation_rate(sle.item_code, sle.warehouse,
-							sle.voucher_type, sle.voucher_no, self.allow_zero_rate,
-							currency=erpnext.get_company_currency(sle.company))
-					else:
-						_rate = 0
-
-					self.stock_queue.append([0, _rate])
-
-				index = None
-				if outgoing_rate > 0:
-					# Find the entry where rate matched with outgoing rate
-					for i, v in enumerate(self.stock_queue):
-						if v[1] == outgoing_rate:
-							index = i
-							break
-
-					# If no entry found with outgoing rate, collapse stack
-					if index == None:
-						new_stock_value = sum((d[0]*d[1] for d in self.stock_queue)) - qty_to_pop*outgoing_rate
-						new_stock_qty = sum((d[0] for d in self.stock_queue)) - qty_to_pop
-						self.stock_queue = [[new_stock_qty, new_stock_value/new_stock_qty if new_stock_qty > 0 else outgoing_rate]]
-						break
+			def rate_generator():
+				# Get valuation rate from last sle if exists or from valuation rate field in item master
+				allow_zero_valuation_rate = self.check_if_allow_zero_valuation_rate(sle.voucher_type, sle.voucher_detail_no)
+				if not allow_zero_valuation_rate:
+					return self.get_valuation_rate(sle)
 				else:
-					index = 0
-
-				# select first batch or the batch with same rate
-				batch = self.stock_queue[index]
-				if qty_to_pop >= batch[0]:
-					# consume current batch
-					qty_to_pop = _round_off_if_near_zero(qty_to_pop - batch[0])
-					self.stock_queue.pop(index)
-					if not self.stock_queue and qty_to_pop:
-						# stock finished, qty still remains to be withdrawn
-						# negative stock, keep in as a negative batch
-						self.stock_queue.append([-qty_to_pop, outgoing_rate or batch[1]])
-						break
+					return 0
 
-				else:
-					# qty found in current batch
-					# consume it and exit
-					batch[0] = batch[0] - qty_to_pop
-					qty_to_pop = 0
+			self.stock_queue.remove_stock(actual_qty, outgoing_rate, rate_generator)
 
-		stock_value = _round_off_if_near_zero(sum((flt(batch[0]) * flt(batch[1]) for batch in self.stock_queue)))
-		stock_qty = _round_off_if_near_zero(sum((flt(batch[0]) for batch in self.stock_queue)))
+		stock_qty, stock_value = self.stock_queue.get_total_stock_and_value()
 
 		if stock_qty:
 			self.valuation_rate = stock_value / flt(stock_qty)
@@ -391,6 +408,14 @@ class update_entries_after(object):
 		if not self.stock_queue:
 			self.stock_queue.append([0, sle.incoming_rate or sle.outgoing_rate or self.valuation_rate])
 
+	def get_valuation_rate(self, sle):
+		# rate is picked from the ledger, write the entries reposted so far
+		self.update_stock_ledger_entries()
+
+		return get_valuation_rate(sle.item_code, sle.warehouse,
+			sle.voucher_type, sle.voucher_no, self.allow_zero_rate,
+			currency=erpnext.get_company_currency(sle.company))
+
 	def check_if_allow_zero_valuation_rate(self, voucher_type, voucher_detail_no):
 		ref_item_dt = ""
 
@@ -435,6 +460,73 @@ class update_entries_after(object):
 		else:
 			raise NegativeStockError(msg)
 
+def future_sle_exists(args):
+	"""Returns True if the item has stock ledger entries in the warehouse
+	after the posting datetime of the given voucher, i.e. it is back-dated"""
+	return bool(frappe.db.sql("""
+		select name
+		from `tabStock Ledger Entry`
+		where
+			item_code = %(item_code)s
+			and warehouse = %(warehouse)s
+			and voucher_no != %(voucher_no)s
+			and ifnull(is_cancelled, 'No') = 'No'
+			and timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)
+		limit 1
+	""", args))
+
+def validate_future_negative_qty(args, actual_qty, allow_negative_stock=False):
+	"""Validate that a back-dated outgoing entry does not make the qty of a future entry negative.
+
+	The future entries are reposted in background, so the qty is checked against
+	the lowest `qty_after_transaction` until the next Stock Reconciliation"""
+	if flt(actual_qty) >= 0 or cint(allow_negative_stock) \
+		or cint(frappe.db.get_single_value("Stock Settings", "allow_negative_stock")):
+		return
+
+	next_reconciliation = frappe.db.sql("""
+		select timestamp(posting_date, posting_time)
+		from `tabStock Ledger Entry`
+		where
+			item_code = %(item_code)s
+			and warehouse = %(warehouse)s
+			and voucher_type = 'Stock Reconciliation'
+			and ifnull(batch_no, '') = ''
+			and ifnull(is_cancelled, 'No') = 'No'
+			and timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)
+		order by timestamp(posting_date, posting_time) asc
+		limit 1
+	""", args)
+
+	condition = ""
+	if next_reconciliation:
+		args["next_reconciliation"] = next_reconciliation[0][0]
+		condition = " and timestamp(posting_date, posting_time) < %(next_reconciliation)s"
+
+	future_sle = frappe.db.sql("""
+		select qty_after_transaction, posting_date, posting_time, voucher_type, voucher_no
+		from `tabStock Ledger Entry`
+		where
+			item_code = %(item_code)s
+			and warehouse = %(warehouse)s
+			and voucher_no != %(voucher_no)s
+			and ifnull(is_cancelled, 'No') = 'No'
+			and timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)
+			{0}
+		order by qty_after_transaction asc
+		limit 1
+	""".format(condition), args, as_dict=1)
+
+	if future_sle and flt(future_sle[0].qty_after_transaction) + flt(actual_qty) < -0.0001:
+		future_sle = future_sle[0]
+		deficiency = flt(future_sle.qty_after_transaction) + flt(actual_qty)
+		frappe.throw(_("{0} units of {1} needed in {2} on {3} {4} for {5} to complete this transaction.").format(
+			abs(deficiency), frappe.get_desk_link('Item', args.get("item_code")),
+			frappe.get_desk_link('Warehouse', args.get("warehouse")),
+			future_sle.posting_date, future_sle.posting_time,
+			frappe.get_desk_link(future_sle.voucher_type, future_sle.voucher_no)),
+			NegativeStockError, title=_('Insufficient Stock'))
+
 def get_previous_sle(args, for_update=False):
 	"""
 		get the last sle on or before the current time-bucket,
@@ -479,17 +571,39 @@ def get_stock_ledger_entries(previous_sle, operator=None,
 	if operator in (">", "<=") and previous_sle.get("name"):
 		conditions += " and name!=%(name)s"
 
-	return frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp" from `tabStock Ledger Entry`
+	query = """select *, timestamp(posting_date, posting_time) as "timestamp" from `tabStock Ledger Entry`
 		where item_code = %%(item_code)s
 		and ifnull(is_cancelled, 'No')='No'
 		%(conditions)s
 		order by timestamp(posting_date, posting_time) %(order)s, creation %(order)s
-		%(limit)s %(for_update)s""" % {
-			"conditions": conditions,
-			"limit": limit or "",
-			"for_update": for_update and "for update" or "",
-			"order": order
-		}, previous_sle, as_dict=1, debug=debug)
+		%(limit)s %(for_update)s"""
+
+	query_args = {
+		"conditions": conditions,
+		"limit": limit or "",
+		"for_update": for_update and "for update" or "",
+		"order": order
+	}
+
+	if operator in ("<", "<=") and order == "desc" and limit == "limit 1" and previous_sle.get("warehouse") \
+		and not (check_serial_no and previous_sle.get("serial_no")):
+		# last entry before a datetime, look only after the latest closing balance
+		closing_balance = get_closing_balance(previous_sle.get("item_code"), previous_sle.get("warehouse"),
+			previous_sle.get("posting_date"))
+
+		if closing_balance and closing_balance.stock_ledger_entry != previous_sle.get("name"):
+			sle = frappe.db.sql(query % dict(query_args, conditions=conditions + " and posting_date > %(closing_date)s"),
+				dict(previous_sle, closing_date=closing_balance.closing_date), as_dict=1, debug=debug)
+
+			if not sle:
+				sle = frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp"
+					from `tabStock Ledger Entry` where name = %s and ifnull(is_cancelled, 'No')='No' {0}""".format(
+						query_args["for_update"]), closing_balance.stock_ledger_entry, as_dict=1, debug=debug)
+
+			if sle:
+				return sle
+
+	return frappe.db.sql(query % query_args, previous_sle, as_dict=1, debug=debug)
 
 def get_valuation_rate(item_code, warehouse, voucher_type, voucher_no,
 	allow_zero_rate=False, currency=None, company=None, raise_error_if_no_rate=True):
@@ -549,12 +663,3 @@ def get_valuation_rate(item_code, warehouse, voucher_type, voucher_no,
 		frappe.throw(msg=msg, title=_("Valuation Rate Missing"))
 
 	return valuation_rate
-
-def _round_off_if_near_zero(number, precision = 7):
-	"""Rounds off the number to zero only if number is close to zero for decimal
-	specified in precision. Precision defaults to 7.
-	"""
-	if abs(0.0 - flt(number)) < (1.0 / (10**precision)):
-		return 0.0
-
-	return flt(number)
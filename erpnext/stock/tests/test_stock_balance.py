@@ -0,0 +1,37 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+import unittest
+from frappe.utils import flt
+from erpnext.stock.stock_balance import (repost_bin_qty, get_reserved_qty, get_indented_qty,
+	get_ordered_qty, get_planned_qty)
+from erpnext.buying.doctype.purchase_order.test_purchase_order import create_purchase_order
+
+class TestStockBalance(unittest.TestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_repost_bin_qty_matches_repost_stock(self):
+		item_code, warehouse = "_Test Item", "_Test Warehouse - _TC"
+		create_purchase_order(item_code=item_code, warehouse=warehouse, qty=7)
+		repost_bin_qty(item_code, warehouse)
+		self.assertEqual(repost_bin_qty(item_code, warehouse), [])
+
+		bin = frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+			["name", "ordered_qty", "projected_qty"], as_dict=1)
+		frappe.db.set_value("Bin", bin.name, {"ordered_qty": bin.ordered_qty + 3,
+			"projected_qty": bin.projected_qty + 3}, update_modified=False)
+
+		drifted_bins = repost_bin_qty(item_code, warehouse)
+		self.assertEqual(len(drifted_bins), 1)
+		self.assertEqual(drifted_bins[0].bin_ordered_qty, bin.ordered_qty + 3)
+
+		repaired_bin = frappe.db.get_value("Bin", bin.name, ["reserved_qty", "indented_qty",
+			"ordered_qty", "planned_qty", "projected_qty"], as_dict=1)
+		self.assertEqual(flt(repaired_bin.ordered_qty), flt(get_ordered_qty(item_code, warehouse)))
+		self.assertEqual(flt(repaired_bin.reserved_qty), flt(get_reserved_qty(item_code, warehouse)))
+		self.assertEqual(flt(repaired_bin.indented_qty), flt(get_indented_qty(item_code, warehouse)))
+		self.assertEqual(flt(repaired_bin.planned_qty), flt(get_planned_qty(item_code, warehouse)))
+		self.assertEqual(flt(repaired_bin.projected_qty), flt(bin.projected_qty))
@@ -0,0 +1,118 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import json
+import random
+import unittest
+from frappe.utils import flt
+from erpnext.stock.valuation import FIFOValuation, FIFOQueue, _round_off_if_near_zero
+
+class TestFIFOValuation(unittest.TestCase):
+	def test_random_transactions_match_list_implementation(self):
+		"""FIFOValuation gives the same queue and valuation as the list based
+		queue it replaced, for random sequences of transactions"""
+		rng = random.Random(42)
+		for _ in range(300):
+			reference_queue, fifo_queue = [], FIFOValuation([])
+			for transaction in get_random_transactions(rng):
+				reference_qty, reference_value = reference_fifo_values(reference_queue, *transaction)
+				update_fifo_values(fifo_queue, *transaction)
+				qty, value = fifo_queue.get_total_stock_and_value()
+
+				self.assertEqual(len(fifo_queue), len(reference_queue))
+				for batch, reference_batch in zip(fifo_queue, reference_queue):
+					self.assertAlmostEqual(batch[0], reference_batch[0], places=6)
+					self.assertAlmostEqual(batch[1], reference_batch[1], places=6)
+
+				self.assertAlmostEqual(qty, reference_qty, places=6)
+				self.assertAlmostEqual(value, reference_value, places=4)
+
+	def test_state_is_serializable(self):
+		fifo_queue = FIFOValuation([])
+		fifo_queue.add_stock(10, 100)
+		fifo_queue.add_stock(10, 200)
+		fifo_queue.remove_stock(15)
+
+		self.assertEqual(json.loads(json.dumps(fifo_queue.get_state())), [[5, 200]])
+		self.assertEqual(fifo_queue.get_total_stock_and_value(), (5, 1000))
+
+	def test_consume_returns_consumed_batches(self):
+		fifo_queue = FIFOQueue([[5, "2020-01-01"], [5, "2020-02-01"]])
+		consumed, pending_qty = fifo_queue.consume(12)
+
+		self.assertEqual(consumed, [[5, "2020-01-01"], [5, "2020-02-01"]])
+		self.assertEqual(pending_qty, 2)
+		self.assertEqual(len(fifo_queue), 0)
+
+def get_random_transactions(rng):
+	rates = [0, 10, 12.5, 99.99, 100]
+	for _ in range(rng.randint(1, 60)):
+		if rng.random() < 0.55:
+			yield (rng.choice([1, 2.5, 5, 10, 0.3]), rng.choice(rates), 0)
+		else:
+			outgoing_rate = rng.choice(rates) if rng.random() < 0.2 else 0
+			yield (-rng.choice([1, 2.5, 5, 10, 0.3, 17]), 0, outgoing_rate)
+
+def update_fifo_values(fifo_queue, actual_qty, incoming_rate, outgoing_rate):
+	if actual_qty > 0:
+		fifo_queue.add_stock(actual_qty, incoming_rate)
+	else:
+		fifo_queue.remove_stock(actual_qty, outgoing_rate, lambda: 50)
+
+	if not fifo_queue:
+		fifo_queue.append([0, incoming_rate or outgoing_rate])
+
+def reference_fifo_values(stock_queue, actual_qty, incoming_rate, outgoing_rate):
+	"""List based FIFO queue previously used in `update_entries_after.get_fifo_values`"""
+	if actual_qty > 0:
+		if not stock_queue:
+			stock_queue.append([0, 0])
+
+		if stock_queue[-1][1] == incoming_rate:
+			stock_queue[-1][0] += actual_qty
+		else:
+			if stock_queue[-1][0] > 0:
+				stock_queue.append([actual_qty, incoming_rate])
+			else:
+				qty = stock_queue[-1][0] + actual_qty
+				stock_queue[-1] = [qty, incoming_rate]
+	else:
+		qty_to_pop = abs(actual_qty)
+		while qty_to_pop:
+			if not stock_queue:
+				stock_queue.append([0, 50])
+
+			index = None
+			if outgoing_rate > 0:
+				for i, v in enumerate(stock_queue):
+					if v[1] == outgoing_rate:
+						index = i
+						break
+
+				if index == None:
+					new_stock_value = sum((d[0]*d[1] for d in stock_queue)) - qty_to_pop*outgoing_rate
+					new_stock_qty = sum((d[0] for d in stock_queue)) - qty_to_pop
+					stock_queue[:] = [[new_stock_qty, new_stock_value/new_stock_qty if new_stock_qty > 0 else outgoing_rate]]
+					break
+			else:
+				index = 0
+
+			batch = stock_queue[index]
+			if qty_to_pop >= batch[0]:
+				qty_to_pop = _round_off_if_near_zero(qty_to_pop - batch[0])
+				stock_queue.pop(index)
+				if not stock_queue and qty_to_pop:
+					stock_queue.append([-qty_to_pop, outgoing_rate or batch[1]])
+					break
+			else:
+				batch[0] = batch[0] - qty_to_pop
+				qty_to_pop = 0
+
+	stock_value = _round_off_if_near_zero(sum((flt(batch[0]) * flt(batch[1]) for batch in stock_queue)))
+	stock_qty = _round_off_if_near_zero(sum((flt(batch[0]) for batch in stock_queue)))
+
+	if not stock_queue:
+		stock_queue.append([0, incoming_rate or outgoing_rate])
+
+	return stock_qty, stock_value
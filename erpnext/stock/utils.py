@@ -5,12 +5,15 @@ from __future__ import unicode_literals
 import frappe, erpnext
 from frappe import _
 import json
-from frappe.utils import flt, cstr, nowdate, nowtime, get_link_to_form
+from frappe.utils import flt, cint, cstr, nowdate, nowtime, get_link_to_form
+from erpnext.stock.valuation import FIFOValuation
 
 from six import string_types
 
 class InvalidWarehouseCompany(frappe.ValidationError): pass
 
+SLE_CHUNK_SIZE = 5000
+
 def get_stock_value_from_bin(warehouse=None, item_code=None):
 	values = {}
 	conditions = ""
@@ -59,18 +62,36 @@ def get_stock_value_on(warehouse=None, posting_date=None, item_code=None):
 		values.append(item_code)
 		condition += " AND item_code = %s"
 
+	# start from the latest closing balance of each item and warehouse
+	# and look only at the entries after it
+	closing_balances = frappe.db.sql("""
+		SELECT item_code, warehouse, stock_value
+		FROM `tabStock Closing Balance` sle
+		WHERE closing_date <= %s {0}
+		ORDER BY closing_date DESC
+	""".format(condition), values, as_dict=1)
+
 	stock_ledger_entries = frappe.db.sql("""
 		SELECT item_code, stock_value, name, warehouse
 		FROM `tabStock Ledger Entry` sle
-		WHERE posting_date <= %s {0}
+		LEFT JOIN (
+			SELECT item_code as scb_item_code, warehouse as scb_warehouse, max(closing_date) as closing_date
+			FROM `tabStock Closing Balance`
+			WHERE closing_date <= %s
+			GROUP BY item_code, warehouse
+		) scb ON scb.scb_item_code = sle.item_code AND scb.scb_warehouse = sle.warehouse
+		WHERE posting_date <= %s AND posting_date > ifnull(scb.closing_date, '1900-01-01') {0}
 		ORDER BY timestamp(posting_date, posting_time) DESC, creation DESC
-	""".format(condition), values, as_dict=1)
+	""".format(condition), [posting_date] + values, as_dict=1)
 
 	sle_map = {}
 	for sle in stock_ledger_entries:
 		if not (sle.item_code, sle.warehouse) in sle_map:
 			sle_map[(sle.item_code, sle.warehouse)] = flt(sle.stock_value)
 
+	for d in closing_balances:
+		sle_map.setdefault((d.item_code, d.warehouse), flt(d.stock_value))
+
 	return sum(sle_map.values())
 
 @frappe.whitelist()
@@ -233,27 +254,14 @@ def get_valuation_method(item_code):
 
 def get_fifo_rate(previous_stock_queue, qty):
 	"""get FIFO (average) Rate from Queue"""
+	fifo_queue = FIFOValuation(previous_stock_queue)
 	if flt(qty) >= 0:
-		total = sum(f[0] for f in previous_stock_queue)
-		return sum(flt(f[0]) * flt(f[1]) for f in previous_stock_queue) / flt(total) if total else 0.0
+		total = fifo_queue.total_qty
+		return fifo_queue.total_value / flt(total) if total else 0.0
 	else:
-		available_qty_for_outgoing, outgoing_cost = 0, 0
-		qty_to_pop = abs(flt(qty))
-		while qty_to_pop and previous_stock_queue:
-			batch = previous_stock_queue[0]
-			if 0 < batch[0] <= qty_to_pop:
-				# if batch qty > 0
-				# not enough or exactly same qty in current batch, clear batch
-				available_qty_for_outgoing += flt(batch[0])
-				outgoing_cost += flt(batch[0]) * flt(batch[1])
-				qty_to_pop -= batch[0]
-				previous_stock_queue.pop(0)
-			else:
-				# all from current batch
-				available_qty_for_outgoing += flt(qty_to_pop)
-				outgoing_cost += flt(qty_to_pop) * flt(batch[1])
-				batch[0] -= qty_to_pop
-				qty_to_pop = 0
+		consumed_batches, pending_qty = fifo_queue.consume(qty)
+		available_qty_for_outgoing = sum(flt(batch[0]) for batch in consumed_batches)
+		outgoing_cost = sum(flt(batch[0]) * flt(batch[1]) for batch in consumed_batches)
 
 		return outgoing_cost / available_qty_for_outgoing
 
@@ -374,3 +382,55 @@ def add_additional_uom_columns(columns, result, include_uom, conversion_factors)
 				row[data.converted_col] = flt(value_before_conversion) / conversion_factor
 
 		result[row_idx] = row
+
+def iterate_stock_ledger_entries(fields, conditions, values, sort_fields,
+	tables="`tabStock Ledger Entry` sle", chunk_size=SLE_CHUNK_SIZE):
+	"""Yields the Stock Ledger Entries in the order of `sort_fields`, read in
+	keyset paginated chunks of `chunk_size` so that they are never loaded at
+	once. The sort fields must identify an entry, e.g. end with `sle.name`,
+	and should match an index of the Stock Ledger Entry so that every chunk
+	is an index range read"""
+	values = dict(values)
+	last_key = None
+
+	while True:
+		key_condition = ""
+		if last_key:
+			key_condition = "and " + get_keyset_condition(sort_fields)
+			for i, value in enumerate(last_key):
+				values["sort_key_{0}".format(i)] = value
+
+		entries = frappe.db.sql("""
+			select {fields}, {sort_keys}
+			from {tables}
+			where {conditions} {key_condition}
+			order by {order_by}
+			limit {limit}
+		""".format(
+			fields=fields, tables=tables, conditions=conditions, key_condition=key_condition,
+			sort_keys=", ".join(["{0} as sort_key_{1}".format(field, i) for i, field in enumerate(sort_fields)]),
+			order_by=", ".join(sort_fields), limit=cint(chunk_size)
+		), values, as_dict=1)
+
+		if entries:
+			last_key = [cstr(entries[-1]["sort_key_{0}".format(i)]) for i in range(len(sort_fields))]
+
+		for sle in entries:
+			for i in range(len(sort_fields)):
+				del sle["sort_key_{0}".format(i)]
+
+			yield sle
+
+		if len(entries) < chunk_size:
+			break
+
+def get_keyset_condition(sort_fields):
+	"""Condition for the rows after `%(sort_key_<i>)s` in the order of `sort_fields`,
+	written as `a >= x and (a > x or (a = x and (b > y or ...)))` which, unlike
+	a row constructor comparison, is read as a range of an index on the fields"""
+	condition = "{0} > %(sort_key_{1})s".format(sort_fields[-1], len(sort_fields) - 1)
+	for i in range(len(sort_fields) - 2, -1, -1):
+		condition = "{0} > %(sort_key_{1})s or ({0} = %(sort_key_{1})s and ({2}))".format(
+			sort_fields[i], i, condition)
+
+	return "{0} >= %(sort_key_0)s and ({1})".format(sort_fields[0], condition)
@@ -0,0 +1,186 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+from collections import deque
+from frappe.utils import flt
+
+class FIFOQueue(object):
+	"""Queue of `[qty, value]` batches consumed from the head.
+
+	Batches are kept in a deque, so consuming the oldest batch is O(1)
+	instead of the O(n) `list.pop(0)`."""
+
+	def __init__(self, state=None):
+		self.queue = deque(state or [])
+
+	def __len__(self):
+		return len(self.queue)
+
+	def __iter__(self):
+		return iter(self.queue)
+
+	def get_state(self):
+		"""Returns the queue as a list of batches, as stored in `stock_queue`"""
+		return list(self.queue)
+
+	def append(self, batch):
+		self.queue.append(batch)
+
+	def remove_batches(self, condition):
+		"""Remove the batches for which `condition(batch)` is True"""
+		self.queue = deque(batch for batch in self.queue if not condition(batch))
+
+	def consume(self, qty):
+		"""Remove `qty` from the oldest batches onwards.
+
+		Returns the consumed `[qty, value]` batches and the qty that could
+		not be consumed because the queue ran out."""
+		consumed = []
+		qty_to_pop = abs(flt(qty))
+
+		while qty_to_pop and self.queue:
+			batch = self.queue[0]
+			if 0 < flt(batch[0]) <= qty_to_pop:
+				# not enough or exactly same qty in current batch, clear batch
+				qty_to_pop -= flt(batch[0])
+				consumed.append(self.queue.popleft())
+			else:
+				# all from current batch
+				batch[0] = flt(batch[0]) - qty_to_pop
+				consumed.append([qty_to_pop, batch[1]])
+				qty_to_pop = 0
+
+		self.after_consume(consumed)
+
+		return consumed, qty_to_pop
+
+	def after_consume(self, consumed):
+		pass
+
+class FIFOValuation(FIFOQueue):
+	"""FIFO queue of `[qty, rate]` batches with running totals of qty and value,
+	so that the stock qty and value are not summed over the whole queue
+	after every transaction."""
+
+	def __init__(self, state=None):
+		super(FIFOValuation, self).__init__(state)
+		self.refresh_totals()
+
+	def refresh_totals(self):
+		self.total_qty = sum(flt(batch[0]) for batch in self.queue)
+		self.total_value = sum(flt(batch[0]) * flt(batch[1]) for batch in self.queue)
+
+	def get_total_stock_and_value(self):
+		return _round_off_if_near_zero(self.total_qty), _round_off_if_near_zero(self.total_value)
+
+	def append(self, batch):
+		self.queue.append(batch)
+		self.total_qty += flt(batch[0])
+		self.total_value += flt(batch[0]) * flt(batch[1])
+
+	def remove_batches(self, condition):
+		super(FIFOValuation, self).remove_batches(condition)
+		self.refresh_totals()
+
+	def after_consume(self, consumed):
+		for qty, rate in consumed:
+			self.total_qty -= flt(qty)
+			self.total_value -= flt(qty) * flt(rate)
+
+	def add_stock(self, qty, rate):
+		"""Add an incoming batch, merged into the last batch if the rate is the same"""
+		if not self.queue:
+			self.append([0, 0])
+
+		last_batch = self.queue[-1]
+		if last_batch[1] == rate:
+			# last row has the same rate, just updated the qty
+			last_batch[0] += qty
+			self.total_qty += flt(qty)
+			self.total_value += flt(qty) * flt(rate)
+		elif last_batch[0] > 0:
+			self.append([qty, rate])
+		else:
+			self.total_qty -= flt(last_batch[0])
+			self.total_value -= flt(last_batch[0]) * flt(last_batch[1])
+			self.queue[-1] = [last_batch[0] + qty, rate]
+			self.total_qty += flt(self.queue[-1][0])
+			self.total_value += flt(self.queue[-1][0]) * flt(rate)
+
+	def remove_stock(self, qty, outgoing_rate=0.0, rate_generator=None):
+		"""Remove `qty` for an outgoing transaction.
+
+		If `outgoing_rate` is set, the batch with the same rate is consumed,
+		else the oldest batches. If stock runs out, the remaining qty is kept
+		as a negative batch. `rate_generator` returns the rate of a zero qty
+		batch added when the queue is empty."""
+		qty_to_pop = abs(flt(qty))
+		outgoing_rate = flt(outgoing_rate)
+
+		while qty_to_pop:
+			if not self.queue:
+				self.append([0, rate_generator() if rate_generator else 0.0])
+
+			index = None
+			if outgoing_rate > 0:
+				# Find the entry where rate matched with outgoing rate
+				for i, batch in enumerate(self.queue):
+					if batch[1] == outgoing_rate:
+						index = i
+						break
+
+				# If no entry found with outgoing rate, collapse stack
+				if index is None:
+					# the queue was scanned anyway, sum it to avoid carrying float error into the rate
+					self.refresh_totals()
+					new_stock_value = self.total_value - qty_to_pop * outgoing_rate
+					new_stock_qty = self.total_qty - qty_to_pop
+					self.queue = deque([[new_stock_qty,
+						new_stock_value / new_stock_qty if new_stock_qty > 0 else outgoing_rate]])
+					self.refresh_totals()
+					break
+			else:
+				index = 0
+
+			# select first batch or the batch with same rate
+			batch = self.queue[index]
+			if qty_to_pop >= batch[0]:
+				# consume current batch
+				qty_to_pop = _round_off_if_near_zero(qty_to_pop - batch[0])
+				self.remove_batch(index)
+				if not self.queue and qty_to_pop:
+					# stock finished, qty still remains to be withdrawn
+					# negative stock, keep in as a negative batch
+					self.append([-qty_to_pop, outgoing_rate or batch[1]])
+					break
+			else:
+				# qty found in current batch
+				# consume it and exit
+				batch[0] = batch[0] - qty_to_pop
+				self.total_qty -= qty_to_pop
+				self.total_value -= qty_to_pop * flt(batch[1])
+				qty_to_pop = 0
+
+		if not self.queue:
+			# totals of an empty queue are zero, clear the accumulated float error
+			self.refresh_totals()
+
+	def remove_batch(self, index):
+		if index == 0:
+			batch = self.queue.popleft()
+		else:
+			batch = self.queue[index]
+			del self.queue[index]
+
+		self.total_qty -= flt(batch[0])
+		self.total_value -= flt(batch[0]) * flt(batch[1])
+
+def _round_off_if_near_zero(number, precision=7):
+	"""Rounds off the number to zero only if number is close to zero for decimal
+	specified in precision. Precision defaults to 7.
+	"""
+	if abs(0.0 - flt(number)) < (1.0 / (10**precision)):
+		return 0.0
+
+	return flt(number)
@@ -0,0 +1,85 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Compare and benchmark the financial statements read from the GL Entries
+row by row, as before balances were kept, with the statements read from the
+Account Period Balances row by row and summed per period in the query
+
+	bench --site [site] execute erpnext.tests.benchmarks.financial_statements.run --kwargs "{'from_fiscal_year': '2016-2017', 'to_fiscal_year': '2020-2021'}"
+
+Builds the Balance Sheet and Profit and Loss data of the company in the three
+modes, prints the time taken by each and the rows that differ from the GL
+Entry rows, if any.
+'''
+
+from __future__ import unicode_literals, print_function
+import time
+from contextlib import contextmanager
+import frappe, erpnext
+import erpnext.accounts.report.financial_statements as financial_statements
+from erpnext.accounts.report.financial_statements import get_period_list, get_data
+
+STATEMENTS = (
+	# root type, balance must be, get_data arguments
+	("Asset", "Debit", {"only_current_fiscal_year": False}),
+	("Liability", "Credit", {"only_current_fiscal_year": False}),
+	("Equity", "Credit", {"only_current_fiscal_year": False}),
+	("Income", "Credit", {"ignore_closing_entries": True, "ignore_accumulated_values_for_fy": True}),
+	("Expense", "Debit", {"ignore_closing_entries": True, "ignore_accumulated_values_for_fy": True})
+)
+
+# label, read from the GL Entries only, group by period
+MODES = (
+	("GL Entries by row", True, False),
+	("balances by row", False, False),
+	("balances grouped by period", False, True)
+)
+
+def run(from_fiscal_year, to_fiscal_year, company=None, periodicity="Monthly", accumulated_values=0):
+	company = company or erpnext.get_default_company()
+	period_list = get_period_list(from_fiscal_year, to_fiscal_year, periodicity,
+		accumulated_values=accumulated_values, company=company)
+
+	mismatches = 0
+	for root_type, balance_must_be, kwargs in STATEMENTS:
+		data, timings = [], []
+		for label, gl_entries_only, group_by_period in MODES:
+			filters = frappe._dict(company=company, accumulated_values=accumulated_values)
+
+			start = time.time()
+			with read_gl_entries_only(gl_entries_only):
+				data.append(get_data(company, root_type, balance_must_be, period_list, filters=filters,
+					accumulated_values=accumulated_values, group_by_period=group_by_period, **kwargs) or [])
+			timings.append(time.time() - start)
+
+		print("{0}: {1} rows, {2}".format(root_type, len(data[0]), ", ".join(["{0} in {1:.2f}s".format(mode[0], timing)
+			for mode, timing in zip(MODES, timings)])))
+
+		for mode, mode_data in zip(MODES[1:], data[1:]):
+			for row, mode_row in zip(data[0], mode_data):
+				if row != mode_row:
+					mismatches += 1
+					print("  mismatch in {0}: {1}\n            {2}".format(mode[0], row, mode_row))
+
+			if len(data[0]) != len(mode_data):
+				mismatches += 1
+				print("  mismatch in {0}: {1} rows and {2} rows".format(mode[0], len(data[0]), len(mode_data)))
+
+	print("identical output" if not mismatches else "{0} mismatches".format(mismatches))
+	return mismatches
+
+@contextmanager
+def read_gl_entries_only(enabled):
+	"""Make `get_data` read the GL Entries, as before the Account Period and
+	Closing Balances were kept"""
+	if not enabled:
+		yield
+		return
+
+	methods = (financial_statements.get_gl_entry_table, financial_statements.get_closing_before_periods)
+	financial_statements.get_gl_entry_table = lambda *args, **kwargs: "GL Entry"
+	financial_statements.get_closing_before_periods = lambda *args, **kwargs: None
+	try:
+		yield
+	finally:
+		financial_statements.get_gl_entry_table, financial_statements.get_closing_before_periods = methods
@@ -0,0 +1,80 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Benchmark merging of similar GL Entries of large vouchers
+
+	bench --site [site] execute erpnext.tests.benchmarks.merge_gl_entries.run --kwargs "{'rows': [1000, 10000], 'heads': 2000}"
+
+Builds gl_maps with the given number of rows spread over `heads` distinct
+accounts, cost centers and parties, merges each by scanning the merged list
+(as `check_if_in_list` does) and by the merge key, prints the time taken by
+each and whether the merged entries match. Nothing is written to the database.
+'''
+
+from __future__ import unicode_literals, print_function
+import time
+import frappe, erpnext
+from frappe.utils import flt, cint
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions
+from erpnext.accounts.general_ledger import merge_similar_entries, check_if_in_list
+
+def run(rows=(1000, 10000), heads=2000, company=None):
+	company = company or erpnext.get_default_company()
+
+	mismatches = 0
+	for count in rows:
+		gl_map = get_gl_map(company, cint(count), cint(heads))
+
+		start = time.time()
+		scanned = merge_by_scan([frappe._dict(d) for d in gl_map])
+		scan_time = time.time() - start
+
+		start = time.time()
+		merged = merge_similar_entries([frappe._dict(d) for d in gl_map])
+		merge_time = time.time() - start
+
+		print("{0} rows into {1} entries: scan in {2:.2f}s, by key in {3:.2f}s".format(count,
+			len(merged), scan_time, merge_time))
+
+		if get_amounts(scanned) != get_amounts(merged):
+			mismatches += 1
+			print("  mismatch in the merged entries")
+
+	print("identical output" if not mismatches else "{0} mismatches".format(mismatches))
+	return mismatches
+
+def get_gl_map(company, count, heads):
+	gl_map = []
+	for i in range(count):
+		head = i % heads
+		gl_map.append({
+			"company": company,
+			"account": "_Benchmark Expense {0}".format(head % 50),
+			"cost_center": "_Benchmark Cost Center {0}".format(head % 7),
+			"party_type": "Supplier" if head % 3 == 0 else None,
+			"party": "_Benchmark Supplier {0}".format(head) if head % 3 == 0 else None,
+			"project": "_Benchmark Project {0}".format(head % 11) if head % 2 else None,
+			"debit": flt((i % 97) + 1),
+			"debit_in_account_currency": flt((i % 97) + 1),
+			"credit": 0.0,
+			"credit_in_account_currency": 0.0
+		})
+
+	return gl_map
+
+def merge_by_scan(gl_map):
+	merged_gl_map = []
+	accounting_dimensions = get_accounting_dimensions()
+	for entry in gl_map:
+		same_head = check_if_in_list(entry, merged_gl_map, accounting_dimensions)
+		if same_head:
+			for fieldname in ("debit", "debit_in_account_currency", "credit", "credit_in_account_currency"):
+				same_head[fieldname] = flt(same_head.get(fieldname)) + flt(entry.get(fieldname))
+		else:
+			merged_gl_map.append(entry)
+
+	return merged_gl_map
+
+def get_amounts(gl_map):
+	return [(d.account, d.cost_center, d.party, d.project, flt(d.debit, 2), flt(d.credit, 2))
+		for d in gl_map]
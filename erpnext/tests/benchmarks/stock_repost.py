@@ -0,0 +1,108 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Benchmark reposting of the stock ledger of a single item
+
+	bench --site [site] execute erpnext.tests.benchmarks.stock_repost.run --kwargs "{'entries': 100000}"
+
+Inserts a synthetic ledger for a new item, reposts it from its first entry
+once writing every entry with `Document.db_update` as before batching, and
+once with batched updates, prints rows/sec for both and rolls everything back.
+The rebuild of the Stock Closing Balances is kept out of both runs and timed
+on its own.
+'''
+
+from __future__ import unicode_literals, print_function
+import time
+from contextlib import contextmanager
+import frappe, erpnext
+from frappe.utils import add_days, now, cint
+from erpnext.stock import stock_ledger
+from erpnext.stock.stock_ledger import update_entries_after, REPOST_BATCH_SIZE
+from erpnext.stock.doctype.stock_closing_balance.stock_closing_balance import rebuild_invalidated_closing_balances
+
+def run(entries=100000, batch_size=REPOST_BATCH_SIZE):
+	entries = cint(entries)
+
+	try:
+		item_code, warehouse = make_ledger(entries)
+		posting_date = frappe.db.sql("""select min(posting_date) from `tabStock Ledger Entry`
+			where item_code=%s and warehouse=%s""", (item_code, warehouse))[0][0]
+
+		for label, repost, size in (("db_update per entry", update_entries_after_per_entry, 1),
+			("batch of {0}".format(batch_size), update_entries_after, batch_size)):
+			with skip_closing_balance_rebuild():
+				start = time.time()
+				repost({
+					"item_code": item_code,
+					"warehouse": warehouse,
+					"posting_date": posting_date,
+					"posting_time": "00:00"
+				}, allow_negative_stock=True, batch_size=size)
+				elapsed = time.time() - start
+
+			print("{0}: {1} entries in {2:.2f}s, {3:.0f} rows/sec".format(label, entries, elapsed,
+				entries / elapsed))
+
+		start = time.time()
+		rebuild_invalidated_closing_balances(item_code, warehouse, posting_date)
+		print("closing balance rebuild from {0}: {1:.2f}s".format(posting_date, time.time() - start))
+	finally:
+		frappe.db.rollback()
+
+@contextmanager
+def skip_closing_balance_rebuild():
+	"""Keep `update_entries_after` from rebuilding the Stock Closing Balances,
+	so that the runs time the reposting of the entries only"""
+	rebuild = stock_ledger.rebuild_invalidated_closing_balances
+	stock_ledger.rebuild_invalidated_closing_balances = lambda *args, **kwargs: None
+	try:
+		yield
+	finally:
+		stock_ledger.rebuild_invalidated_closing_balances = rebuild
+
+class update_entries_after_per_entry(update_entries_after):
+	"""Writes every reposted entry with `Document.db_update`, the baseline"""
+	def update_stock_ledger_entries(self):
+		for sle in self.entries_to_update:
+			sle.doctype = "Stock Ledger Entry"
+			frappe.get_doc(sle).db_update()
+
+		self.entries_to_update = []
+
+def make_ledger(entries):
+	company = erpnext.get_default_company()
+	warehouse = frappe.db.get_value("Warehouse", {"company": company, "is_group": 0})
+	item_code = "_Benchmark Repost Item"
+
+	if not frappe.db.exists("Item", item_code):
+		frappe.get_doc({
+			"doctype": "Item",
+			"item_code": item_code,
+			"item_group": frappe.db.get_value("Item Group", {"is_group": 0}),
+			"stock_uom": frappe.db.get_value("UOM", {}),
+			"is_stock_item": 1,
+			"valuation_method": "FIFO"
+		}).insert(ignore_permissions=True)
+
+	timestamp, posting_date = now(), "2000-01-01"
+	rows = []
+	for i in range(entries):
+		# a receipt followed by a smaller issue, at a new rate every receipt
+		receipt = not i % 2
+		if receipt:
+			posting_date = add_days(posting_date, 1)
+
+		rows.append((frappe.generate_hash(length=10), item_code, warehouse, company, posting_date,
+			"10:00:00" if receipt else "11:00:00", 5 if receipt else -3, (i % 50) + 100 if receipt else 0,
+			"Stock Entry", "BENCHMARK", "No", 1, timestamp, timestamp))
+
+		if len(rows) == 10000 or i == entries - 1:
+			frappe.db.sql("""insert into `tabStock Ledger Entry`
+				(name, item_code, warehouse, company, posting_date, posting_time, actual_qty,
+				incoming_rate, voucher_type, voucher_no, is_cancelled, docstatus, creation, modified)
+				values {0}""".format(", ".join(["(%s)" % ", ".join(["%s"] * len(rows[0]))] * len(rows))),
+				tuple(value for row in rows for value in row))
+			rows = []
+
+	return item_code, warehouse
@@ -0,0 +1,85 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Benchmark calculation of taxes and totals of large documents
+
+	bench --site [site] execute erpnext.tests.benchmarks.taxes_and_totals.run --kwargs "{'lines': [100, 1000, 5000]}"
+
+Builds unsaved Quotations with the given number of item lines and a mix of
+tax rows of every charge type, prints the time taken by
+`calculate_taxes_and_totals` for each and rolls everything back.
+'''
+
+from __future__ import unicode_literals, print_function
+import time, json
+import frappe, erpnext
+from frappe.utils import cint
+from erpnext.controllers.taxes_and_totals import calculate_taxes_and_totals
+
+TAXES = [
+	("On Net Total", 9, None, None),
+	("On Net Total", 9, None, None),
+	("On Previous Row Amount", 10, 1, None),
+	("On Previous Row Total", 2, 3, None),
+	("Actual", None, None, 150),
+	("On Item Quantity", 1.5, None, None),
+	("On Net Total", 0.5, None, None),
+	("On Previous Row Total", 1, 6, None),
+	("Actual", None, None, 33.33),
+	("On Net Total", 4, None, None)
+]
+
+def run(lines=(100, 1000, 5000), repeat=3):
+	if not isinstance(lines, (list, tuple)):
+		lines = [lines]
+
+	try:
+		for count in lines:
+			doc = make_quotation(cint(count))
+
+			timings = []
+			for i in range(cint(repeat)):
+				start = time.time()
+				calculate_taxes_and_totals(doc)
+				timings.append(time.time() - start)
+
+			print("{0} lines, {1} taxes: best of {2} in {3:.3f}s, grand total {4}".format(count,
+				len(doc.taxes), len(timings), min(timings), doc.grand_total))
+	finally:
+		frappe.db.rollback()
+
+def make_quotation(lines):
+	company = erpnext.get_default_company()
+	currency = erpnext.get_company_currency(company)
+
+	doc = frappe.get_doc({
+		"doctype": "Quotation",
+		"company": company,
+		"currency": currency,
+		"conversion_rate": 1,
+		"price_list_currency": currency,
+		"plc_conversion_rate": 1
+	})
+
+	for i in range(lines):
+		doc.append("items", {
+			"item_name": "_Benchmark Item {0}".format(i),
+			"qty": (i % 7) + 1,
+			"rate": (i % 50) + 100.25,
+			"uom": "Nos",
+			"conversion_factor": 1,
+			# every third line has its own rate for the first tax
+			"item_tax_rate": json.dumps({"_Benchmark Tax 1": 5}) if not i % 3 else None
+		})
+
+	for i, (charge_type, rate, row_id, tax_amount) in enumerate(TAXES):
+		doc.append("taxes", {
+			"charge_type": charge_type,
+			"account_head": "_Benchmark Tax {0}".format(i + 1),
+			"description": "_Benchmark Tax {0}".format(i + 1),
+			"rate": rate,
+			"row_id": row_id,
+			"tax_amount": tax_amount
+		})
+
+	return doc